@@ -0,0 +1,162 @@
+"""
+Compare the generation throughput of HuggingfaceContinuousBatchingEngine with the static batches of generate(), used
+by HuggingfaceLanguageModel by default. The requests have different output lengths, like the answers of the agents.
+
+Usage:
+    export PYTHONPATH=./
+    python benchmarks/continuous_batching_benchmark.py --request_count 64 --max_batch_size 8
+"""
+
+import argparse
+import random
+import time
+from typing import Any
+
+import torch
+from transformers import (  # type: ignore[import-untyped]
+    AutoModelForCausalLM,
+    LlamaConfig,
+    LlamaForCausalLM,
+    PreTrainedModel,
+)
+
+from src.language_models.instance.huggingface_continuous_batching_engine import (
+    HuggingfaceContinuousBatchingEngine,
+)
+
+
+class BenchmarkRequest:
+    def __init__(self, input_ids: torch.Tensor, max_new_tokens: int):
+        self.input_ids = input_ids
+        self.max_new_tokens = max_new_tokens
+
+
+def build_model(args: argparse.Namespace) -> PreTrainedModel:
+    if args.model_name_or_path is not None:
+        model = AutoModelForCausalLM.from_pretrained(
+            args.model_name_or_path, device_map=args.device, torch_dtype="auto"
+        )
+    else:
+        # A randomly initialized Llama, so that no file is downloaded.
+        torch.manual_seed(0)
+        model = LlamaForCausalLM(
+            LlamaConfig(
+                vocab_size=1024,
+                hidden_size=args.hidden_size,
+                intermediate_size=args.hidden_size * 2,
+                num_hidden_layers=args.layer_count,
+                num_attention_heads=8,
+                max_position_embeddings=4096,
+            )
+        ).to(args.device)
+    model.eval()
+    return model
+
+
+def build_request_list(
+    args: argparse.Namespace, vocab_size: int
+) -> list[BenchmarkRequest]:
+    random_generator = random.Random(0)
+    return [
+        BenchmarkRequest(
+            torch.tensor(
+                [
+                    random_generator.randrange(vocab_size)
+                    for _ in range(random_generator.randint(*args.prompt_length_range))
+                ]
+            ),
+            random_generator.randint(*args.max_new_tokens_range),
+        )
+        for _ in range(args.request_count)
+    ]
+
+
+def run_static_batching(
+    model: PreTrainedModel, request_list: list[BenchmarkRequest], max_batch_size: int
+) -> None:
+    # The same as HuggingfaceLanguageModel._inference(): the batch is left-padded, and it runs until its longest
+    # output is finished.
+    for start_index in range(0, len(request_list), max_batch_size):
+        batch_request_list = request_list[start_index : start_index + max_batch_size]
+        length = max(request.input_ids.shape[0] for request in batch_request_list)
+        batch_input_ids = torch.zeros(
+            (len(batch_request_list), length), dtype=torch.long
+        )
+        batch_attention_mask = torch.zeros_like(batch_input_ids)
+        for index, request in enumerate(batch_request_list):
+            batch_input_ids[index, length - request.input_ids.shape[0] :] = (
+                request.input_ids
+            )
+            batch_attention_mask[index, length - request.input_ids.shape[0] :] = 1
+        with torch.no_grad():
+            model.generate(
+                batch_input_ids.to(model.device),
+                attention_mask=batch_attention_mask.to(model.device),
+                max_new_tokens=max(
+                    request.max_new_tokens for request in batch_request_list
+                ),
+                do_sample=False,
+                eos_token_id=None,
+                pad_token_id=0,
+            )
+
+
+def run_continuous_batching(
+    engine: HuggingfaceContinuousBatchingEngine, request_list: list[BenchmarkRequest]
+) -> None:
+    future_list = [
+        engine.submit(
+            [request.input_ids],
+            {
+                "max_new_tokens": request.max_new_tokens,
+                "do_sample": False,
+                "eos_token_id": None,
+            },
+        )[0]
+        for request in request_list
+    ]
+    for future in future_list:
+        future.result()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name_or_path", type=str, default=None)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--hidden_size", type=int, default=256)
+    parser.add_argument("--layer_count", type=int, default=4)
+    parser.add_argument("--request_count", type=int, default=64)
+    parser.add_argument("--max_batch_size", type=int, default=8)
+    parser.add_argument("--prompt_length_range", type=int, nargs=2, default=[32, 256])
+    parser.add_argument("--max_new_tokens_range", type=int, nargs=2, default=[8, 128])
+    args = parser.parse_args()
+    model = build_model(args)
+    request_list = build_request_list(args, model.config.vocab_size)
+    # Only the requested tokens are useful, the tokens generated after them (as padding) are not counted.
+    useful_token_count = sum(request.max_new_tokens for request in request_list)
+    # Warm up.
+    run_static_batching(model, request_list[:1], args.max_batch_size)
+    result: dict[str, Any] = {}
+    start_time = time.monotonic()
+    run_static_batching(model, request_list, args.max_batch_size)
+    static_time = time.monotonic() - start_time
+    result["static_tokens_per_second"] = useful_token_count / static_time
+    result["static_requests_per_second"] = len(request_list) / static_time
+    engine = HuggingfaceContinuousBatchingEngine(model, args.max_batch_size)
+    start_time = time.monotonic()
+    run_continuous_batching(engine, request_list)
+    continuous_time = time.monotonic() - start_time
+    result["continuous_tokens_per_second"] = useful_token_count / continuous_time
+    result["continuous_requests_per_second"] = len(request_list) / continuous_time
+    result["continuous_decode_step_count"] = engine.decode_step_count
+    result["speedup"] = static_time / continuous_time
+    print(
+        " ".join(
+            f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+            for key, value in result.items()
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
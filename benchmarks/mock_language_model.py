@@ -0,0 +1,30 @@
+from typing import Any, Mapping, Sequence
+
+from src.language_models import LanguageModel
+from src.typings import ChatHistory, ChatHistoryItem, Role
+
+
+class MockLanguageModel(LanguageModel):
+    """
+    A language model with zero latency. It builds the message list in the same way as the real language models, so the
+    cost of converting the chat history is still measured, and then returns a fixed response.
+    """
+
+    def __init__(self, role_dict: Mapping[str, str], response_size: int):
+        super().__init__(role_dict)
+        self.response = "r" * response_size
+
+    def _inference(
+        self,
+        batch_chat_history: Sequence[ChatHistory],
+        inference_config_dict: Mapping[str, Any],
+        system_prompt: str,
+    ) -> Sequence[ChatHistoryItem]:
+        chat_history_item_list: list[ChatHistoryItem] = []
+        for chat_history in batch_chat_history:
+            _ = [{"role": "system", "content": system_prompt}]
+            _ += self._convert_chat_history_to_message_list(chat_history)
+            chat_history_item_list.append(
+                ChatHistoryItem(role=Role.AGENT, content=self.response)
+            )
+        return chat_history_item_list
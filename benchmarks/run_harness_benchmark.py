@@ -0,0 +1,218 @@
+"""
+Measure the overhead of the framework by running the full run_experiment loop with SyntheticTask and
+MockLanguageModel, whose latency is (almost) zero. Every sample count is run in its own process, so that the peak RSS
+of different runs does not affect each other.
+
+Usage:
+    export PYTHONPATH=./
+    python benchmarks/run_harness_benchmark.py --sample_count_list 100 1000 10000
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from typing import Any
+
+import psutil
+
+from src.run_experiment import run_assignment
+
+
+def build_raw_config(
+    output_dir: str, sample_count: int, args: argparse.Namespace
+) -> dict[str, Any]:
+    chat_history_item_dict_path = os.path.join(output_dir, "chat_history_item.json")
+    callback_dict: dict[str, Any] = {}
+    if args.callback_flag:
+        callback_dict = {
+            "callback_0": {"name": "current_session_saving_callback"},
+            "callback_1": {
+                "name": "consecutive_abnormal_agent_inference_process_handling_callback"
+            },
+        }
+    return {
+        "assignment_config": {
+            "language_model_list": [{"name": "mock_language_model"}],
+            "agent": {"name": "language_model_agent"},
+            "task": "synthetic_task",
+            "output_dir": output_dir,
+            "sample_order": "default",
+            "callback_dict": callback_dict,
+            "concurrent_session_count": args.concurrent_session_count,
+        },
+        "task_dict": {
+            "synthetic_task": {
+                "module": "benchmarks.synthetic_task.SyntheticTask",
+                "parameters": {
+                    "task_name": "db_bench",
+                    "chat_history_item_factory": {
+                        "module": "src.factories.chat_history_item.ChatHistoryItemFactory",
+                        "parameters": {
+                            "chat_history_item_dict_path": chat_history_item_dict_path
+                        },
+                    },
+                    "max_round": args.round_count,
+                    "sample_count": sample_count,
+                    "round_count": args.round_count,
+                    "observation_size": args.observation_size,
+                },
+            }
+        },
+        "agent_dict": {
+            "language_model_agent": {
+                "module": "src.agents.instance.language_model_agent.LanguageModelAgent",
+                "parameters": {
+                    "language_model": "mock_language_model",
+                    "system_prompt": "You are a helpful assistant.",
+                    "inference_config_dict": {},
+                },
+            }
+        },
+        "language_model_dict": {
+            "mock_language_model": {
+                "module": "benchmarks.mock_language_model.MockLanguageModel",
+                "parameters": {
+                    "role_dict": {"user": "user", "agent": "assistant"},
+                    "response_size": args.response_size,
+                },
+            }
+        },
+        "callback_dict": {
+            "current_session_saving_callback": {
+                "module": "src.callbacks.instance.current_session_saving_callback.CurrentSessionSavingCallback",
+                "parameters": {"saving_path": "Set by CallbackConstructor."},
+            },
+            "consecutive_abnormal_agent_inference_process_handling_callback": {
+                "module": (
+                    "src.callbacks.instance.consecutive_abnormal_agent_inference_process_handling_callback."
+                    "ConsecutiveAbnormalAgentInferenceProcessHandlingCallback"
+                ),
+                "parameters": {"tolerance_count": 8},
+            },
+        },
+        "environment_config": {"use_task_client_flag": False},
+        "logger_config": {
+            "level": args.logger_level,
+            "log_file_path": "default",
+            "logger_name": "harness_benchmark",
+        },
+    }
+
+
+def get_dir_size(dir_path: str) -> int:
+    dir_size = 0
+    for root, _, file_name_list in os.walk(dir_path):
+        for file_name in file_name_list:
+            dir_size += os.path.getsize(os.path.join(root, file_name))
+    return dir_size
+
+
+def run_single_benchmark(
+    output_dir: str,
+    sample_count: int,
+    args: argparse.Namespace,
+    result_queue: "multiprocessing.Queue[dict[str, Any]]",
+) -> None:
+    os.makedirs(output_dir)
+    json.dump(
+        {
+            "value": {
+                "0": {"role": "user", "content": "You are in a synthetic task."},
+                "1": {"role": "agent", "content": "OK."},
+            }
+        },
+        open(os.path.join(output_dir, "chat_history_item.json"), "w"),  # noqa
+    )
+    raw_config = build_raw_config(output_dir, sample_count, args)
+    process = psutil.Process()
+    start_write_char_count = process.io_counters().write_chars
+    start_time = time.perf_counter()
+    # The log of every sample is printed to the console, which is too noisy for a benchmark.
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            run_assignment(raw_config)
+    elapsed_time = time.perf_counter() - start_time
+    round_count = sample_count * args.round_count
+    result_queue.put(
+        {
+            "sample_count": sample_count,
+            "elapsed_time": elapsed_time,
+            "samples_per_second": sample_count / elapsed_time,
+            "overhead_per_round_ms": elapsed_time / round_count * 1000,
+            # ru_maxrss is in kilobytes on Linux.
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "written_mb": (process.io_counters().write_chars - start_write_char_count)
+            / 1024**2,
+            "output_dir_mb": get_dir_size(output_dir) / 1024**2,
+        }
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sample_count_list", type=int, nargs="+", default=[100, 1000, 10000]
+    )
+    parser.add_argument("--round_count", type=int, default=5)
+    parser.add_argument("--observation_size", type=int, default=1000)
+    parser.add_argument("--response_size", type=int, default=200)
+    parser.add_argument("--concurrent_session_count", type=int, default=1)
+    parser.add_argument(
+        "--callback_flag",
+        action="store_true",
+        help="Enable CurrentSessionSavingCallback and ConsecutiveAbnormalAgentInferenceProcessHandlingCallback.",
+    )
+    parser.add_argument("--logger_level", type=str, default="INFO")
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=os.path.join(
+            "outputs",
+            "benchmarks",
+            datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S"),
+        ),
+    )
+    args = parser.parse_args()
+    multiprocessing_context = multiprocessing.get_context("spawn")
+    result_queue: "multiprocessing.Queue[dict[str, Any]]" = (
+        multiprocessing_context.Queue()
+    )
+    result_list: list[dict[str, Any]] = []
+    for sample_count in args.sample_count_list:
+        process = multiprocessing_context.Process(
+            target=run_single_benchmark,
+            args=(
+                os.path.join(args.output_dir, str(sample_count)),
+                sample_count,
+                args,
+                result_queue,
+            ),
+        )
+        process.start()
+        result = result_queue.get()
+        process.join()
+        result_list.append(result)
+        print(
+            f"sample_count={result['sample_count']:<6} "
+            f"samples/s={result['samples_per_second']:<10.1f} "
+            f"overhead/round={result['overhead_per_round_ms']:<8.3f}ms "
+            f"peak_rss={result['peak_rss_mb']:<8.1f}MB "
+            f"written={result['written_mb']:<8.1f}MB "
+            f"output_dir={result['output_dir_mb']:.1f}MB"
+        )
+        sys.stdout.flush()
+    json.dump(
+        {"args": vars(args), "result_list": result_list},
+        open(os.path.join(args.output_dir, "benchmark_result.json"), "w"),  # noqa
+        indent=2,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Measure the cost of serializing a Session for the RPC between Client and Server, per KB of the serialized session. See
+RpcCodec.
+
+Usage:
+    export PYTHONPATH=./
+    python benchmarks/serialization_benchmark.py --session_size_kb_list 1 16 256 1024
+"""
+
+import argparse
+import json
+import random
+import string
+import timeit
+from typing import Any, Callable
+
+import orjson
+
+from src.typings import Session, Role, SampleStatus
+from src.utils.rpc_codec import RpcCodec
+
+
+def build_session(session_size_kb: int) -> Session:
+    # The observations of DBBench contain the rows of the table, so half of the observations are row lists.
+    random_generator = random.Random(0)
+    session = Session(
+        task_name="db_bench", sample_index=0, sample_status=SampleStatus.RUNNING
+    )
+    session.chat_history.inject({"role": Role.USER, "content": "Instruction."})
+    round_index = 0
+    while len(session.model_dump_json()) < session_size_kb * 1024:
+        session.chat_history.inject(
+            {"role": Role.AGENT, "content": "Action: Operation\n```sql\nSELECT 1;\n```"}
+        )
+        if round_index % 2 == 0:
+            content = str(
+                [
+                    (
+                        random_generator.randint(0, 10**6),
+                        "".join(random_generator.choices(string.ascii_letters, k=12)),
+                        random_generator.random(),
+                    )
+                    for _ in range(16)
+                ]
+            )
+        else:
+            content = " ".join(
+                "".join(random_generator.choices(string.ascii_lowercase, k=6))
+                for _ in range(64)
+            )
+        session.chat_history.inject({"role": Role.USER, "content": content})
+        round_index += 1
+    return session
+
+
+def measure(func: Callable[[], Any]) -> float:
+    # Return the time of a single call in seconds.
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def run_single_benchmark(session_size_kb: int) -> dict[str, Any]:
+    session = build_session(session_size_kb)
+    json_body = session.model_dump_json().encode("utf-8")
+    size_kb = len(json_body) / 1024
+    result: dict[str, Any] = {"size_kb": size_kb}
+    # region Serialization
+    # legacy: model_dump() + json.dumps() on the client, json.loads() + model_validate() on the server.
+    # orjson: used by Client and Server (ORJSONResponse, RpcRequest).
+    legacy_body = json.dumps(session.model_dump(mode="json")).encode("utf-8")
+    result["legacy_encode_us_per_kb"] = (
+        measure(lambda: json.dumps(session.model_dump(mode="json")).encode("utf-8"))
+        / size_kb
+        * 1e6
+    )
+    result["legacy_decode_us_per_kb"] = (
+        measure(lambda: Session.model_validate(json.loads(legacy_body))) / size_kb * 1e6
+    )
+    result["pydantic_core_encode_us_per_kb"] = (
+        measure(lambda: session.model_dump_json().encode("utf-8")) / size_kb * 1e6
+    )
+    result["pydantic_core_decode_us_per_kb"] = (
+        measure(lambda: Session.model_validate_json(json_body)) / size_kb * 1e6
+    )
+    result["orjson_encode_us_per_kb"] = (
+        measure(lambda: orjson.dumps(session.model_dump(mode="json"))) / size_kb * 1e6
+    )
+    result["orjson_decode_us_per_kb"] = (
+        measure(lambda: Session.model_validate(orjson.loads(json_body))) / size_kb * 1e6
+    )
+    # endregion
+    # region Compression
+    for content_encoding in RpcCodec.get_supported_content_encoding_list():
+        compressed_body = RpcCodec.compress(json_body, content_encoding)
+        result[f"{content_encoding}_ratio"] = len(compressed_body) / len(json_body)
+        result[f"{content_encoding}_compress_us_per_kb"] = (
+            measure(lambda: RpcCodec.compress(json_body, content_encoding))
+            / size_kb
+            * 1e6
+        )
+        result[f"{content_encoding}_decompress_us_per_kb"] = (
+            measure(lambda: RpcCodec.decompress(compressed_body, content_encoding))
+            / size_kb
+            * 1e6
+        )
+    # endregion
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--session_size_kb_list", type=int, nargs="+", default=[1, 16, 256, 1024]
+    )
+    args = parser.parse_args()
+    for session_size_kb in args.session_size_kb_list:
+        result = run_single_benchmark(session_size_kb)
+        print(
+            " ".join(
+                f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in result.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
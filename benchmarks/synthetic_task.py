@@ -0,0 +1,120 @@
+from typing import Optional, Sequence
+
+from src.tasks.task import (
+    Task,
+    DatasetItem,
+    SkillUtility,
+    AgentResponseParserResult,
+    AgentAction,
+)
+from src.typings import (
+    TaskName,
+    Session,
+    Role,
+    SampleStatus,
+    SessionEvaluationOutcome,
+    MetricDict,
+    SessionMetricCalculationPartial,
+)
+from src.factories.chat_history_item import ChatHistoryItemFactory
+
+
+class SyntheticSkillUtility(SkillUtility):
+    _SKILL_TO_LEVEL_DICT = {
+        "synthetic_skill_0": 0,
+        "synthetic_skill_1": 1,
+        "synthetic_skill_2": 2,
+    }
+
+
+class SyntheticDatasetItem(DatasetItem):
+    skill_list: list[str]
+    difficulty_level: int
+
+    def get_skill_list(self) -> list[str]:
+        return self.skill_list
+
+    def get_difficulty_level(self) -> int:
+        return self.difficulty_level
+
+
+class SyntheticTask(Task[SyntheticDatasetItem]):
+    """
+    A task without environment. Every sample takes exactly `round_count` rounds, and every round appends an
+    observation of `observation_size` characters to the chat history. It is used to measure the overhead of the
+    framework, so the task itself does (almost) nothing.
+    """
+
+    def __init__(
+        self,
+        task_name: TaskName,
+        chat_history_item_factory: ChatHistoryItemFactory,
+        max_round: int,
+        sample_count: int,
+        round_count: int,
+        observation_size: int,
+    ):
+        super().__init__(task_name, chat_history_item_factory, max_round)
+        assert 0 < round_count <= max_round
+        self.round_count = round_count
+        self.observation = "o" * observation_size
+        skill_list = SyntheticSkillUtility.get_all_skill_list()
+        self._set_dataset(
+            {
+                sample_index: SyntheticDatasetItem(
+                    skill_list=skill_list[: sample_index % len(skill_list) + 1],
+                    difficulty_level=sample_index % len(skill_list),
+                )
+                for sample_index in range(sample_count)
+            }
+        )
+
+    def _get_default_task_output(self) -> dict[str, Optional[str]]:
+        return {"answer": None}
+
+    @staticmethod
+    def _parse_agent_response(agent_response: str) -> AgentResponseParserResult:
+        return AgentResponseParserResult(
+            action=AgentAction.EXECUTE, content=agent_response, finish_reason=None
+        )
+
+    def _reset(self, session: Session) -> None:
+        for chat_history_item in self.chat_history_item_factory.construct_list(
+            [(0, Role.USER), (1, Role.AGENT)]
+        ):
+            session.chat_history.inject(chat_history_item)
+        session.chat_history.inject(
+            {"role": Role.USER, "content": f"{self.observation} {session.sample_index}"}
+        )
+
+    def _interact(self, session: Session) -> None:
+        parser_result = self._parse_agent_response(
+            session.chat_history.get_item(-1).content
+        )
+        if self.current_round >= self.round_count:
+            session.sample_status = SampleStatus.COMPLETED
+            session.task_output = {"answer": parser_result.content}
+            return
+        session.chat_history.inject({"role": Role.USER, "content": self.observation})
+
+    def _complete(self, session: Session) -> None:
+        assert isinstance(session.sample_index, int)
+        session.evaluation_record.outcome = SessionEvaluationOutcome.from_bool(
+            session.sample_index % 2 == 0
+        )
+
+    def _release(self) -> None:
+        pass
+
+    def calculate_metric(
+        self, session_partial_list: Sequence[SessionMetricCalculationPartial]
+    ) -> MetricDict:
+        return {
+            "skill": self._calculate_metric_based_on_skill(
+                SyntheticSkillUtility, session_partial_list
+            ),
+            "difficulty_level": self._calculate_metric_based_on_difficulty_level(
+                session_partial_list
+            ),
+            "overall": self._calculate_overall_metric(session_partial_list),
+        }
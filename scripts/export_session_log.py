@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Export the session log (runs.jsonl) of an assignment to the legacy runs.json.
+The export is also done automatically at the end of the assignment. Use this script for an incomplete assignment.
+
+Usage:
+    python scripts/export_session_log.py --output_dir outputs/{TIMESTAMP}
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.utils import SessionLog
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output_dir", type=str, required=True)
+    args = parser.parse_args()
+    session_log = SessionLog(
+        os.path.join(args.output_dir, "runs.jsonl"),
+        os.path.join(args.output_dir, "runs.index.jsonl"),
+    )
+    session_log.close()
+    output_path = os.path.join(args.output_dir, "runs.json")
+    session_log.export(output_path)
+    print(f"{session_log.get_session_count()} sessions are exported to {output_path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ timestamp=$(date +"%Y-%m-%d %H:%M:%S")
 # Set environment variables
 export DESTINATION_SERVER="http://192.168.100.1"  # Replace with your Destination Server's IP or hostname
 export PORTS="8000,8001,8002,8003"  # Replace with the ports you want to forward
+# export ROUTES="/db_bench=http://192.168.100.1:8000,/os=http://192.168.100.2:8000"  # Optional: route by path prefix
 
 # Optional: Activate virtual environment
 # Uncomment and set the correct path if using a virtual environment
@@ -13,6 +13,7 @@ from src.typings import (
     Session,
     AgentOutOfMemoryException,
 )
+from src.utils import Tracer
 
 
 class Agent(ABC):
@@ -20,9 +21,13 @@ class Agent(ABC):
     def inference(self, session: Session) -> None:
         # The function takes Session as input for better exception handling
         chat_history = session.chat_history
-        assert chat_history.get_item_deep_copy(-1).role == Role.USER
+        assert chat_history.get_item(-1).role == Role.USER
         try:
-            chat_history_item = self._inference(chat_history)
+            with Tracer.span(
+                "agent.inference", "agent", session.sample_index
+            ) as span_arg_dict:
+                span_arg_dict["chat_history_length"] = chat_history.get_value_length()
+                chat_history_item = self._inference(chat_history)
         except AgentException as e:
             session.finish_reason = str(e)
             if isinstance(e, AgentContextLimitException):
@@ -49,3 +54,13 @@ class Agent(ABC):
 
     def get_role_dict(self) -> Mapping[Role, str]:
         return {role: "dummy" for role in Role}
+
+    def release_session(self, session: Session) -> None:
+        # Called by SessionRunner when the session is finished. Release the resources kept for the session, e.g., the
+        # KV cache of the language model.
+        pass
+
+    def supports_concurrent_inference(self) -> bool:
+        # Return True only if _inference() can be called by multiple threads at the same time.
+        # Otherwise, SessionRunner serializes the calls of Agent.inference().
+        return False
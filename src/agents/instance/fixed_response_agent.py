@@ -31,10 +31,8 @@ class FixedResponseAgent(Agent):
             for item_index in range(1, chat_history.get_value_length()):
                 if item_index >= session_chat_history_length:
                     break
-                session_chat_history_item = session.chat_history.get_item_deep_copy(
-                    item_index
-                )
-                input_chat_history_item = chat_history.get_item_deep_copy(item_index)
+                session_chat_history_item = session.chat_history.get_item(item_index)
+                input_chat_history_item = chat_history.get_item(item_index)
                 if session_chat_history_item != input_chat_history_item:
                     break
             else:
@@ -45,7 +43,7 @@ class FixedResponseAgent(Agent):
                     )
                 return ChatHistoryItem(
                     role=Role.AGENT,
-                    content=session.chat_history.get_item_deep_copy(item_index).content,
+                    content=session.chat_history.get_item(item_index).content,
                 )
         raise AgentUnknownException(
             "FixedResponseAgent cannot find response for the given chat history."
@@ -12,8 +12,10 @@ from src.typings import (
     LanguageModelUnknownException,
     AgentUnknownException,
     Role,
+    Session,
 )
-from src.language_models import LanguageModel
+from src.language_models import LanguageModel, BatchInferenceScheduler
+from src.utils import SafeLogger
 
 
 class LanguageModelAgent(Agent):
@@ -22,17 +24,35 @@ class LanguageModelAgent(Agent):
         language_model: LanguageModel,
         system_prompt: str = "You are a helpful assistant.",
         inference_config_dict: Optional[Mapping[str, Any]] = None,
+        batch_inference_config: Optional[Mapping[str, Any]] = None,
     ):
         """
         The name of the parameter `language_model` is referenced in `src.run_experiment.py` by string.
             So do not change it.
+        batch_inference_config: The parameters of BatchInferenceScheduler (max_batch_size, max_wait_time). If it is
+            provided, the inference requests of concurrent sessions are merged into batches.
         """
         self._language_model = language_model
         self._system_prompt = system_prompt
         self._inference_config_dict = inference_config_dict
+        self._batch_inference_scheduler: Optional[BatchInferenceScheduler] = None
+        if batch_inference_config is not None:
+            self._batch_inference_scheduler = BatchInferenceScheduler(
+                language_model, **batch_inference_config
+            )
+            if not language_model.supports_batch_inference():
+                SafeLogger.warning(
+                    f"batch_inference_config is set, but {type(language_model).__name__} generates the chat histories "
+                    f"of a batch one by one (e.g., the KV cache pool of HuggingfaceLanguageModel is enabled). The "
+                    f"batches only share the prefill of the common prompt prefix."
+                )
 
     def _inference(self, chat_history: ChatHistory) -> ChatHistoryItem:
         try:
+            if self._batch_inference_scheduler is not None:
+                return self._batch_inference_scheduler.inference(
+                    chat_history, self._inference_config_dict, self._system_prompt
+                )
             return self._language_model.inference(
                 [chat_history], self._inference_config_dict, self._system_prompt
             )[0]
@@ -46,3 +66,18 @@ class LanguageModelAgent(Agent):
     @override
     def get_role_dict(self) -> Mapping[Role, str]:
         return self._language_model.role_dict
+
+    @override
+    def release_session(self, session: Session) -> None:
+        self._language_model.release_chat_history(
+            session.chat_history, self._system_prompt
+        )
+
+    @override
+    def supports_concurrent_inference(self) -> bool:
+        # The scheduler calls the language model in its own worker thread. Otherwise, the language model is called in
+        # the thread of the session.
+        return (
+            self._batch_inference_scheduler is not None
+            or self._language_model.supports_concurrent_inference()
+        )
@@ -73,7 +73,7 @@ class OracleAgent(Agent):
         # region Get chat_corresponding_instruction
         chat_corresponding_instruction: Optional[str] = None
         for item_index in range(chat_history.get_value_length()):
-            content = chat_history.get_item_deep_copy(item_index).content
+            content = chat_history.get_item(item_index).content
             for instruction in self.response_dict.keys():
                 if instruction in content:
                     if chat_corresponding_instruction is None:
@@ -97,7 +97,7 @@ class OracleAgent(Agent):
         current_response_index: Optional[int] = None
         for response_index, response in enumerate(response_list):
             for item_index in range(chat_history.get_value_length()):
-                chat_history_item = chat_history.get_item_deep_copy(item_index)
+                chat_history_item = chat_history.get_item(item_index)
                 if chat_history_item.role == Role.USER:
                     continue
                 if response == chat_history_item.content:
@@ -113,7 +113,7 @@ class OracleAgent(Agent):
                 return ChatHistoryItem(role=Role.AGENT, content=current_response)
             case TaskName.KNOWLEDGE_GRAPH:
                 if current_response_index == len(response_list) - 1:
-                    last_content = chat_history.get_item_deep_copy(-1).content
+                    last_content = chat_history.get_item(-1).content
                     match = re.search(r"Variable #(\d+)", last_content)
                     if match:
                         variable_index = int(match.group(1))
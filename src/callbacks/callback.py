@@ -2,10 +2,12 @@ from typing import Sequence, Mapping, final
 from typing_extensions import override, Optional
 from abc import ABC, abstractmethod
 import os
+import shutil
 
 from src.tasks import Task, DatasetItem
 from src.agents import Agent
 from src.typings import Session
+from src.utils import Tracer
 
 
 class SessionContext:
@@ -75,9 +77,31 @@ class Callback(ABC):
     def is_unique(cls) -> bool:
         raise NotImplementedError()
 
+    @classmethod
+    def is_previous_session_dependent(cls) -> bool:
+        """
+        Whether the callback depends on the sessions completed before the current session, e.g., it reads
+        session_list or the outcome of the last session. Under concurrent sessions, a session is created before the
+        sessions admitted earlier are completed, so such callbacks are only allowed when concurrent_session_count is 1.
+        """
+        return False
+
     def restore_state(self) -> None:
         pass
 
+    @classmethod
+    def merge_state(cls, shard_state_dir_list: Sequence[str], state_dir: str) -> None:
+        """
+        Merge the states saved by the shards of a sharded assignment into state_dir. The shards are ordered by
+        shard index.
+        By default, the state of the last shard that has saved any state is copied. Override the method if the state
+        depends on all the sessions.
+        """
+        for shard_state_dir in reversed(shard_state_dir_list):
+            if os.path.exists(shard_state_dir) and len(os.listdir(shard_state_dir)) > 0:
+                shutil.copytree(shard_state_dir, state_dir, dirs_exist_ok=True)
+                return
+
     def on_session_create(self, callback_args: CallbackArguments) -> None:
         pass
 
@@ -131,5 +155,10 @@ class CallbackHandler(Callback):
 
     def _call_event(self, event: str, callback_args: CallbackArguments) -> None:
         for callback_id, callback in self.callback_dict.items():
-            # callback_id is not used. But it can be used for debugging.
-            getattr(callback, event)(callback_args)
+            with Tracer.span(
+                f"callback.{event}",
+                "callback",
+                callback_args.current_session.sample_index,
+            ) as span_arg_dict:
+                span_arg_dict["callback_id"] = callback_id
+                getattr(callback, event)(callback_args)
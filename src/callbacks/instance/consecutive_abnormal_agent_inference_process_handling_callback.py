@@ -1,5 +1,6 @@
 import json
 import os
+from typing import Sequence
 
 from src.callbacks.callback import Callback, CallbackArguments
 from src.typings import SampleStatus, SessionEvaluationOutcome, SampleIndex
@@ -34,6 +35,39 @@ class ConsecutiveAbnormalAgentInferenceProcessHandlingCallback(Callback):
             open(self._get_aborted_sample_index_list_state_path(), "r")
         )
 
+    @classmethod
+    def merge_state(cls, shard_state_dir_list: Sequence[str], state_dir: str) -> None:
+        # consecutive_abnormality_count is taken from the last shard. aborted_sample_index_list is interleaved in the
+        # same way as the session logs of the shards are merged.
+        super().merge_state(shard_state_dir_list, state_dir)
+        if not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+        shard_aborted_sample_index_list_list: list[list[SampleIndex]] = []
+        for shard_state_dir in shard_state_dir_list:
+            shard_state_path = os.path.join(
+                shard_state_dir, "aborted_sample_index_list.json"
+            )
+            if os.path.exists(shard_state_path):
+                shard_aborted_sample_index_list_list.append(
+                    json.load(open(shard_state_path, "r"))
+                )
+        aborted_sample_index_list: list[SampleIndex] = []
+        for position in range(
+            max(map(len, shard_aborted_sample_index_list_list), default=0)
+        ):
+            for shard_aborted_sample_index_list in shard_aborted_sample_index_list_list:
+                if position < len(shard_aborted_sample_index_list):
+                    aborted_sample_index_list.append(
+                        shard_aborted_sample_index_list[position]
+                    )
+        json.dump(
+            aborted_sample_index_list,
+            open(
+                os.path.join(state_dir, "aborted_sample_index_list.json"), "w"
+            ),  # noqa
+            indent=2,
+        )
+
     def on_session_create(self, callback_args: CallbackArguments) -> None:
         if self.consecutive_abnormality_count != self.tolerance_count:
             return
@@ -53,6 +87,10 @@ class ConsecutiveAbnormalAgentInferenceProcessHandlingCallback(Callback):
     def is_unique(cls) -> bool:
         return True
 
+    @classmethod
+    def is_previous_session_dependent(cls) -> bool:
+        return True
+
     def on_task_complete(self, callback_args: CallbackArguments) -> None:
         if (
             callback_args.current_session.sample_status.is_agent_inference_process_abnormal()
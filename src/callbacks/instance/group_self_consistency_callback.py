@@ -238,6 +238,10 @@ class GroupSelfConsistencyCallback(Callback):
     def is_unique(cls) -> bool:
         return True
 
+    @classmethod
+    def is_previous_session_dependent(cls) -> bool:
+        return True
+
     def _language_model_dynamic_batch_inference(
         self,
         inference_phase: SelfConsistencyPhase,
@@ -392,7 +396,7 @@ Answer: Irrelevant
         # user: requirement
         # agent: OK.
         # user: question
-        question_chat_history_item = current_session_chat_history.get_item_deep_copy(-1)
+        question_chat_history_item = current_session_chat_history.get_item(-1)
         assert question_chat_history_item.role == Role.USER
         current_question = question_chat_history_item.content
         raw_prompt = self._construct_relevance_judgement_prompt()
@@ -528,7 +532,7 @@ Selection: A
         action_selection_str: str = ""
         for action_index, candidate_action in enumerate(candidate_action_list):
             action_selection_str += f"{chr(65 + action_index)}. {candidate_action}\n"
-        original_user_content = session_chat_history.get_item_deep_copy(-1).content
+        original_user_content = session_chat_history.get_item(-1).content
         prompt.replace("{action_selection_str}", action_selection_str)
         prompt.replace("{original_user_content}", original_user_content)
         session_chat_history.set(-1, ChatHistoryItem(role=Role.USER, content=prompt))
@@ -544,7 +548,7 @@ Selection: A
             )
             return None, "Error in agent inference"
         match = re.search(
-            r"Selection: ([A-Z])", session_chat_history.get_item_deep_copy(-1).content
+            r"Selection: ([A-Z])", session_chat_history.get_item(-1).content
         )
         if match is None:
             return None, "Cannot extract the selection"
@@ -620,17 +624,15 @@ Experience {experience_index + 1}:
                 )
             # endregion
             # region Construct chat_history
-            chat_history_deep_copy = (
-                callback_args.current_session.chat_history.model_copy(deep=True)
-            )
-            _ = chat_history_deep_copy.pop(-1)  # Remove the newest agent response
-            chat_history_deep_copy.set(
+            chat_history_copy = callback_args.current_session.chat_history.get_copy()
+            _ = chat_history_copy.pop(-1)  # Remove the newest agent response
+            chat_history_copy.set(
                 0, ChatHistoryItem(role=Role.USER, content=processed_prompt)
             )  # Replace the first user prompt with the processed_prompt
             # endregion
             chat_history_info_list.append(
                 ChatHistoryInfo(
-                    chat_history=chat_history_deep_copy,
+                    chat_history=chat_history_copy,
                     sample_index_list=sorted_utilized_sample_index_list[
                         start_sample_index : start_sample_index
                         + self.sample_count_per_group
@@ -665,7 +667,7 @@ Experience {experience_index + 1}:
         group_info_list: list[GroupInfo] = []
         # region Add the original agent response
         original_inference_content = (
-            callback_args.current_session.chat_history.get_item_deep_copy(-1).content
+            callback_args.current_session.chat_history.get_item(-1).content
         )
         group_info_list.append(
             GroupInfo(
@@ -765,12 +767,10 @@ Experience {experience_index + 1}:
                     )
                 )
                 return
-            chat_history_deep_copy = (
-                callback_args.current_session.chat_history.model_copy(deep=True)
-            )
+            chat_history_copy = callback_args.current_session.chat_history.get_copy()
             selected_action, selected_reason = (
                 self._select_action_from_candidate_action_list(
-                    candidate_action_list, chat_history_deep_copy
+                    candidate_action_list, chat_history_copy
                 )
             )
             if selected_action is not None:
@@ -824,7 +824,7 @@ Experience {experience_index + 1}:
         # endregion
         # region Maintain self.session_wrapper_list
         chat_history = callback_args.current_session.chat_history
-        experience_question = chat_history.get_item_deep_copy(2).content
+        experience_question = chat_history.get_item(2).content
         agent_role_dict = self.language_model.role_dict
         # Skip the first 3 items, which are
         # - user: requirement
@@ -41,6 +41,10 @@ class PreviousSampleUtilizationCallback(Callback):
     def is_unique(cls) -> bool:
         return True
 
+    @classmethod
+    def is_previous_session_dependent(cls) -> bool:
+        return True
+
     def on_task_complete(self, callback_args: CallbackArguments) -> None:
         # Get the session that just completed.
         current_session = callback_args.current_session
@@ -61,7 +65,7 @@ class PreviousSampleUtilizationCallback(Callback):
         example_text = "\n"
         for i, session in enumerate(self.utilized_session_list):
             try:
-                question = session.chat_history.get_item_deep_copy(2).content
+                question = session.chat_history.get_item(2).content
             except:  # noqa
                 question = ""
             session_str = f"Question {question}:\n"
@@ -78,9 +82,7 @@ class PreviousSampleUtilizationCallback(Callback):
         )
 
     def on_agent_inference(self, callback_args: CallbackArguments) -> None:
-        last_chat_history_item = (
-            callback_args.current_session.chat_history.get_item_deep_copy(-1)
-        )
+        last_chat_history_item = callback_args.current_session.chat_history.get_item(-1)
         assert last_chat_history_item.role == Role.AGENT
         last_agent_response = last_chat_history_item.content
         counterfeit_user_response_location = last_agent_response.find("\nuser: ")
@@ -59,6 +59,10 @@ class RLTrainingCallback(Callback):
     def is_unique(cls) -> bool:
         return True
 
+    @classmethod
+    def is_previous_session_dependent(cls) -> bool:
+        return True
+
     def _get_optimizer_state_path(self) -> str:
         return os.path.join(self.get_state_dir(), "optimizer_state.pt")
 
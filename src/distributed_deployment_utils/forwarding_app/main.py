@@ -1,11 +1,16 @@
+import contextlib
 import os
-import requests
-import threading
+import socket
+import time
+from typing import AsyncIterator, Optional, Sequence
+
+import httpx
 import uvicorn
 from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 from src.typings import LoggerConfig
-from src.utils import SingletonLogger
+from src.utils import SingletonLogger, MetricRegistry
 
 
 logger_config = LoggerConfig(
@@ -15,74 +20,172 @@ logger_config = LoggerConfig(
 )
 logger = SingletonLogger.get_instance(logger_config)
 
-app = FastAPI()
-
-# Configuration: Destination server base URL
+# Configuration: Destination server base URL. The requests that do not match any route are forwarded to the port of
+# the Destination Server that receives the request.
 DESTINATION_SERVER = os.getenv("DESTINATION_SERVER", "http://destination-server")
+# Configuration: Routes, e.g., "/task=http://192.168.100.1:8000,/factory=http://192.168.100.2:8000". The request is
+# forwarded to the backend of the longest matching path prefix, the path is not changed.
+ROUTES = os.getenv("ROUTES", "")
+# Configuration: The timeout (in seconds) of connecting to the backend, and of waiting for each chunk of the response.
+FORWARDING_TIMEOUT = float(os.getenv("FORWARDING_TIMEOUT", "60"))
+# Configuration: The maximum number of connections kept alive to all the backends.
+MAX_CONNECTION_COUNT = int(os.getenv("MAX_CONNECTION_COUNT", "256"))
+# The headers that only apply to a single connection, they are not forwarded.
+HOP_BY_HOP_HEADER_SET = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+def parse_route_list(routes: str) -> list[tuple[str, str]]:
+    route_list: list[tuple[str, str]] = []
+    for route in routes.split(","):
+        if not route.strip():
+            continue
+        prefix, backend_url = route.split("=", 1)
+        route_list.append(("/" + prefix.strip().strip("/"), backend_url.strip()))
+    # The longest prefix is matched first.
+    return sorted(route_list, key=lambda route: -len(route[0]))
+
+
+route_list = parse_route_list(ROUTES)
+metric_registry = MetricRegistry()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # The connections to the backends are pooled, kept alive and shared by all the forwarded requests.
+    app.state.http_client = httpx.AsyncClient(
+        timeout=FORWARDING_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTION_COUNT,
+            max_keepalive_connections=MAX_CONNECTION_COUNT,
+        ),
+    )
+    yield
+    await app.state.http_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def get_backend_url(path: str, incoming_port: Optional[int]) -> str:
+    for prefix, backend_url in route_list:
+        if path == prefix or path.startswith(prefix.rstrip("/") + "/"):
+            return backend_url
+    return f"{DESTINATION_SERVER}:{incoming_port}"
+
+
+def record_error(backend_url: str) -> None:
+    metric_registry.increase_counter(
+        "forwarding_app_request_error_total",
+        "The forwarded requests that failed to reach the backend.",
+        {"backend": backend_url},
+    )
+
+
+@app.get("/metrics")
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        metric_registry.export(), media_type=MetricRegistry.CONTENT_TYPE
+    )
 
 
 @app.api_route("/{path:path}", methods=["POST"])
 async def forward_any_post(path: str, request: Request) -> Response:
     """
-    Forward any POST request to the Destination Server based on the incoming port.
+    Forward any POST request to the backend selected by the path prefix, or to the Destination Server based on the
+    incoming port. The bodies of the request and the response are streamed, instead of being read into memory.
     """
-    # Read the raw request body
-    body = await request.body()
-
-    # Copy the original request headers and remove "host" to avoid conflicts
-    original_headers = dict(request.headers)
-    original_headers.pop("host", None)
-
-    # Determine the incoming port from the request URL
-    incoming_port = request.url.port
-
-    # Log the incoming request
-    logger.info(f"Received POST request on port {incoming_port}: /{path}")
-
-    # Use the incoming port as the destination port
-    destination_port = incoming_port
-
-    # Construct the forwarding URL
-    destination_url = f"{DESTINATION_SERVER}:{destination_port}/{path}"
-    logger.info(f"Forwarding to {destination_url}")
-
+    start_time = time.perf_counter()
+    backend_url = get_backend_url(request.url.path, request.url.port)
+    destination_url = f"{backend_url}{request.url.path}"
+    if request.url.query:
+        destination_url += f"?{request.url.query}"
+    logger.info(
+        f"Forwarding POST request on port {request.url.port} to {destination_url}"
+    )
+    # The host header is set by the HTTP client according to destination_url.
+    request_headers = {
+        key: value
+        for key, value in request.headers.items()
+        if key not in HOP_BY_HOP_HEADER_SET and key != "host"
+    }
+    http_client: httpx.AsyncClient = request.app.state.http_client
     try:
-        # Forward the request to the Destination Server with a timeout
-        response_from_destination = requests.post(
-            destination_url, data=body, headers=original_headers, timeout=60  # seconds
-        )
-        logger.info(
-            f"Received response from Destination Server: {response_from_destination.status_code}"
+        response_from_destination = await http_client.send(
+            http_client.build_request(
+                "POST",
+                destination_url,
+                headers=request_headers,
+                content=request.stream(),
+            ),
+            stream=True,
         )
-    except requests.exceptions.Timeout:
-        logger.error("Destination server timed out")
+    except httpx.TimeoutException:
+        record_error(backend_url)
+        logger.error(f"Destination server {backend_url} timed out")
         raise HTTPException(status_code=504, detail="Destination server timed out")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error reaching destination server: {e}")
+    except httpx.RequestError as e:
+        record_error(backend_url)
+        logger.error(f"Error reaching destination server {backend_url}: {e}")
         raise HTTPException(status_code=503, detail="Destination server not reachable")
-
-    # Extract response details from the Destination Server
-    content = response_from_destination.content
-    status_code = response_from_destination.status_code
-
-    # Forward relevant headers, excluding those that can cause conflicts
-    response_headers = dict(response_from_destination.headers)
-    for h in ["content-encoding", "transfer-encoding", "content-length", "connection"]:
-        response_headers.pop(h, None)
-
-    # Log the response status
-    logger.info(f"Responding with status {status_code} to client")
-
-    # Return the response exactly as received from the Destination Server
-    return Response(content=content, status_code=status_code, headers=response_headers)
-
-
-def run_forwarding_app(host: str, port: int) -> None:
+    logger.info(
+        f"Received response from {backend_url}: {response_from_destination.status_code}"
+    )
+
+    async def stream_response_body() -> AsyncIterator[bytes]:
+        # The body is forwarded as is, so content-encoding and content-length are kept.
+        try:
+            async for chunk in response_from_destination.aiter_raw():
+                yield chunk
+        finally:
+            await response_from_destination.aclose()
+            metric_registry.observe_histogram(
+                "forwarding_app_request_latency_seconds",
+                "The latency of the forwarded requests, from receiving the request to sending the last chunk of the "
+                "response.",
+                MetricRegistry.LATENCY_BUCKET_UPPER_BOUND_LIST,
+                time.perf_counter() - start_time,
+                {"backend": backend_url},
+            )
+
+    # The date and server headers are added by Uvicorn.
+    response_headers = {
+        key: value
+        for key, value in response_from_destination.headers.items()
+        if key not in HOP_BY_HOP_HEADER_SET and key not in {"date", "server"}
+    }
+    return StreamingResponse(
+        stream_response_body(),
+        status_code=response_from_destination.status_code,
+        headers=response_headers,
+    )
+
+
+def create_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    return sock
+
+
+def run_forwarding_app(host: str, port_list: Sequence[int]) -> None:
     """
-    Function to run an Uvicorn application on a specified host and port.
+    Run the application on all the ports with a single Uvicorn server, so that all the ports share the event loop and
+    the connection pool.
     """
-    logger.info(f"Starting forwarding_app on {host}:{port}")
-    uvicorn.run(app, host=host, port=port, log_level="info")
+    logger.info(f"Starting forwarding_app on {host}:{list(port_list)}")
+    if route_list:
+        logger.info(f"Routes: {route_list}")
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=[create_socket(host, port) for port in port_list])
 
 
 if __name__ == "__main__":
@@ -103,19 +206,7 @@ if __name__ == "__main__":
         logger.error(f"Invalid PORTS environment variable: {e_}")
         PORTS = [8000, 8001, 8002, 8003]  # Fallback to default ports
 
-    # Create and start a thread for each Uvicorn application instance
-    threads = []
-    for port in PORTS:
-        thread = threading.Thread(
-            target=run_forwarding_app, args=(HOST, port), daemon=True
-        )
-        thread.start()
-        threads.append(thread)
-        logger.info(f"Application thread started for port {port}")
-
-    # Keep the main thread alive to allow application threads to run
     try:
-        for thread in threads:
-            thread.join()
+        run_forwarding_app(HOST, PORTS)
     except KeyboardInterrupt:
         logger.info("Shutting down applications...")
@@ -3,13 +3,13 @@ from pydantic import BaseModel
 import subprocess
 import uvicorn
 import traceback
-import time
 import docker
 import psutil
 from typing import Optional
 
-from src.typings import LoggerConfig
-from src.utils import SingletonLogger
+from src.typings import LoggerConfig, HttpException
+from src.utils import SingletonLogger, ConfigLoader, ReadinessProbe
+from src.distributed_deployment_utils.start_server import ServerStarterUtility
 from src.distributed_deployment_utils.server_side_controller.utility import (
     StartServerRequest,
     StartServerResponse,
@@ -45,7 +45,20 @@ class ServerSideController:
             "./src/distributed_deployment_utils/start_server.py",
             "--config_path",
             request.config_path,
+            "--readiness_timeout",
+            str(request.readiness_timeout),
         ]
+        # The task server is started after the tasks are constructed, so it is the last server to be ready.
+        try:
+            raw_config = ConfigLoader().load_from(request.config_path)
+            task_server_address = ServerStarterUtility.get_local_server_address(
+                raw_config["environment_config"]["task_client"]["parameters"][
+                    "server_address"
+                ]
+            )
+        except Exception as e:
+            self.logger.error(f"Error reading the task server address: {e}")
+            return StartServerResponse(success_flag=False, message=str(e))
         client = docker.from_env()
         container_id_list_before = [c.id for c in client.containers.list()]
         # endregion
@@ -58,22 +71,20 @@ class ServerSideController:
             return StartServerResponse(success_flag=False, message=str(e))
         self.logger.info(f"Started server with PID: {server_process.pid}")
         # endregion
-        # region Check the status of the server process
-        time.sleep(15)  # Sleep for some time to give the server a chance to start
-        server_running_flag: bool
-        if psutil.pid_exists(server_process.pid):
-            process = psutil.Process(server_process.pid)
-            if not process.is_running() or process.status() == psutil.STATUS_ZOMBIE:
-                server_running_flag = False
-            else:
-                server_running_flag = True
-        else:
-            server_running_flag = False
-        if not server_running_flag:
+        # region Wait until the task server is ready
+        try:
+            ReadinessProbe.wait_until_ready(
+                task_server_address,
+                request.readiness_timeout,
+                lambda: server_process.poll() is None,
+            )
+        except HttpException as e:
             error_message = (
-                f"Server process with PID {server_process.pid} exited prematurely."
+                f"Server process with PID {server_process.pid} is not ready: {e.detail}"
             )
             self.logger.error(error_message)
+            if server_process.poll() is None:
+                ServerSideController._kill_process_and_children(server_process.pid)
             return StartServerResponse(success_flag=False, message=error_message)
         # endregion
         # region Maintain state, return response
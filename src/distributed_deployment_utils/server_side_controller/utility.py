@@ -4,6 +4,8 @@ from typing import Optional
 
 class StartServerRequest(BaseModel):
     config_path: str
+    # The time in seconds to wait for the servers to be ready, including the construction of the tasks.
+    readiness_timeout: float = 600
 
 
 class StartServerResponse(BaseModel):
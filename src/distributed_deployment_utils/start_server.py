@@ -6,7 +6,7 @@ import time
 from src.tasks import Task, TaskServer, DatasetItem
 from src.factories import ChatHistoryItemFactoryServer
 from src.typings import GeneralInstanceFactory
-from src.utils import ConfigLoader, SingletonLogger
+from src.utils import ConfigLoader, SingletonLogger, ReadinessProbe
 from src.run_experiment import ConfigUtility, ConfigUtilityCaller
 
 
@@ -28,6 +28,13 @@ class ServerStarterUtility:
             raise ValueError(f"Prefix not found in server address: {server_address}")
         return prefix_match.group(1)
 
+    @classmethod
+    def get_local_server_address(cls, server_address: str) -> str:
+        # The address used to reach the server from the host of the server. The servers listen on all interfaces.
+        port = cls.extract_server_port(server_address)
+        prefix = cls.extract_server_prefix(server_address)
+        return f"http://127.0.0.1:{port}{prefix}"
+
 
 def main() -> None:
     # region Read config
@@ -39,6 +46,18 @@ def main() -> None:
         required=True,
         help="Path to the configuration file.",
     )
+    parser.add_argument(
+        "--readiness_timeout",
+        type=float,
+        default=600,
+        help="The time in seconds to wait for each server to be ready.",
+    )
+    parser.add_argument(
+        "--task_acquisition_timeout",
+        type=float,
+        default=60,
+        help="The time in seconds that a new session waits for an idle task of the Task Server.",
+    )
     args = parser.parse_args()
     raw_config = ConfigLoader().load_from(args.config_path)
     assert raw_config["environment_config"][
@@ -99,26 +118,47 @@ def main() -> None:
             daemon=True,  # Ensure subprocess terminates with the main process
         )
         chat_history_item_factory_server_process.start()
-        logger.info(f"Chat History Item Factory Server started.")
         process_information_list.append(
             (
                 chat_history_item_factory_server_process,
                 "Chat History Item Factory Server",
             )
         )
-        time.sleep(5)  # wait for the server to start
+        # The tasks connect to the server when they are constructed.
+        ReadinessProbe.wait_until_ready(
+            ServerStarterUtility.get_local_server_address(
+                chat_history_item_factory_server_address
+            ),
+            args.readiness_timeout,
+            chat_history_item_factory_server_process.is_alive,
+        )
+        logger.info(f"Chat History Item Factory Server started.")
         # endregion
         # region start task_server
         logger.info("Starting Task Server...")
+        # The server holds one task for each concurrent session of the client. See ConfigUtility.construct_task_list().
         task: Task[DatasetItem] = task_instance_factory.create()
+        task_list = ConfigUtility(
+            assignment_config, environment_config, path_config
+        ).construct_task_list(task)
         task_server_process = Process(
             target=TaskServer.start_server,
-            args=(task, task_server_port, task_server_prefix),
+            args=(
+                task_list,
+                task_server_port,
+                task_server_prefix,
+                args.task_acquisition_timeout,
+            ),
             daemon=True,  # Ensure subprocess terminates with the main process
         )
         task_server_process.start()
-        logger.info(f"Task Server started.")
         process_information_list.append((task_server_process, "Task Server"))
+        ReadinessProbe.wait_until_ready(
+            ServerStarterUtility.get_local_server_address(task_server_address),
+            args.readiness_timeout,
+            task_server_process.is_alive,
+        )
+        logger.info(f"Task Server started. Task count: {len(task_list)}.")
         # endregion
         # endregion
 
@@ -1,5 +1,5 @@
 import json
-from typing import Optional
+from typing import Optional, Sequence
 
 from src.typings import Role, ChatHistoryItemDict, ChatHistoryItem
 from abc import ABC, abstractmethod
@@ -12,6 +12,16 @@ class ChatHistoryItemFactoryInterface(ABC):
     ) -> ChatHistoryItem:
         pass
 
+    def construct_list(
+        self, construct_argument_list: Sequence[tuple[int, Optional[Role]]]
+    ) -> list[ChatHistoryItem]:
+        # Each element is the arguments of construct(). It is overridden by ChatHistoryItemFactoryClient to construct
+        # all the items in one request.
+        return [
+            self.construct(chat_history_item_index, expected_role)
+            for chat_history_item_index, expected_role in construct_argument_list
+        ]
+
     @abstractmethod
     def get_chat_history_item_dict_deep_copy(self) -> ChatHistoryItemDict:
         pass
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Optional, Sequence
 
 from src.factories.chat_history_item.online.chat_history_item_factory import (
     ChatHistoryItemFactoryInterface,
@@ -32,6 +32,28 @@ class ChatHistoryItemFactoryClient(Client, ChatHistoryItemFactoryInterface):
         )
         return response.chat_history_item
 
+    def construct_list(
+        self, construct_argument_list: Sequence[tuple[int, Optional[Role]]]
+    ) -> list[ChatHistoryItem]:
+        response_list = self._call_server_batch(
+            [
+                (
+                    "/construct",
+                    ChatHistoryItemFactoryRequest.Construct(
+                        chat_history_item_index=chat_history_item_index,
+                        expected_role=expected_role,
+                    ),
+                    ChatHistoryItemFactoryResponse.Construct,
+                )
+                for chat_history_item_index, expected_role in construct_argument_list
+            ]
+        )
+        chat_history_item_list: list[ChatHistoryItem] = []
+        for response in response_list:
+            assert isinstance(response, ChatHistoryItemFactoryResponse.Construct)
+            chat_history_item_list.append(response.chat_history_item)
+        return chat_history_item_list
+
     def get_chat_history_item_dict_deep_copy(self) -> ChatHistoryItemDict:
         response: ChatHistoryItemFactoryResponse.GetChatHistoryItemDictDeepCopy = (
             self._call_server(
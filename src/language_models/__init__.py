@@ -1 +1,2 @@
 from .language_model import LanguageModel
+from .batch_inference_scheduler import BatchInferenceScheduler
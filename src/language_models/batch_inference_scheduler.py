@@ -0,0 +1,136 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Mapping, Optional, Sequence
+
+from src.typings import ChatHistory, ChatHistoryItem
+from src.utils import SafeLogger
+from .language_model import LanguageModel
+
+
+class BatchInferenceRequest:
+    def __init__(
+        self,
+        chat_history: ChatHistory,
+        inference_config_dict: Optional[Mapping[str, Any]],
+        system_prompt: str,
+    ):
+        self.chat_history = chat_history
+        self.inference_config_dict = inference_config_dict
+        self.system_prompt = system_prompt
+        self.future: Future[ChatHistoryItem] = Future()
+
+    def get_group_key(self) -> str:
+        # Only the requests with the same inference config and system prompt can be put into the same batch.
+        return json.dumps(
+            [self.inference_config_dict, self.system_prompt],
+            sort_keys=True,
+            default=str,
+        )
+
+
+class BatchInferenceScheduler:
+    """
+    Collect the inference requests from many concurrent sessions and send them to LanguageModel.inference() in batches.
+    A batch is flushed when it reaches max_batch_size, or when max_wait_time (in seconds) has passed since the first
+    request of the batch arrived.
+    All the batches are run in one worker thread, so the language model is never called concurrently by the scheduler.
+    """
+
+    def __init__(
+        self, language_model: LanguageModel, max_batch_size: int, max_wait_time: float
+    ):
+        assert max_batch_size > 0
+        assert max_wait_time >= 0
+        self.language_model = language_model
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self._request_queue: queue.Queue[BatchInferenceRequest] = queue.Queue()
+        self._worker_thread: Optional[threading.Thread] = None
+        self._worker_thread_lock = threading.Lock()
+
+    def submit(
+        self,
+        chat_history: ChatHistory,
+        inference_config_dict: Optional[Mapping[str, Any]] = None,
+        system_prompt: str = "You are a helpful assistant.",
+    ) -> "Future[ChatHistoryItem]":
+        with self._worker_thread_lock:
+            if self._worker_thread is None:
+                self._worker_thread = threading.Thread(
+                    target=self._work, name="batch_inference_scheduler", daemon=True
+                )
+                self._worker_thread.start()
+        request = BatchInferenceRequest(
+            chat_history, inference_config_dict, system_prompt
+        )
+        self._request_queue.put(request)
+        return request.future
+
+    def inference(
+        self,
+        chat_history: ChatHistory,
+        inference_config_dict: Optional[Mapping[str, Any]] = None,
+        system_prompt: str = "You are a helpful assistant.",
+    ) -> ChatHistoryItem:
+        # Block until the batch that contains the request is finished.
+        # The exception raised by LanguageModel.inference() is re-raised here.
+        return self.submit(chat_history, inference_config_dict, system_prompt).result()
+
+    def _collect_batch(self) -> list[BatchInferenceRequest]:
+        request_list = [self._request_queue.get()]
+        deadline = time.monotonic() + self.max_wait_time
+        while len(request_list) < self.max_batch_size:
+            remaining_time = deadline - time.monotonic()
+            try:
+                if remaining_time <= 0:
+                    # Do not wait, but still take the requests that have already arrived.
+                    request_list.append(self._request_queue.get_nowait())
+                else:
+                    request_list.append(self._request_queue.get(timeout=remaining_time))
+            except queue.Empty:
+                break
+        return request_list
+
+    def _run_batch(self, request_list: Sequence[BatchInferenceRequest]) -> None:
+        try:
+            chat_history_item_list = self.language_model.inference(
+                [request.chat_history for request in request_list],
+                request_list[0].inference_config_dict,
+                request_list[0].system_prompt,
+            )
+        except Exception as e:
+            if len(request_list) == 1:
+                request_list[0].future.set_exception(e)
+                return
+            # One request (e.g., an overlong chat history) should not fail the whole batch. Retry one by one, so that
+            # the exception is only delivered to the requests that actually cause it.
+            SafeLogger.warning(
+                f"Batch inference with batch size {len(request_list)} failed. Retry the requests one by one. "
+                f"Error: {e}"
+            )
+            for request in request_list:
+                self._run_batch([request])
+            return
+        assert len(chat_history_item_list) == len(request_list)
+        for request, chat_history_item in zip(request_list, chat_history_item_list):
+            request.future.set_result(chat_history_item)
+
+    def _work(self) -> None:
+        while True:
+            request_list = self._collect_batch()
+            request_group_dict: dict[str, list[BatchInferenceRequest]] = {}
+            for request in request_list:
+                request_group_dict.setdefault(request.get_group_key(), []).append(
+                    request
+                )
+            for request_group in request_group_dict.values():
+                try:
+                    self._run_batch(request_group)
+                except Exception as e:  # noqa
+                    # Never let the worker thread die, otherwise the callers will wait forever.
+                    for request in request_group:
+                        if not request.future.done():
+                            request.future.set_exception(e)
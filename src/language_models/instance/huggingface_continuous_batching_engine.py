@@ -0,0 +1,402 @@
+import atexit
+import collections
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Mapping, Optional, Sequence
+
+import torch
+from transformers import (  # type: ignore[import-untyped]
+    Cache,
+    DynamicCache,
+    GenerationConfig,
+    LogitsProcessorList,
+    PreTrainedModel,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+# The keys and values of every layer, in the shape of (batch_size, head_count, sequence_length, head_size). The legacy
+# format is used for the padding and the concatenation, since it is supported by all the models (e.g., GPT-2).
+LegacyCache = tuple[tuple[torch.Tensor, torch.Tensor], ...]
+
+
+class HuggingfaceContinuousBatchingRequest:
+    def __init__(
+        self,
+        input_ids: torch.Tensor,
+        generation_config: GenerationConfig,
+        model: PreTrainedModel,
+    ):
+        """
+        input_ids: The 1-D tensor (on CPU) of the prompt.
+        generation_config: model.generation_config updated by the inference config, see
+            HuggingfaceContinuousBatchingEngine.is_supported().
+        """
+        assert input_ids.dim() == 1
+        self.input_ids = input_ids
+        if generation_config.max_new_tokens is not None:
+            self.max_new_tokens = generation_config.max_new_tokens
+        else:
+            self.max_new_tokens = generation_config.max_length - input_ids.shape[0]
+        # The positions after max_position_embeddings cannot be computed.
+        self.max_new_tokens = min(
+            self.max_new_tokens,
+            model.config.max_position_embeddings - input_ids.shape[0],
+        )
+        eos_token_id = generation_config.eos_token_id
+        if eos_token_id is None:
+            self.eos_token_id_set = set()
+        elif isinstance(eos_token_id, int):
+            self.eos_token_id_set = {eos_token_id}
+        else:
+            self.eos_token_id_set = set(eos_token_id)
+        self.do_sample = generation_config.do_sample
+        self.logits_warper_list = LogitsProcessorList()
+        if self.do_sample:
+            # The same order as GenerationMixin._get_logits_warper().
+            if generation_config.temperature not in {None, 1.0}:
+                self.logits_warper_list.append(
+                    TemperatureLogitsWarper(generation_config.temperature)
+                )
+            if generation_config.top_k not in {None, 0}:
+                self.logits_warper_list.append(
+                    TopKLogitsWarper(generation_config.top_k)
+                )
+            if generation_config.top_p not in {None, 1.0}:
+                self.logits_warper_list.append(
+                    TopPLogitsWarper(generation_config.top_p)
+                )
+        self.output_token_id_list: list[int] = []
+        self.future: Future[list[int]] = Future()
+
+    def select_next_token(self, logits: torch.Tensor) -> None:
+        """
+        logits: The 1-D tensor of the logits of the next token.
+        """
+        if not self.do_sample:
+            next_token_id = int(torch.argmax(logits).item())
+        else:
+            scores = self.logits_warper_list(
+                self.input_ids.unsqueeze(0), logits.float().unsqueeze(0)
+            )
+            probability = torch.softmax(scores, dim=-1)
+            next_token_id = int(torch.multinomial(probability[0], 1).item())
+        self.output_token_id_list.append(next_token_id)
+
+    def is_finished(self) -> bool:
+        return (
+            len(self.output_token_id_list) >= self.max_new_tokens
+            or self.output_token_id_list[-1] in self.eos_token_id_set
+        )
+
+
+class HuggingfaceContinuousBatchingEngine:
+    """
+    Generate for the requests of all the callers with iteration-level (continuous) batching. generate() runs a static
+    batch until its longest sequence is finished, so the short outputs wait (as padding) for the long ones, and the new
+    requests wait for the whole batch. Here, the running sequences share one batch, and between two decode steps:
+    - The finished sequences are retired immediately, and their futures are resolved.
+    - The waiting requests are admitted into the free slots (up to max_batch_size). The prompt of a request is
+      prefilled alone, then its cache is left-padded and concatenated to the cache of the batch.
+    The leading columns that are padding in every row are trimmed after the retirement, so the batch does not keep the
+    length of a retired long sequence.
+    All the model calls are made in one worker thread, so LanguageModel.inference() can be called from many threads
+    (e.g., the concurrent sessions of SessionRunner), and their requests are generated together.
+    Only greedy decoding and sampling (temperature, top_k, top_p) are supported, see is_supported(). The check is made
+    on the inference config merged with model.generation_config.
+    """
+
+    # The attributes of GenerationConfig that are handled by the engine, or that do not change the generated tokens.
+    # The other attributes (e.g., repetition_penalty, min_new_tokens, bad_words_ids, num_beams) must keep their
+    # default values, otherwise the call falls back to generate().
+    SUPPORTED_GENERATION_CONFIG_ATTRIBUTE_SET = frozenset(
+        {
+            "max_new_tokens",
+            "max_length",
+            "do_sample",
+            "temperature",
+            "top_k",
+            "top_p",
+            "eos_token_id",
+            "pad_token_id",
+            "bos_token_id",
+            "decoder_start_token_id",
+            "use_cache",
+            "return_legacy_cache",
+            "transformers_version",
+            "_from_model_config",
+        }
+    )
+
+    def __init__(self, model: PreTrainedModel, max_batch_size: int):
+        assert max_batch_size > 0
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self._waiting_request_deque: collections.deque[
+            HuggingfaceContinuousBatchingRequest
+        ] = collections.deque()
+        self._condition = threading.Condition()
+        self._worker_thread: Optional[threading.Thread] = None
+        self._closed_flag = False
+        # The state of the running batch, only accessed by the worker thread.
+        self._running_request_list: list[HuggingfaceContinuousBatchingRequest] = []
+        self._past_key_values: Optional[LegacyCache] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+        # Whether the model accepts the Cache classes, it is found by the first model call. See _forward().
+        self._cache_class_flag: Optional[bool] = None
+        # For measuring the effect of the batching.
+        self.decode_step_count = 0
+        self.generated_token_count = 0
+
+    def _create_generation_config(
+        self, inference_config_dict: Mapping[str, Any]
+    ) -> tuple[GenerationConfig, dict[str, Any]]:
+        # The same as generate(): inference_config_dict overrides model.generation_config. The keys that are not the
+        # attributes of GenerationConfig (e.g., logits_processor, streamer) are returned as the second element.
+        generation_config = copy.deepcopy(self.model.generation_config)
+        unused_inference_config_dict = generation_config.update(**inference_config_dict)
+        return generation_config, unused_inference_config_dict
+
+    def is_supported(self, inference_config_dict: Mapping[str, Any]) -> bool:
+        """
+        Whether the generation of inference_config_dict only needs the features of the engine. The config merged with
+        model.generation_config is checked, since the generation config of the model may also set the features that
+        the engine does not support (e.g., repetition_penalty).
+        """
+        generation_config, unused_inference_config_dict = (
+            self._create_generation_config(inference_config_dict)
+        )
+        if len(unused_inference_config_dict) > 0:
+            return False
+        default_generation_config_dict = GenerationConfig().to_dict()
+        for attribute_name, value in generation_config.to_dict().items():
+            if (
+                attribute_name
+                in HuggingfaceContinuousBatchingEngine.SUPPORTED_GENERATION_CONFIG_ATTRIBUTE_SET
+            ):
+                continue
+            if value != default_generation_config_dict.get(attribute_name):
+                return False
+        return True
+
+    def submit(
+        self,
+        input_ids_list: Sequence[torch.Tensor],
+        inference_config_dict: Mapping[str, Any],
+    ) -> list["Future[list[int]]"]:
+        """
+        Return the futures of the generated token ids (without the prompt) of every input_ids (a 1-D tensor on CPU).
+        The requests are queued together, so they are admitted in the same step if there are enough free slots.
+        """
+        assert self.is_supported(inference_config_dict)
+        generation_config, _ = self._create_generation_config(inference_config_dict)
+        request_list = [
+            HuggingfaceContinuousBatchingRequest(
+                input_ids, generation_config, self.model
+            )
+            for input_ids in input_ids_list
+        ]
+        with self._condition:
+            assert not self._closed_flag
+            if self._worker_thread is None:
+                self._worker_thread = threading.Thread(
+                    target=self._work,
+                    name="huggingface_continuous_batching_engine",
+                    daemon=True,
+                )
+                self._worker_thread.start()
+                # A daemon thread that is still alive when the interpreter exits makes the threads of torch abort.
+                atexit.register(self.close)
+            self._waiting_request_deque.extend(request_list)
+            self._condition.notify()
+        return [request.future for request in request_list]
+
+    @staticmethod
+    def _pad_left(tensor: torch.Tensor, dim: int, length: int) -> torch.Tensor:
+        if length == 0:
+            return tensor
+        padding_shape = list(tensor.shape)
+        padding_shape[dim] = length
+        padding = torch.zeros(padding_shape, dtype=tensor.dtype, device=tensor.device)
+        return torch.cat([padding, tensor], dim=dim)
+
+    def _forward(
+        self, past_key_values: Optional[LegacyCache], **kwargs: Any
+    ) -> tuple[torch.Tensor, LegacyCache]:
+        # Passing the legacy format to the models that support Cache is deprecated.
+        if self._cache_class_flag is None:
+            # The first call is always a prefill. The models that only support the legacy format fail on an empty
+            # DynamicCache, then the call is made again without any cache.
+            assert past_key_values is None
+            try:
+                output = self.model(
+                    past_key_values=DynamicCache(), use_cache=True, **kwargs
+                )
+                self._cache_class_flag = isinstance(output.past_key_values, Cache)
+            except Exception:  # noqa
+                output = self.model(past_key_values=None, use_cache=True, **kwargs)
+                self._cache_class_flag = False
+        else:
+            model_past_key_values: Any = past_key_values
+            if self._cache_class_flag:
+                model_past_key_values = DynamicCache.from_legacy_cache(past_key_values)
+            output = self.model(
+                past_key_values=model_past_key_values, use_cache=True, **kwargs
+            )
+        if isinstance(output.past_key_values, Cache):
+            return output.logits, output.past_key_values.to_legacy_cache()
+        return output.logits, tuple(
+            (key, value) for key, value in output.past_key_values
+        )
+
+    def _admit(self, request: HuggingfaceContinuousBatchingRequest) -> None:
+        input_ids = request.input_ids.unsqueeze(0).to(self.model.device)
+        logits, past_key_values = self._forward(None, input_ids=input_ids)
+        request.select_next_token(logits[0, -1])
+        self.generated_token_count += 1
+        if request.is_finished():
+            request.future.set_result(request.output_token_id_list)
+            return
+        attention_mask = torch.ones_like(input_ids)
+        if self._past_key_values is None or self._attention_mask is None:
+            self._past_key_values, self._attention_mask = (
+                past_key_values,
+                attention_mask,
+            )
+        else:
+            length = max(self._attention_mask.shape[1], attention_mask.shape[1])
+            padding_length = length - self._attention_mask.shape[1]
+            new_padding_length = length - attention_mask.shape[1]
+            _pad_left = HuggingfaceContinuousBatchingEngine._pad_left
+            self._past_key_values = tuple(
+                (
+                    torch.cat(
+                        [
+                            _pad_left(key, 2, padding_length),
+                            _pad_left(new_key, 2, new_padding_length),
+                        ]
+                    ),
+                    torch.cat(
+                        [
+                            _pad_left(value, 2, padding_length),
+                            _pad_left(new_value, 2, new_padding_length),
+                        ]
+                    ),
+                )
+                for (key, value), (new_key, new_value) in zip(
+                    self._past_key_values, past_key_values
+                )
+            )
+            self._attention_mask = torch.cat(
+                [
+                    _pad_left(self._attention_mask, 1, padding_length),
+                    _pad_left(attention_mask, 1, new_padding_length),
+                ]
+            )
+        self._running_request_list.append(request)
+
+    def _step(self) -> None:
+        assert self._past_key_values is not None and self._attention_mask is not None
+        # The last generated token of every row is not in the cache yet.
+        input_ids = torch.tensor(
+            [
+                [request.output_token_id_list[-1]]
+                for request in self._running_request_list
+            ],
+            device=self.model.device,
+        )
+        # The padding is not counted in the positions.
+        position_ids = self._attention_mask.sum(dim=1, keepdim=True)
+        attention_mask = torch.cat(
+            [self._attention_mask, torch.ones_like(input_ids)], dim=1
+        )
+        logits, past_key_values = self._forward(
+            self._past_key_values,
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+        )
+        self.decode_step_count += 1
+        self.generated_token_count += len(self._running_request_list)
+        kept_index_list: list[int] = []
+        for index, request in enumerate(self._running_request_list):
+            request.select_next_token(logits[index, -1])
+            if request.is_finished():
+                request.future.set_result(request.output_token_id_list)
+            else:
+                kept_index_list.append(index)
+        if len(kept_index_list) == len(self._running_request_list):
+            self._past_key_values, self._attention_mask = (
+                past_key_values,
+                attention_mask,
+            )
+            return
+        self._running_request_list = [
+            self._running_request_list[index] for index in kept_index_list
+        ]
+        if len(kept_index_list) == 0:
+            self._past_key_values, self._attention_mask = None, None
+            return
+        kept_index_tensor = torch.tensor(kept_index_list, device=self.model.device)
+        attention_mask = attention_mask[kept_index_tensor]
+        # The columns before the first non-padding column are trimmed.
+        first_column_index = int(torch.nonzero(attention_mask.sum(dim=0))[0, 0].item())
+        self._attention_mask = attention_mask[:, first_column_index:]
+        self._past_key_values = tuple(
+            (
+                key[kept_index_tensor, :, first_column_index:],
+                value[kept_index_tensor, :, first_column_index:],
+            )
+            for key, value in past_key_values
+        )
+
+    def _reset(self, exception: Exception) -> None:
+        for request in self._running_request_list:
+            if not request.future.done():
+                request.future.set_exception(exception)
+        self._running_request_list = []
+        self._past_key_values, self._attention_mask = None, None
+
+    def close(self) -> None:
+        """
+        Stop the worker thread after the waiting and running requests are finished.
+        """
+        with self._condition:
+            self._closed_flag = True
+            self._condition.notify()
+            worker_thread = self._worker_thread
+        if worker_thread is not None:
+            worker_thread.join()
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while (
+                    len(self._waiting_request_deque) == 0
+                    and len(self._running_request_list) == 0
+                ):
+                    if self._closed_flag:
+                        return
+                    self._condition.wait()
+                admitted_request_list: list[HuggingfaceContinuousBatchingRequest] = []
+                while (
+                    len(self._waiting_request_deque) > 0
+                    and len(self._running_request_list) + len(admitted_request_list)
+                    < self.max_batch_size
+                ):
+                    admitted_request_list.append(self._waiting_request_deque.popleft())
+            try:
+                with torch.no_grad():
+                    for request in admitted_request_list:
+                        try:
+                            self._admit(request)
+                        except Exception as e:
+                            # The prompt of one request (e.g., an overlong one) should not fail the running batch.
+                            request.future.set_exception(e)
+                    if len(self._running_request_list) > 0:
+                        self._step()
+            except Exception as e:  # noqa
+                # Never let the worker thread die, otherwise the callers will wait forever.
+                self._reset(e)
@@ -0,0 +1,283 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import torch
+from transformers import DynamicCache  # type: ignore[import-untyped]
+
+
+class HuggingfaceKVCacheEntry:
+    def __init__(
+        self,
+        token_ids: torch.Tensor,
+        prompt_length: int,
+        past_key_values: DynamicCache,
+        shared_flag: bool,
+    ):
+        """
+        token_ids: The 1-D tensor (on CPU) of the tokens whose keys and values are stored in past_key_values.
+        prompt_length: The length of the prompt in token_ids, the rest is the output.
+        shared_flag: Whether the entry is a prompt prefix shared by the sessions (e.g., the system prompt and the task
+            requirement), rather than the cache of a session. A shared entry is only copied, never taken out.
+        """
+        assert token_ids.dim() == 1
+        assert token_ids.shape[0] == past_key_values.get_seq_length()
+        self.token_ids = token_ids
+        self.prompt_length = prompt_length
+        self.past_key_values = past_key_values
+        self.shared_flag = shared_flag
+        # The hashes of the prefixes that end at the block boundaries, see HuggingfaceKVCachePool.
+        self.prefix_hash_list = HuggingfaceKVCachePool.get_prefix_hash_list(token_ids)
+        self.size = sum(
+            key.nelement() * key.element_size()
+            + value.nelement() * value.element_size()
+            for key, value in zip(
+                past_key_values.key_cache, past_key_values.value_cache
+            )
+        )
+
+
+class HuggingfaceKVCachePool:
+    """
+    The KV cache of the sessions, kept across rounds. LanguageModel does not know which session a chat history belongs
+    to, so the entry of a session is found by the tokens: The chat history of the next round starts with the prompt
+    and the output of the previous round, so the entry with the longest common prefix is used, and only the remaining
+    tokens are prefilled.
+    - If the new prompt starts with the whole prompt of an entry, the entry belongs to the same session. It is taken
+      out of the pool (and cropped to the common prefix, since the output may be tokenized differently after it is
+      decoded), and the entry of the new round is put back after the generation.
+    - An entry that is only partially matched (e.g., the other sessions with the same system prompt) is copied up to
+      the common prefix, so that it is still available for its own session. If the common prefix has at least
+      min_shared_prefix_length tokens, it is also kept as a shared entry, so that the prefix outlives the session it
+      is copied from. On a tie, the shared entries are preferred.
+    - The shared prefix of a batch can be added by put_shared_prefix() before the generation, so that its keys and
+      values are computed once instead of once per chat history.
+    - The entry of a finished session is removed by release(). The entries are also evicted in the least recently used
+      order when the total size exceeds max_size_mb. The shared entries are used by every new session, so they stay
+      recent.
+    The entries are indexed by the hashes of their prefixes at every PREFIX_BLOCK_SIZE tokens, so finding the entry
+    only compares the tokens with the entries that share the longest indexed prefix, instead of all the entries. The
+    common prefixes shorter than PREFIX_BLOCK_SIZE tokens are not reused.
+    The pool is thread-safe, so that release() can be called from the thread of the session.
+    """
+
+    PREFIX_BLOCK_SIZE = 16
+
+    def __init__(self, max_size_mb: float, min_shared_prefix_length: int = 16):
+        assert max_size_mb > 0 and min_shared_prefix_length > 0
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.min_shared_prefix_length = min_shared_prefix_length
+        self.size = 0
+        # Ordered from the least recently used to the most recently used.
+        self._entry_dict: OrderedDict[int, HuggingfaceKVCacheEntry] = OrderedDict()
+        self._next_entry_id = 0
+        # The hash of a prefix -> the ids of the entries that start with the prefix.
+        self._prefix_entry_id_set_dict: dict[int, set[int]] = {}
+        self._lock = threading.Lock()
+        # The prefilled tokens, for measuring the effect of the cache.
+        self.reused_token_count = 0
+        self.computed_token_count = 0
+
+    def __len__(self) -> int:
+        return len(self._entry_dict)
+
+    @staticmethod
+    def get_common_prefix_length(
+        token_ids_1: torch.Tensor, token_ids_2: torch.Tensor
+    ) -> int:
+        length = min(token_ids_1.shape[0], token_ids_2.shape[0])
+        mismatch_index_tensor = torch.nonzero(
+            token_ids_1[:length] != token_ids_2[:length]
+        )
+        if mismatch_index_tensor.shape[0] == 0:
+            return length
+        return int(mismatch_index_tensor[0, 0].item())
+
+    @staticmethod
+    def get_prefix_hash_list(token_ids: torch.Tensor) -> list[int]:
+        """
+        Return the hashes of token_ids[:PREFIX_BLOCK_SIZE], token_ids[:2 * PREFIX_BLOCK_SIZE], ... The hash of a prefix
+        is chained from the hash of the previous one, so that the cost is linear in the length of token_ids.
+        """
+        block_size = HuggingfaceKVCachePool.PREFIX_BLOCK_SIZE
+        token_id_list = token_ids.tolist()
+        prefix_hash_list: list[int] = []
+        prefix_hash = 0
+        for start_index in range(0, len(token_id_list) - block_size + 1, block_size):
+            prefix_hash = hash(
+                (
+                    prefix_hash,
+                    tuple(token_id_list[start_index : start_index + block_size]),
+                )
+            )
+            prefix_hash_list.append(prefix_hash)
+        return prefix_hash_list
+
+    def _find_entry(self, token_ids: torch.Tensor) -> tuple[Optional[int], int]:
+        """
+        Return the id of the entry with the longest common prefix and the length of the prefix.
+        An entry that starts with a longer indexed prefix of token_ids always has a longer common prefix, so only the
+        entries of the longest indexed prefix are compared.
+        """
+        candidate_entry_id_set: set[int] = set()
+        for prefix_hash in HuggingfaceKVCachePool.get_prefix_hash_list(token_ids):
+            entry_id_set = self._prefix_entry_id_set_dict.get(prefix_hash)
+            if entry_id_set is None:
+                break
+            candidate_entry_id_set = entry_id_set
+        best_entry_id: Optional[int] = None
+        best_key = (0, False)
+        for entry_id in candidate_entry_id_set:
+            entry = self._entry_dict[entry_id]
+            prefix_length = HuggingfaceKVCachePool.get_common_prefix_length(
+                entry.token_ids, token_ids
+            )
+            if prefix_length > 0 and (prefix_length, entry.shared_flag) > best_key:
+                best_entry_id, best_key = entry_id, (prefix_length, entry.shared_flag)
+        return best_entry_id, best_key[0]
+
+    @staticmethod
+    def _copy_past_key_values(
+        past_key_values: DynamicCache, length: int
+    ) -> DynamicCache:
+        return DynamicCache.from_legacy_cache(
+            tuple(
+                (key[..., :length, :].clone(), value[..., :length, :].clone())
+                for key, value in zip(
+                    past_key_values.key_cache, past_key_values.value_cache
+                )
+            )
+        )
+
+    def get_cached_prefix_length(self, token_ids: torch.Tensor) -> int:
+        with self._lock:
+            return self._find_entry(token_ids)[1]
+
+    def acquire(self, token_ids: torch.Tensor) -> DynamicCache:
+        """
+        Return the cache for generating from token_ids (a 1-D tensor on CPU). The cache may be empty, and it always
+        leaves at least one token to be prefilled, since the logits of the last token are needed.
+        """
+        with self._lock:
+            return self._acquire(token_ids)
+
+    def _acquire(self, token_ids: torch.Tensor) -> DynamicCache:
+        best_entry_id, best_prefix_length = self._find_entry(token_ids)
+        best_prefix_length = min(best_prefix_length, token_ids.shape[0] - 1)
+        self.reused_token_count += best_prefix_length
+        self.computed_token_count += token_ids.shape[0] - best_prefix_length
+        if best_entry_id is None or best_prefix_length == 0:
+            return DynamicCache()
+        entry = self._entry_dict[best_entry_id]
+        if not entry.shared_flag and best_prefix_length >= entry.prompt_length:
+            # The entry belongs to the session, take it out.
+            self._remove_entry(best_entry_id)
+            entry.past_key_values.crop(best_prefix_length)
+            return entry.past_key_values
+        self._entry_dict.move_to_end(best_entry_id)
+        if (
+            not entry.shared_flag
+            and best_prefix_length >= self.min_shared_prefix_length
+        ):
+            self._add_entry(
+                HuggingfaceKVCacheEntry(
+                    token_ids[:best_prefix_length],
+                    best_prefix_length,
+                    HuggingfaceKVCachePool._copy_past_key_values(
+                        entry.past_key_values, best_prefix_length
+                    ),
+                    shared_flag=True,
+                )
+            )
+        return HuggingfaceKVCachePool._copy_past_key_values(
+            entry.past_key_values, best_prefix_length
+        )
+
+    def put(
+        self, token_ids: torch.Tensor, prompt_length: int, past_key_values: DynamicCache
+    ) -> None:
+        entry = HuggingfaceKVCacheEntry(
+            token_ids, prompt_length, past_key_values, shared_flag=False
+        )
+        with self._lock:
+            self._add_entry(entry)
+
+    def release(self, token_ids: torch.Tensor, shared_prefix_length: int = 0) -> None:
+        """
+        Remove the entry of the finished session whose chat history is token_ids. The chat history starts with the
+        prompt of the last round, in the same way as the prompt of the next round is matched by acquire().
+        shared_prefix_length: The length of the prefix of token_ids that is shared by the other sessions (e.g., the
+            task requirement). It is kept as a shared entry if it is not in the pool yet, so that the next session can
+            still copy it.
+        """
+        with self._lock:
+            while True:
+                best_entry_id, best_prefix_length = self._find_entry(token_ids)
+                if best_entry_id is None:
+                    return
+                entry = self._entry_dict[best_entry_id]
+                if entry.shared_flag or best_prefix_length < entry.prompt_length:
+                    return
+                shared_prefix_length = min(shared_prefix_length, best_prefix_length)
+                shared_entry: Optional[HuggingfaceKVCacheEntry] = None
+                if shared_prefix_length >= self.min_shared_prefix_length:
+                    # On a tie, _find_entry() prefers the shared entries.
+                    cached_entry_id, cached_prefix_length = self._find_entry(
+                        token_ids[:shared_prefix_length]
+                    )
+                    assert cached_entry_id is not None
+                    if (
+                        not self._entry_dict[cached_entry_id].shared_flag
+                        or cached_prefix_length < shared_prefix_length
+                    ):
+                        shared_entry = HuggingfaceKVCacheEntry(
+                            token_ids[:shared_prefix_length],
+                            shared_prefix_length,
+                            HuggingfaceKVCachePool._copy_past_key_values(
+                                entry.past_key_values, shared_prefix_length
+                            ),
+                            shared_flag=True,
+                        )
+                self._remove_entry(best_entry_id)
+                if shared_entry is not None:
+                    self._add_entry(shared_entry)
+
+    def put_shared_prefix(
+        self, token_ids: torch.Tensor, past_key_values: DynamicCache
+    ) -> None:
+        """
+        The keys and values of token_ids are computed by the caller, they are counted as computed tokens.
+        """
+        entry = HuggingfaceKVCacheEntry(
+            token_ids, token_ids.shape[0], past_key_values, shared_flag=True
+        )
+        with self._lock:
+            self.computed_token_count += token_ids.shape[0]
+            self._add_entry(entry)
+
+    def _add_entry(self, entry: HuggingfaceKVCacheEntry) -> None:
+        if entry.size > self.max_size:
+            return
+        entry_id = self._next_entry_id
+        self._next_entry_id += 1
+        self._entry_dict[entry_id] = entry
+        for prefix_hash in entry.prefix_hash_list:
+            self._prefix_entry_id_set_dict.setdefault(prefix_hash, set()).add(entry_id)
+        self.size += entry.size
+        while self.size > self.max_size:
+            self._remove_entry(next(iter(self._entry_dict)))
+
+    def _remove_entry(self, entry_id: int) -> None:
+        entry = self._entry_dict.pop(entry_id)
+        self.size -= entry.size
+        for prefix_hash in entry.prefix_hash_list:
+            entry_id_set = self._prefix_entry_id_set_dict[prefix_hash]
+            entry_id_set.discard(entry_id)
+            if len(entry_id_set) == 0:
+                del self._prefix_entry_id_set_dict[prefix_hash]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entry_dict.clear()
+            self._prefix_entry_id_set_dict.clear()
+            self.size = 0
@@ -1,10 +1,14 @@
 import torch
 import os
-from typing import Any, Optional, Mapping, Sequence
-from transformers import AutoModelForCausalLM, AutoTokenizer  # type: ignore[import-untyped]
+import threading
+from typing import Any, NoReturn, Optional, Mapping, Sequence
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache  # type: ignore[import-untyped]
 import niuload  # type: ignore[import-untyped]
 
 from src.language_models.language_model import LanguageModel
+from .huggingface_kv_cache_pool import HuggingfaceKVCachePool
+from .huggingface_continuous_batching_engine import HuggingfaceContinuousBatchingEngine
+from src.utils import SafeLogger
 from src.typings import (
     Role,
     ChatHistoryItem,
@@ -21,6 +25,8 @@ class HuggingfaceLanguageModel(LanguageModel):
         role_dict: Mapping[str, str],
         dtype: torch.dtype | str = torch.bfloat16,
         device_map: str | Mapping[str, Any] = "auto",
+        max_kv_cache_size_mb: Optional[float] = None,
+        continuous_batching_max_batch_size: Optional[int] = None,
     ):
         """
         Config explanations
@@ -28,7 +34,32 @@ class HuggingfaceLanguageModel(LanguageModel):
         device_map: I cannot find the detail documents.
             But it seems that it can be set to "cuda" or {"": "cuda"} to use GPU.
             Set "auto" can use multiple GPUs. (Amazing!)
+        max_kv_cache_size_mb: If it is set, the KV cache of every session is kept across rounds (up to the size), so
+            that only the new tokens of the chat history are prefilled. See HuggingfaceKVCachePool. The prompt prefix
+            shared by the sessions (e.g., the system prompt and the task requirement) is computed once and copied into
+            every generation. The cache of a session is released when the session is finished, see
+            release_chat_history().
+            Trade-off: The chat histories in a batch are generated one by one with the pool, since their cached
+            lengths are different. So the pool saves the prefill of the long chat histories, but it gives up the
+            batching (e.g., the batches of BatchInferenceScheduler), which matters more for short chat histories.
+        continuous_batching_max_batch_size: If it is set, the chat histories are generated by
+            HuggingfaceContinuousBatchingEngine with up to this number of sequences at a time. The requests of
+            concurrent calls (e.g., from the concurrent sessions) join the running batch between decode steps, and
+            every chat history returns as soon as its own output is finished. The inference configs that the engine
+            does not support (e.g., beam search, or repetition_penalty in the generation config of the model) fall back
+            to generate().
+            If max_kv_cache_size_mb is set as well, the engine handles the calls it supports without the pool (the
+            engine does not reuse the caches of the sessions), and the pool is only used for the calls that fall back.
         """
+        if (
+            max_kv_cache_size_mb is not None
+            and continuous_batching_max_batch_size is not None
+        ):
+            SafeLogger.warning(
+                "Both max_kv_cache_size_mb and continuous_batching_max_batch_size are set. The KV cache of the "
+                "sessions is not reused by HuggingfaceContinuousBatchingEngine, it is only used for the inference "
+                "configs that the engine does not support."
+            )
         super().__init__(role_dict)
         self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
         if device_map == "niuload":
@@ -39,6 +70,53 @@ class HuggingfaceLanguageModel(LanguageModel):
         self.model = AutoModelForCausalLM.from_pretrained(
             model_name_or_path, device_map=device_map, torch_dtype=dtype
         )
+        self.kv_cache_pool: Optional[HuggingfaceKVCachePool] = None
+        if max_kv_cache_size_mb is not None:
+            self.kv_cache_pool = HuggingfaceKVCachePool(max_kv_cache_size_mb)
+        self.continuous_batching_engine: Optional[
+            HuggingfaceContinuousBatchingEngine
+        ] = None
+        if continuous_batching_max_batch_size is not None:
+            self.continuous_batching_engine = HuggingfaceContinuousBatchingEngine(
+                self.model, continuous_batching_max_batch_size
+            )
+        # The calls that are not handled by the engine modify the tokenizer or the pool, so they are run one at a time.
+        self._generation_lock = threading.Lock()
+
+    def release_chat_history(
+        self,
+        chat_history: ChatHistory,
+        system_prompt: str = "You are a helpful assistant.",
+    ) -> None:
+        if self.kv_cache_pool is None:
+            return
+        message_list_prefix: list[Mapping[str, str]] = []
+        if len(system_prompt) > 0:
+            message_list_prefix = [{"role": "system", "content": system_prompt}]
+        message_list = message_list_prefix + self._convert_chat_history_to_message_list(
+            chat_history
+        )
+        # The chat history of the finished session starts with the prompt of its last round.
+        token_ids: torch.Tensor = self.tokenizer.apply_chat_template(
+            message_list, tokenize=True, return_tensors="pt"
+        )
+        # The first message (e.g., the task requirement) is the same for all the sessions of the task.
+        shared_prefix_length = 0
+        if len(message_list) > len(message_list_prefix):
+            shared_prefix_length = len(
+                self.tokenizer.apply_chat_template(
+                    message_list[: len(message_list_prefix) + 1], tokenize=True
+                )
+            )
+        self.kv_cache_pool.release(token_ids[0], shared_prefix_length)
+
+    def supports_concurrent_inference(self) -> bool:
+        # The concurrent calls join the running batch of the engine.
+        return self.continuous_batching_engine is not None
+
+    def supports_batch_inference(self) -> bool:
+        # The pool generates the chat histories of a batch one by one, see __init__().
+        return self.kv_cache_pool is None or self.continuous_batching_engine is not None
 
     def _convert_message_list_to_model_input_dict(
         self, batch_message_list: Sequence[Sequence[Mapping[str, str]]]
@@ -82,6 +160,109 @@ class HuggingfaceLanguageModel(LanguageModel):
                 return True
         return False
 
+    def _generate(self, input_ids: torch.Tensor, **kwargs: Any) -> Any:
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        try:
+            return self.model.generate(
+                input_ids,
+                pad_token_id=self.tokenizer.eos_token_id,  # Mute warning
+                **kwargs,
+            )
+        except Exception as e:
+            self._handle_generation_exception(e)
+        finally:
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+
+    def _handle_generation_exception(self, e: Exception) -> NoReturn:
+        if (
+            isinstance(e, torch.cuda.OutOfMemoryError)
+            or HuggingfaceLanguageModel._is_any_gpu_memory_high()
+        ):
+            if self.kv_cache_pool is not None:
+                self.kv_cache_pool.clear()
+            torch.cuda.empty_cache()
+            raise LanguageModelOutOfMemoryException(str(e)) from e
+        else:
+            raise e
+
+    def _tokenize_message_list(
+        self, message_list: Sequence[Mapping[str, str]]
+    ) -> torch.Tensor:
+        input_ids: torch.Tensor = self.tokenizer.apply_chat_template(
+            message_list,
+            tokenize=True,
+            add_generation_prompt=True,
+            return_tensors="pt",
+        )
+        self._check_context_limit(input_ids)
+        return input_ids
+
+    def _check_context_limit(self, input_ids: torch.Tensor) -> None:
+        if input_ids.shape[-1] >= self.model.config.max_position_embeddings:
+            raise LanguageModelContextLimitException(
+                f"Input length {input_ids.shape[-1]} exceeds the model's max_position_embeddings "
+                f"{self.model.config.max_position_embeddings}."
+            )
+
+    def _prefill_shared_prefix(self, input_ids_list: Sequence[torch.Tensor]) -> None:
+        """
+        Compute the keys and values of the longest common prefix of the batch once, and add it to the pool, so that
+        every chat history in the batch copies it instead of prefilling it again. The chat histories are generated one
+        by one, since the left padding of a batched generate() shifts the prefix to different positions.
+        """
+        assert self.kv_cache_pool is not None
+        if len(input_ids_list) < 2:
+            return
+        prefix_length = min(input_ids.shape[1] for input_ids in input_ids_list) - 1
+        for input_ids in input_ids_list[1:]:
+            prefix_length = HuggingfaceKVCachePool.get_common_prefix_length(
+                input_ids_list[0][0, :prefix_length], input_ids[0, :prefix_length]
+            )
+        prefix_token_ids = input_ids_list[0][0, :prefix_length]
+        if (
+            prefix_length < self.kv_cache_pool.min_shared_prefix_length
+            or self.kv_cache_pool.get_cached_prefix_length(prefix_token_ids)
+            == prefix_length
+        ):
+            return
+        with torch.no_grad():
+            output = self.model(
+                prefix_token_ids.unsqueeze(0).to(self.model.device),
+                past_key_values=DynamicCache(),
+                use_cache=True,
+            )
+        self.kv_cache_pool.put_shared_prefix(prefix_token_ids, output.past_key_values)
+
+    def _inference_with_kv_cache(
+        self,
+        input_ids: torch.Tensor,
+        inference_config_dict: Mapping[str, Any],
+    ) -> str:
+        assert self.kv_cache_pool is not None
+        # The cached tokens are skipped by generate() according to the length of past_key_values.
+        past_key_values = self.kv_cache_pool.acquire(input_ids[0])
+        input_ids = input_ids.to(self.model.device)
+        output = self._generate(
+            input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past_key_values,
+            return_dict_in_generate=True,
+            **inference_config_dict,
+        )
+        # The last generated token is not fed into the model, so it is not in the cache.
+        cached_token_count = output.past_key_values.get_seq_length()
+        self.kv_cache_pool.put(
+            output.sequences[0, :cached_token_count].cpu(),
+            input_ids.shape[1],
+            output.past_key_values,
+        )
+        output_str: str = self.tokenizer.decode(
+            output.sequences[0, input_ids.shape[1] :], skip_special_tokens=True
+        )
+        return output_str
+
     def _inference(
         self,
         batch_chat_history: Sequence[ChatHistory],
@@ -113,12 +294,6 @@ class HuggingfaceLanguageModel(LanguageModel):
             https://huggingface.co/docs/transformers/v4.47.1/en/main_classes/text_generation#transformers.GenerationConfig
             https://huggingface.co/docs/transformers/v4.47.1/en/main_classes/text_generation#transformers.GenerationMixin
         """
-        # region Set the tokenizer attributes to realize correct padding
-        original_tokenizer_padding_side = self.tokenizer.padding_side
-        original_tokenizer_pad_token = self.tokenizer.pad_token
-        self.tokenizer.padding_side = "left"
-        self.tokenizer.pad_token = self.tokenizer.eos_token
-        # endregion
         # region Construct batch_message_list
         message_list_prefix: list[Mapping[str, str]]
         if len(system_prompt) > 0:
@@ -131,51 +306,91 @@ class HuggingfaceLanguageModel(LanguageModel):
             for chat_history in batch_chat_history
         ]
         # endregion
-        # region Generate output
-        model_input_dict: Mapping[str, torch.Tensor] = (
-            self._convert_message_list_to_model_input_dict(batch_message_list)
-        )
-        batch_input_ids, batch_attention_mask = (
-            model_input_dict["batch_input_ids"],
-            model_input_dict["batch_attention_mask"],
-        )
-        del model_input_dict
-        if batch_input_ids.shape[-1] >= self.model.config.max_position_embeddings:
-            raise LanguageModelContextLimitException(
-                f"Input length {batch_input_ids.shape[-1]} exceeds the model's max_position_embeddings "
-                f"{self.model.config.max_position_embeddings}."
+        if (
+            self.continuous_batching_engine is not None
+            and self.continuous_batching_engine.is_supported(inference_config_dict)
+        ):
+            # The tokenizer is not modified in this branch, since it can be called from many threads.
+            future_list = self.continuous_batching_engine.submit(
+                [
+                    self._tokenize_message_list(message_list)[0]
+                    for message_list in batch_message_list
+                ],
+                inference_config_dict,
             )
-        torch.cuda.synchronize()
-        try:
-            output_tensor: torch.Tensor = self.model.generate(
+            continuous_batching_output_list: list[ChatHistoryItem] = []
+            for future in future_list:
+                try:
+                    output_token_id_list = future.result()
+                except Exception as e:
+                    self._handle_generation_exception(e)
+                continuous_batching_output_list.append(
+                    ChatHistoryItem(
+                        role=Role.AGENT,
+                        content=self.tokenizer.decode(
+                            output_token_id_list, skip_special_tokens=True
+                        ),
+                    )
+                )
+            return continuous_batching_output_list
+        if (
+            self.kv_cache_pool is not None
+            and inference_config_dict.get("num_beams", 1) == 1
+            and inference_config_dict.get("num_return_sequences", 1) == 1
+        ):
+            # The cache of a session holds one sequence, so beam search is run without it.
+            input_ids_list: Sequence[torch.Tensor] = [
+                self._tokenize_message_list(message_list)
+                for message_list in batch_message_list
+            ]
+            # The calls may be concurrent if the engine is set (see supports_concurrent_inference()), but the prefill
+            # and generate() on the model and the entries taken out of the pool are not shared between the calls.
+            with self._generation_lock:
+                self._prefill_shared_prefix(input_ids_list)
+                cached_output_list = [
+                    ChatHistoryItem(
+                        role=Role.AGENT,
+                        content=self._inference_with_kv_cache(
+                            input_ids, inference_config_dict
+                        ),
+                    )
+                    for input_ids in input_ids_list
+                ]
+            return cached_output_list
+        with self._generation_lock:
+            # region Set the tokenizer attributes to realize correct padding
+            original_tokenizer_padding_side = self.tokenizer.padding_side
+            original_tokenizer_pad_token = self.tokenizer.pad_token
+            self.tokenizer.padding_side = "left"
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+            # endregion
+            # region Generate output
+            model_input_dict: Mapping[str, torch.Tensor] = (
+                self._convert_message_list_to_model_input_dict(batch_message_list)
+            )
+            batch_input_ids, batch_attention_mask = (
+                model_input_dict["batch_input_ids"],
+                model_input_dict["batch_attention_mask"],
+            )
+            del model_input_dict
+            self._check_context_limit(batch_input_ids)
+            output_tensor: torch.Tensor = self._generate(
                 batch_input_ids,
                 attention_mask=batch_attention_mask,
-                pad_token_id=self.tokenizer.eos_token_id,  # Mute warning
                 **inference_config_dict,
             )
-        except Exception as e:
-            if (
-                isinstance(e, torch.cuda.OutOfMemoryError)
-                or HuggingfaceLanguageModel._is_any_gpu_memory_high()
-            ):
-                torch.cuda.empty_cache()
-                raise LanguageModelOutOfMemoryException(str(e)) from e
-            else:
-                raise e
-        finally:
-            torch.cuda.synchronize()
-        # endregion
-        # region Convert output to ChatHistoryItem
-        output_str_list: Sequence[str] = self.tokenizer.batch_decode(
-            output_tensor[:, batch_input_ids.shape[1] :], skip_special_tokens=True
-        )
-        output_list: Sequence[ChatHistoryItem] = [
-            ChatHistoryItem(role=Role.AGENT, content=output_str)
-            for output_str in output_str_list
-        ]
-        # endregion
-        # region Reset the tokenizer attributes
-        self.tokenizer.padding_side = original_tokenizer_padding_side
-        self.tokenizer.pad_token = original_tokenizer_pad_token
-        # endregion
-        return output_list
+            # endregion
+            # region Convert output to ChatHistoryItem
+            output_str_list: Sequence[str] = self.tokenizer.batch_decode(
+                output_tensor[:, batch_input_ids.shape[1] :], skip_special_tokens=True
+            )
+            output_list: Sequence[ChatHistoryItem] = [
+                ChatHistoryItem(role=Role.AGENT, content=output_str)
+                for output_str in output_str_list
+            ]
+            # endregion
+            # region Reset the tokenizer attributes
+            self.tokenizer.padding_side = original_tokenizer_padding_side
+            self.tokenizer.pad_token = original_tokenizer_pad_token
+            # endregion
+            return output_list
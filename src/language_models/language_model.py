@@ -20,8 +20,7 @@ class LanguageModel(ABC):
         self, chat_history: ChatHistory
     ) -> list[Mapping[str, str]]:
         message_list: list[Mapping[str, str]] = []
-        for item_index in range(chat_history.get_value_length()):
-            chat_history_item = chat_history.get_item_deep_copy(item_index)
+        for chat_history_item in chat_history.get_value_view():
             message_list.append(
                 {
                     "role": self.role_dict[chat_history_item.role],
@@ -38,7 +37,7 @@ class LanguageModel(ABC):
         system_prompt: str = "You are a helpful assistant.",
     ) -> Sequence[ChatHistoryItem]:
         for chat_history in batch_chat_history:
-            assert chat_history.get_item_deep_copy(-1).role == Role.USER
+            assert chat_history.get_item(-1).role == Role.USER
         try:
             if inference_config_dict is None:
                 inference_config_dict = {}
@@ -51,6 +50,25 @@ class LanguageModel(ABC):
             raise LanguageModelUnknownException(str(e)) from e
         return inference_result
 
+    def release_chat_history(
+        self,
+        chat_history: ChatHistory,
+        system_prompt: str = "You are a helpful assistant.",
+    ) -> None:
+        # Called when the session of chat_history is finished, so that the resources kept for it (e.g., the KV cache)
+        # can be released. system_prompt is the one used by the inference of the session.
+        pass
+
+    def supports_concurrent_inference(self) -> bool:
+        # Return True only if _inference() can be called by multiple threads at the same time, e.g., the language model
+        # merges the concurrent calls into its own batches.
+        return False
+
+    def supports_batch_inference(self) -> bool:
+        # Return False if the chat histories of a batch are generated one by one, so merging the calls into batches
+        # (e.g., by BatchInferenceScheduler) only adds the waiting time.
+        return True
+
     @abstractmethod
     def _inference(
         self,
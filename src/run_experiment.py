@@ -1,5 +1,7 @@
 import argparse
+import importlib
 import json
+import multiprocessing
 import os
 import yaml
 import copy
@@ -7,18 +9,15 @@ from enum import StrEnum
 from typing import Any, Mapping, Sequence, Optional
 import coredumpy  # type: ignore[import-untyped]
 
-from src.utils import ConfigLoader, SingletonLogger
+from src.utils import ConfigLoader, SingletonLogger, SessionLog, Tracer
 from src.typings import (
     AssignmentConfig,
     EnvironmentConfig,
-    SampleStatus,
     LoggerConfig,
     ContinualAgentBenchException,
-    Session,
     SampleIndex,
     PathConfig,
     GeneralInstanceFactory,
-    SessionMetricCalculationPartial,
 )
 from src.tasks import Task, DatasetItem
 from src.agents import Agent
@@ -28,8 +27,8 @@ from src.callbacks import (
     CallbackConstructor,
     Callback,
     CallbackRestorer,
-    CallbackArguments,
 )
+from src.runners import SessionRunner, SampleOrderScheduler
 
 
 class ConfigUtilityCaller(StrEnum):
@@ -80,14 +79,104 @@ class ConfigUtility:
         )
         return task, agent, callback_dict
 
-    def validate(self, task: Task[DatasetItem], agent: Agent) -> None:
+    def validate(
+        self,
+        task: Task[DatasetItem],
+        agent: Agent,
+        callback_dict: Mapping[str, Callback],
+    ) -> None:
         sample_index_list = task.get_sample_index_list()
         for selected_sample_index in self.assignment_config.sample_order:
             assert selected_sample_index in sample_index_list
+        assert self.assignment_config.concurrent_session_count > 0
+        if self.assignment_config.concurrent_session_count > 1:
+            # The concurrent sessions are created before the sessions admitted earlier are completed.
+            for callback_id, callback in callback_dict.items():
+                assert not callback.is_previous_session_dependent(), (
+                    f"Callback {callback_id} depends on the previous sessions, "
+                    f"it cannot be used when concurrent_session_count > 1."
+                )
+        self.validate_sharding()
+
+    def validate_sharding(self) -> None:
+        """
+        Called by validate() in each shard, and by run_sharded_assignment() before the shards are started.
+        """
+        assert self.assignment_config.shard_count > 0
+        if self.assignment_config.shard_index is not None:
+            assert (
+                0
+                <= self.assignment_config.shard_index
+                < self.assignment_config.shard_count
+            )
+        if self.assignment_config.shard_count > 1:
+            # The TaskServer is shared by the shards, and the tasks of a TaskServer are released by the first
+            # finished shard.
+            assert (
+                not self.environment_config.task_client
+            ), "task_client cannot be used when shard_count > 1."
+
+    def construct_task_list(self, task: Task[DatasetItem]) -> list[Task[DatasetItem]]:
+        """
+        Construct the task pool used by SessionRunner. The first task is the one returned by construct(), which is
+        also referenced by the callbacks.
+        GeneralInstanceFactory.create() replaces the parameters with the created instances, so the other tasks share
+        the chat_history_item_factory with the first task. But each task owns its own environment (e.g., container).
+        Sharing the factory is safe since the callbacks that modify it (PreviousSampleUtilizationCallback) are
+        rejected by validate() when there is more than one task.
+        """
+        task_list: list[Task[DatasetItem]] = [task]
+        for _ in range(self.assignment_config.concurrent_session_count - 1):
+            task_list.append(self.assignment_config.task.create())
+        return task_list
 
     def postprocess(self, task: Task[DatasetItem], agent: Agent) -> None:
         if self.assignment_config.sample_order == "default":
             self.assignment_config.sample_order = task.get_sample_index_list()
+        elif self.assignment_config.sample_order == "cost_aware":
+            self.assignment_config.sample_order = self._get_cost_aware_sample_order(
+                task
+            )
+        if (shard_index := self.assignment_config.shard_index) is not None:
+            # The samples are assigned to the shards in a round-robin manner, so that the samples with similar cost
+            # (neighbors in sample_order) are spread over the shards.
+            self.assignment_config.sample_order = list(
+                self.assignment_config.sample_order[
+                    shard_index :: self.assignment_config.shard_count
+                ]
+            )
+
+    def _get_cost_aware_sample_order(
+        self, task: Task[DatasetItem]
+    ) -> list[SampleIndex]:
+        sample_order_output_path = self.path_config.sample_order_output_path
+        if os.path.exists(sample_order_output_path):
+            # Restore the order of the previous incomplete assignment. The cost is not calculated again, since the
+            # reference assignment may have changed.
+            sample_order: list[SampleIndex] = json.load(
+                open(sample_order_output_path, "r")
+            )
+            return sample_order
+        reference_round_count_dict: dict[SampleIndex, int] = {}
+        if (
+            reference_output_dir := self.assignment_config.sample_cost_reference_dir
+        ) is not None:
+            reference_round_count_dict = (
+                SampleOrderScheduler.get_reference_round_count_dict(
+                    reference_output_dir
+                )
+            )
+        sample_order = SampleOrderScheduler.get_cost_aware_sample_order(
+            task.get_sample_index_list(),
+            task.get_estimated_sample_cost_dict(),
+            reference_round_count_dict,
+        )
+        # Record the order, so that the assignment can be reproduced by setting sample_order to the content of the file.
+        json.dump(
+            sample_order,
+            open(sample_order_output_path, "w"),  # noqa
+        )
+        return sample_order
 
     def remove_redundant_args(self, raw_config: dict[str, Any]) -> dict[str, Any]:
         # Maybe use `if raw_config["environment_config"]["use_task_client_flag"]` is better, but I use the following
@@ -127,6 +216,39 @@ class ConfigUtility:
             del raw_config[info_tuple[0]][info_tuple[1]]
         return raw_config
 
+    def save_raw_config(self, raw_config: dict[str, Any]) -> None:
+        cleaned_config = self.remove_redundant_args(raw_config)
+        config_output_path = self.path_config.config_output_path
+        if os.path.exists(config_output_path):
+            config_from_disk = yaml.safe_load(open(config_output_path, "r"))
+            assert ConfigUtility.is_raw_config_equal(config_from_disk, cleaned_config)
+            # The config file already exists, so we don't need to write it again.
+        else:
+            # Write the config file to the output directory.
+            config_output_dir = os.path.dirname(config_output_path)
+            if not os.path.exists(config_output_dir):
+                os.makedirs(config_output_dir)
+            yaml.dump(
+                cleaned_config,
+                open(config_output_path, "w"),
+            )
+
+    def get_shard_raw_config(
+        self, raw_config: Mapping[str, Any], shard_index: int
+    ) -> dict[str, Any]:
+        # The output_dir of the shard is resolved (no {TIMESTAMP}), so that all the shards share the same parent dir.
+        shard_raw_config = copy.deepcopy(dict(raw_config))
+        shard_raw_config["assignment_config"]["output_dir"] = self.get_shard_output_dir(
+            shard_index
+        )
+        shard_raw_config["assignment_config"]["shard_index"] = shard_index
+        return shard_raw_config
+
+    def get_shard_output_dir(self, shard_index: int) -> str:
+        return os.path.join(
+            self.assignment_config.output_dir, "shards", f"shard_{shard_index}"
+        )
+
     @staticmethod
     def _get_custom_instance_info_dict(
         default_instance_info_dict: Mapping[str, Any],
@@ -208,6 +330,21 @@ class ConfigUtility:
             output_dir=raw_config["assignment_config"]["output_dir"],
             sample_order=raw_config["assignment_config"]["sample_order"],
             callback_dict=assignment_callback_dict,
+            concurrent_session_count=raw_config["assignment_config"].get(
+                "concurrent_session_count", 1
+            ),
+            shard_count=raw_config["assignment_config"].get("shard_count", 1),
+            shard_index=raw_config["assignment_config"].get("shard_index"),
+            tracing_flag=raw_config["assignment_config"].get("tracing_flag", False),
+            round_checkpoint_flag=raw_config["assignment_config"].get(
+                "round_checkpoint_flag", False
+            ),
+            retry_budget_per_sample=raw_config["assignment_config"].get(
+                "retry_budget_per_sample"
+            ),
+            sample_cost_reference_dir=raw_config["assignment_config"].get(
+                "sample_cost_reference_dir"
+            ),
         )
         # endregion
         # region Convert raw_config into environment_config
@@ -271,12 +408,26 @@ class ConfigUtility:
             session_list_output_path=os.path.join(
                 assignment_config.output_dir, "runs.json"
             ),
+            session_log_path=os.path.join(assignment_config.output_dir, "runs.jsonl"),
+            session_log_index_path=os.path.join(
+                assignment_config.output_dir, "runs.index.jsonl"
+            ),
             metric_output_path=os.path.join(
                 assignment_config.output_dir, "metric.json"
             ),
+            metric_counter_output_path=os.path.join(
+                assignment_config.output_dir, "metric_counter.json"
+            ),
             coredumpy_output_dir=os.path.join(
                 assignment_config.output_dir, "coredumpy"
             ),
+            trace_output_path=os.path.join(assignment_config.output_dir, "trace.json"),
+            sample_order_output_path=os.path.join(
+                assignment_config.output_dir, "sample_order.json"
+            ),
+            session_checkpoint_dir=os.path.join(
+                assignment_config.output_dir, "session_checkpoint"
+            ),
         )
         # endregion
         return assignment_config, environment_config, logger_config, path_config
@@ -294,12 +445,8 @@ class ConfigUtility:
         )
 
 
-def main() -> None:
+def run_assignment(raw_config: dict[str, Any]) -> None:
     # region Prepare variables
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--config_path", type=str)
-    args = parser.parse_args()
-    raw_config = ConfigLoader().load_from(args.config_path)
     assignment_config, environment_config, logger_config, path_config = (
         ConfigUtility.read_raw_config(raw_config, ConfigUtilityCaller.CLIENT)
     )
@@ -307,55 +454,48 @@ def main() -> None:
     config_utility = ConfigUtility(assignment_config, environment_config, path_config)
     # endregion
     # region write raw_config to disk
-    cleaned_config = config_utility.remove_redundant_args(raw_config)
-    config_output_path = path_config.config_output_path
-    if os.path.exists(config_output_path):
-        config_from_disk = yaml.safe_load(open(config_output_path, "r"))
-        assert ConfigUtility.is_raw_config_equal(config_from_disk, cleaned_config)
-        # The config file already exists, so we don't need to write it again.
-    else:
-        # Write the config file to the output directory.
-        config_output_dir = os.path.dirname(config_output_path)
-        if not os.path.exists(config_output_dir):
-            os.makedirs(config_output_dir)
-        yaml.dump(
-            cleaned_config,
-            open(config_output_path, "w"),
-        )
+    config_utility.save_raw_config(raw_config)
     # endregion
     # region Initialize logger, Set coredumpy output dir
     logger = SingletonLogger.get_instance(logger_config)
     coredumpy.patch_except(directory=path_config.coredumpy_output_dir)
+    if assignment_config.tracing_flag:
+        Tracer.enable()
     # endregion
     # region Construct variable, valid config
     config_utility.preprocess()
     task, agent, callback_dict = config_utility.construct()
     config_utility.postprocess(task, agent)
-    config_utility.validate(task, agent)
+    config_utility.validate(task, agent, callback_dict)
+    task_list = config_utility.construct_task_list(task)
     ContinualAgentBenchException.set_record_file(path_config.exception_record_file_path)
     # endregion
     # region Determine whether to start a new assignment or restore the previous incomplete assignment, based on
-    # whether the config file exists.
+    # whether the session log is empty.
     session_list_output_path = path_config.session_list_output_path
     assert isinstance(assignment_config.sample_order, list)
-    session_list: list[Session]
+    session_log_exist_flag = os.path.exists(path_config.session_log_index_path)
+    session_log = SessionLog(
+        path_config.session_log_path, path_config.session_log_index_path
+    )
+    if not session_log_exist_flag and os.path.exists(session_list_output_path):
+        # The previous incomplete assignment is written by the version without the session log.
+        logger.info(f"Convert {session_list_output_path} to the session log.")
+        session_log.import_legacy(session_list_output_path)
     unfinished_sample_order: list[SampleIndex]
-    if os.path.exists(session_list_output_path):
+    if session_log.get_session_count() > 0:
         # At least one session exists, so we restore the previous incomplete assignment.
-        session_list = [
-            Session.model_validate(session_info_dict)
-            for session_info_dict in json.load(open(session_list_output_path, "r"))
-        ]
+        # Only the index of the session log is read. The sessions are read from the disk when they are accessed.
+        completed_sample_index_set = session_log.get_completed_sample_index_set()
         unfinished_sample_order = [
             sample_index
             for sample_index in assignment_config.sample_order
-            if all(session.sample_index != sample_index for session in session_list)
+            if sample_index not in completed_sample_index_set
         ]
         # Previous session may change the state of the callback, restore it here.
         CallbackRestorer.restore(callback_dict)
     else:
         # Start a new assignment.
-        session_list = []
         unfinished_sample_order = assignment_config.sample_order
     callback_handler = CallbackHandler(callback_dict)
     # endregion
@@ -363,63 +503,195 @@ def main() -> None:
     logger.info(
         f"Experiment start. "
         f"Total sample count: {len(assignment_config.sample_order)}. "
-        f"Unfinished sample count: {len(unfinished_sample_order)}."
+        f"Unfinished sample count: {len(unfinished_sample_order)}. "
+        f"Concurrent session count: {len(task_list)}."
     )
-    for sample_index in unfinished_sample_order:
-        # region Initialize session
-        session = Session(task_name=task.task_name, sample_index=sample_index)
-        callback_args = CallbackArguments(
-            current_session=session, task=task, agent=agent, session_list=session_list
-        )
-        callback_handler.on_session_create(callback_args)
-        if callback_args.session_controller.should_task_reset:
-            task.reset(session)
-            callback_handler.on_task_reset(callback_args)
-        logger.info(f"Sample {sample_index} start.")
-        # endregion
-        # region Run session
-        while session.sample_status == SampleStatus.RUNNING:
-            if callback_args.session_controller.should_agent_inference:
-                agent.inference(session)
-                callback_handler.on_agent_inference(callback_args)
-            if callback_args.session_controller.should_task_interact:
-                task.interact(session)
-                callback_handler.on_task_interact(callback_args)
-        # endregion
-        # region Complete session
-        if callback_args.session_controller.should_task_complete:
-            task.complete(session)
-            callback_handler.on_task_complete(callback_args)
-        session_list.append(session)
+    session_runner = SessionRunner(
+        task_list=task_list,
+        agent=agent,
+        callback_handler=callback_handler,
+        session_log=session_log,
+        session_checkpoint_dir=(
+            path_config.session_checkpoint_dir
+            if assignment_config.round_checkpoint_flag
+            else None
+        ),
+        retry_budget_per_sample=assignment_config.retry_budget_per_sample,
+    )
+    try:
+        session_runner.run(unfinished_sample_order)
+    finally:
+        # Save the trace even if the assignment is interrupted, since it helps to find the reason.
+        if Tracer.is_enabled():
+            Tracer.save(path_config.trace_output_path)
+    session_log.close()
+    # Export the legacy runs.json for the downstream tools.
+    session_log.export(session_list_output_path)
+    # endregion
+    # region Evaluate
+    # The metric is calculated from the counters of the aggregator, which are updated after every session.
+    session_metric_aggregator = session_log.get_session_metric_aggregator()
+    metric = task.calculate_metric(session_metric_aggregator)
+    if assignment_config.shard_index is not None:
+        # Used by run_sharded_assignment() to calculate the metric of all the shards.
         json.dump(
-            [s.model_dump() for s in session_list],
-            open(session_list_output_path, "w"),  # noqa
+            session_metric_aggregator.get_dataset_counter_dict(),
+            open(path_config.metric_counter_output_path, "w"),  # noqa
             indent=2,
         )
-        logger.info(
-            f"Sample {sample_index} end. Session status: {session.sample_status}. "
-            f"Evaluation outcome: {session.evaluation_record.outcome}."
+    logger.info(
+        f"Experiment end. Metric: {metric}. Total sample count: {len(assignment_config.sample_order)}.",
+    )
+    json.dump(
+        metric,
+        open(path_config.metric_output_path, "w"),  # noqa
+        indent=2,
+    )
+    logger.info(f"Metric file has been saved to {assignment_config.output_dir}.")
+    # endregion
+    # region Release
+    for task in task_list:
+        task.release()
+    # endregion
+
+
+def run_sharded_assignment(raw_config: dict[str, Any]) -> None:
+    """
+    Split the sample_order into shard_count shards, and run each shard by run_assignment() in its own process. Each
+    shard constructs its own task, agent and callbacks, and writes its outputs to output_dir/shards/shard_{i}.
+    After all the shards are finished, the session logs and the callback states of the shards are merged into
+    output_dir, and the metric is calculated once over all the sessions.
+    Restoring a sharded assignment restores each shard.
+    """
+    # region Prepare variables
+    assignment_config, environment_config, logger_config, path_config = (
+        ConfigUtility.read_raw_config(raw_config, ConfigUtilityCaller.CLIENT)
+    )
+    config_utility = ConfigUtility(assignment_config, environment_config, path_config)
+    config_utility.validate_sharding()
+    shard_count = assignment_config.shard_count
+    shard_raw_config_list = [
+        config_utility.get_shard_raw_config(raw_config, shard_index)
+        for shard_index in range(shard_count)
+    ]
+    config_utility.save_raw_config(raw_config)
+    logger = SingletonLogger.get_instance(logger_config)
+    # endregion
+    # region Run shards
+    logger.info(f"Sharded experiment start. Shard count: {shard_count}.")
+    # Use spawn instead of fork, since the shards may use CUDA.
+    multiprocessing_context = multiprocessing.get_context("spawn")
+    process_list = [
+        multiprocessing_context.Process(
+            target=run_assignment,
+            args=(shard_raw_config,),
+            name=f"shard_{shard_index}",
+        )
+        for shard_index, shard_raw_config in enumerate(shard_raw_config_list)
+    ]
+    for process in process_list:
+        process.start()
+    for process in process_list:
+        process.join()
+    failed_shard_name_list = [
+        process.name for process in process_list if process.exitcode != 0
+    ]
+    if len(failed_shard_name_list) > 0:
+        raise RuntimeError(
+            f"Shards {failed_shard_name_list} failed. Check the logs in their output_dir, "
+            f"and run the same config again to restore them."
+        )
+    # endregion
+    # region Merge the session logs
+    # The shards are interleaved in the same way as they are split, so the merged log follows sample_order.
+    # The merged log is rebuilt from the shards every time.
+    for merged_path in [
+        path_config.session_log_path,
+        path_config.session_log_index_path,
+    ]:
+        if os.path.exists(merged_path):
+            os.remove(merged_path)
+    session_log = SessionLog(
+        path_config.session_log_path, path_config.session_log_index_path
+    )
+    shard_session_iterator_list = []
+    for shard_index in range(shard_count):
+        shard_output_dir = config_utility.get_shard_output_dir(shard_index)
+        shard_session_log = SessionLog(
+            os.path.join(
+                shard_output_dir, os.path.basename(path_config.session_log_path)
+            ),
+            os.path.join(
+                shard_output_dir, os.path.basename(path_config.session_log_index_path)
+            ),
+        )
+        shard_session_log.close()
+        shard_session_iterator_list.append(shard_session_log.iterate_session())
+    while len(shard_session_iterator_list) > 0:
+        active_shard_session_iterator_list = []
+        for shard_session_iterator in shard_session_iterator_list:
+            if (session := next(shard_session_iterator, None)) is not None:
+                session_log.append(session)
+                active_shard_session_iterator_list.append(shard_session_iterator)
+        shard_session_iterator_list = active_shard_session_iterator_list
+    session_log.close()
+    session_log.export(path_config.session_list_output_path)
+    # endregion
+    # region Merge the traces
+    if assignment_config.tracing_flag:
+        Tracer.merge(
+            [
+                os.path.join(
+                    config_utility.get_shard_output_dir(shard_index),
+                    os.path.basename(path_config.trace_output_path),
+                )
+                for shard_index in range(shard_count)
+            ],
+            path_config.trace_output_path,
+        )
+    # endregion
+    # region Merge the callback states
+    for callback_id, callback_factory in assignment_config.callback_dict.items():
+        module_path, class_name = callback_factory.module.rsplit(".", 1)
+        callback_class: type[Callback] = getattr(
+            importlib.import_module(module_path), class_name
+        )
+        callback_class.merge_state(
+            [
+                os.path.join(
+                    config_utility.get_shard_output_dir(shard_index),
+                    "callback_state",
+                    callback_id,
+                )
+                for shard_index in range(shard_count)
+            ],
+            os.path.join(assignment_config.output_dir, "callback_state", callback_id),
         )
-        # endregion
-        # region Save callback state
-        # The state of callback will be used to restore the previous incomplete assignment.
-        callback_handler.on_state_save(callback_args)
-        # endregion
     # endregion
     # region Evaluate
-    session_metric_calculation_partial_list: Sequence[
-        SessionMetricCalculationPartial
-    ] = [
-        SessionMetricCalculationPartial(
-            sample_index=session.sample_index,
-            evaluation_record=session.evaluation_record,
-            sample_status=session.sample_status,
+    # The dataset counters are merged from the shards, so the task is not constructed, which may start the
+    # environment (e.g., the container of DBBench) only to calculate the metric.
+    session_metric_aggregator = session_log.get_session_metric_aggregator()
+    for shard_index in range(shard_count):
+        session_metric_aggregator.merge_dataset_counter_dict(
+            json.load(
+                open(
+                    os.path.join(
+                        config_utility.get_shard_output_dir(shard_index),
+                        os.path.basename(path_config.metric_counter_output_path),
+                    )
+                )
+            )
         )
-        for session in session_list
-    ]
-    metric = task.calculate_metric(session_metric_calculation_partial_list)
+    task_module_path, task_class_name = assignment_config.task.module.rsplit(".", 1)
+    task_class: type[Task[DatasetItem]] = getattr(
+        importlib.import_module(task_module_path), task_class_name
+    )
+    metric = task_class.create_metric_calculator().calculate_metric(
+        session_metric_aggregator
+    )
     logger.info(
-        f"Experiment end. Metric: {metric}. Total sample count: {len(assignment_config.sample_order)}.",
+        f"Sharded experiment end. Metric: {metric}. Session count: {session_log.get_session_count()}.",
     )
     json.dump(
         metric,
@@ -428,9 +700,17 @@ def main() -> None:
     )
     logger.info(f"Metric file has been saved to {assignment_config.output_dir}.")
     # endregion
-    # region Release
-    task.release()
-    # endregion
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config_path", type=str)
+    args = parser.parse_args()
+    raw_config = ConfigLoader().load_from(args.config_path)
+    if raw_config["assignment_config"].get("shard_count", 1) > 1:
+        run_sharded_assignment(raw_config)
+    else:
+        run_assignment(raw_config)
 
 
 if __name__ == "__main__":
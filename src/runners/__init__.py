@@ -0,0 +1,2 @@
+from .session_runner import SessionRunner
+from .sample_order_scheduler import SampleOrderScheduler
@@ -0,0 +1,94 @@
+import json
+import os
+from typing import Any, Iterator, Mapping, Sequence
+
+from src.typings import SampleIndex, Role
+
+
+class SampleOrderScheduler:
+    """
+    Order the samples by their cost, from the most expensive to the cheapest (longest processing time first). When the
+    samples are run concurrently by SessionRunner, or split into shards in a round-robin manner, the expensive samples
+    are started first, so that the assignment does not end with a few long sessions running alone.
+    The cost of a sample is its round count in the reference assignment (a previous run of the same task) if it exists.
+    Otherwise, the cost is estimated by DatasetItem.get_estimated_cost(), and scaled to the unit of the round count by
+    the samples that exist in both.
+    """
+
+    @staticmethod
+    def _iterate_reference_session_dict(
+        reference_output_dir: str,
+    ) -> Iterator[dict[str, Any]]:
+        # Do not open the session log by SessionLog, since it truncates the incomplete tail of the log.
+        session_log_path = os.path.join(reference_output_dir, "runs.jsonl")
+        if os.path.exists(session_log_path):
+            with open(session_log_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    session_dict: dict[str, Any] = json.loads(line)
+                    yield session_dict
+            return
+        # The reference assignment is written by the version without the session log.
+        session_dict_list: list[dict[str, Any]] = (
+            json.load(open(os.path.join(reference_output_dir, "runs.json"), "r")) or []
+        )
+        yield from session_dict_list
+
+    @staticmethod
+    def get_reference_round_count_dict(
+        reference_output_dir: str,
+    ) -> dict[SampleIndex, int]:
+        # The round count is approximated by the number of the agent responses in the chat history.
+        reference_round_count_dict: dict[SampleIndex, int] = {}
+        for session_dict in SampleOrderScheduler._iterate_reference_session_dict(
+            reference_output_dir
+        ):
+            reference_round_count_dict[session_dict["sample_index"]] = len(
+                [
+                    chat_history_item
+                    for chat_history_item in session_dict["chat_history"]["value"]
+                    if chat_history_item["role"] == Role.AGENT
+                ]
+            )
+        return reference_round_count_dict
+
+    @staticmethod
+    def get_cost_aware_sample_order(
+        sample_index_list: Sequence[SampleIndex],
+        estimated_sample_cost_dict: Mapping[SampleIndex, float],
+        reference_round_count_dict: Mapping[SampleIndex, int],
+    ) -> list[SampleIndex]:
+        # region Scale the estimated cost to the unit of the round count
+        shared_sample_index_list = [
+            sample_index
+            for sample_index in sample_index_list
+            if sample_index in reference_round_count_dict
+        ]
+        estimated_cost_sum = sum(
+            estimated_sample_cost_dict[sample_index]
+            for sample_index in shared_sample_index_list
+        )
+        reference_round_count_sum = sum(
+            reference_round_count_dict[sample_index]
+            for sample_index in shared_sample_index_list
+        )
+        if estimated_cost_sum > 0 and reference_round_count_sum > 0:
+            scale = reference_round_count_sum / estimated_cost_sum
+        else:
+            scale = 1.0
+        # endregion
+        sample_cost_dict: dict[SampleIndex, float] = {}
+        for sample_index in sample_index_list:
+            if sample_index in reference_round_count_dict:
+                sample_cost_dict[sample_index] = reference_round_count_dict[
+                    sample_index
+                ]
+            else:
+                sample_cost_dict[sample_index] = (
+                    estimated_sample_cost_dict[sample_index] * scale
+                )
+        # sorted() is stable, so the samples with the same cost keep the order of sample_index_list.
+        return sorted(
+            sample_index_list, key=lambda sample_index: -sample_cost_dict[sample_index]
+        )
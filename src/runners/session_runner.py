@@ -0,0 +1,348 @@
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Generator, Optional, Sequence
+
+from src.tasks import Task, DatasetItem
+from src.agents import Agent
+from src.callbacks import CallbackHandler, CallbackArguments
+from src.typings import Session, SampleIndex, SampleStatus
+from src.utils import SafeLogger, SessionLog, RetryBudget
+
+
+class SessionStep:
+    def __init__(
+        self,
+        action: Callable[[], None],
+        callback_event: Callable[[CallbackArguments], None],
+        inference_flag: bool = False,
+    ):
+        """
+        action: The blocking work of the step, such as Task.interact() or Agent.inference(). It may be executed in a
+            worker thread.
+        callback_event: The method of CallbackHandler that is called after the action is finished. It is always
+            called in the main thread.
+        inference_flag: Whether the action calls the agent. Such actions are executed in the shared inference queue
+            instead of the worker of the session.
+        """
+        self.action = action
+        self.callback_event = callback_event
+        self.inference_flag = inference_flag
+
+
+class SessionSlot:
+    def __init__(
+        self,
+        admission_index: int,
+        task: Task[DatasetItem],
+        callback_args: CallbackArguments,
+        step_generator: Generator[SessionStep, None, None],
+        retry_budget: Optional[RetryBudget] = None,
+    ):
+        self.admission_index = admission_index
+        self.task = task
+        self.callback_args = callback_args
+        self.step_generator = step_generator
+        self.retry_budget = retry_budget
+        self.pending_step: Optional[SessionStep] = None
+
+    def advance(self) -> bool:
+        """
+        Move to the next step of the session. Return False if the session is finished.
+        """
+        self.pending_step = next(self.step_generator, None)
+        if self.pending_step is None:
+            return False
+        if self.retry_budget is not None:
+            # The retries in the action are charged to the budget of the session.
+            action = self.pending_step.action
+            retry_budget = self.retry_budget
+            self.pending_step.action = lambda: retry_budget.run(action)
+        return True
+
+
+class SessionRunner:
+    """
+    Run the sessions of the assignment. The loop of each session is:
+        reset -> (inference -> interact) * n -> complete
+    When more than one task is provided, the runner keeps len(task_list) sessions in flight. Each session owns one task
+    until it is completed, so the tasks must not share the environment (e.g. each DBBench owns its container).
+    Each session is advanced as its own pipeline: The task steps (reset, interact, complete) run in the worker of the
+    session, and the inference steps are sent to a shared inference queue. The queue has one worker, unless
+    Agent.supports_concurrent_inference() is True. There is no barrier between the sessions, a session submits its
+    next step as soon as the callback events of its previous step are dispatched. The callback events are dispatched in
+    the main thread. For each session, they follow the same order as the original serial loop, but the events of
+    different sessions are interleaved in the order of completion. Finished sessions are committed in the order of
+    admission, so the order of session_list is the same as running the sessions one by one.
+    However, a session is created before the sessions admitted earlier are completed, so the callbacks that depend on
+    the previous sessions (see Callback.is_previous_session_dependent()) must not be used with more than one task.
+    When only one task is provided, the steps are executed in the main thread, and the order of the callback events is
+    exactly the same as the original serial loop.
+    If session_checkpoint_dir is provided, the running session is saved to the directory after every round. When a
+    session with a checkpoint is admitted, Task.replay() is called instead of Task.reset(), and the session continues
+    from the last completed round.
+    If retry_budget_per_sample is provided, the retries of the calls made by each session (e.g., the requests of
+    TaskClient) stop once they have waited for retry_budget_per_sample seconds in total. See RetryBudget.
+    """
+
+    def __init__(
+        self,
+        task_list: Sequence[Task[DatasetItem]],
+        agent: Agent,
+        callback_handler: CallbackHandler,
+        session_log: SessionLog,
+        session_checkpoint_dir: Optional[str] = None,
+        retry_budget_per_sample: Optional[float] = None,
+    ):
+        assert len(task_list) > 0
+        self.task_list = task_list
+        self.agent = agent
+        self.callback_handler = callback_handler
+        self.session_log = session_log
+        # The finished sessions are provided to the callbacks lazily, see SessionLogSessionSequence.
+        self.session_sequence = session_log.get_session_sequence()
+        self.session_checkpoint_dir = session_checkpoint_dir
+        if session_checkpoint_dir is not None and not os.path.exists(
+            session_checkpoint_dir
+        ):
+            os.makedirs(session_checkpoint_dir)
+        self.retry_budget_per_sample = retry_budget_per_sample
+
+    def _get_session_checkpoint_path(self, sample_index: SampleIndex) -> str:
+        assert self.session_checkpoint_dir is not None
+        return os.path.join(self.session_checkpoint_dir, f"{sample_index}.json")
+
+    def _save_session_checkpoint(self, session: Session) -> None:
+        checkpoint_path = self._get_session_checkpoint_path(session.sample_index)
+        # Write to a temporary file first, so that the checkpoint is never torn.
+        temp_checkpoint_path = f"{checkpoint_path}.tmp"
+        with open(temp_checkpoint_path, "w") as f:
+            f.write(session.model_dump_json())
+        os.replace(temp_checkpoint_path, checkpoint_path)
+
+    def _load_session_checkpoint(self, sample_index: SampleIndex) -> Optional[Session]:
+        if self.session_checkpoint_dir is None:
+            return None
+        checkpoint_path = self._get_session_checkpoint_path(sample_index)
+        if not os.path.exists(checkpoint_path):
+            return None
+        with open(checkpoint_path, "r") as f:
+            return Session.model_validate_json(f.read())
+
+    def _remove_session_checkpoint(self, sample_index: SampleIndex) -> None:
+        if self.session_checkpoint_dir is None:
+            return
+        checkpoint_path = self._get_session_checkpoint_path(sample_index)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    @staticmethod
+    def _replay(
+        task: Task[DatasetItem], session: Session, checkpoint_session: Session
+    ) -> None:
+        SafeLogger.info(
+            f"Sample {session.sample_index} is restored from the round checkpoint. "
+            f"Chat history length: {checkpoint_session.chat_history.get_value_length()}."
+        )
+        session.__dict__.update(checkpoint_session.__dict__)  # In-place update
+        task.replay(session)
+
+    def _generate_step(
+        self, task: Task[DatasetItem], callback_args: CallbackArguments
+    ) -> Generator[SessionStep, None, None]:
+        # The generator checks the session controller lazily, since the callbacks of the previous step may change it.
+        session = callback_args.current_session
+        session_controller = callback_args.session_controller
+        if session_controller.should_task_reset:
+            checkpoint_session = self._load_session_checkpoint(session.sample_index)
+            if checkpoint_session is not None:
+                # For the callbacks, the replay is the same as the reset: The session is ready for the inference.
+                yield SessionStep(
+                    lambda: SessionRunner._replay(task, session, checkpoint_session),
+                    self.callback_handler.on_task_reset,
+                )
+            else:
+                yield SessionStep(
+                    lambda: task.reset(session), self.callback_handler.on_task_reset
+                )
+        while session.sample_status == SampleStatus.RUNNING:
+            if session_controller.should_agent_inference:
+                yield SessionStep(
+                    lambda: self.agent.inference(session),
+                    self.callback_handler.on_agent_inference,
+                    inference_flag=True,
+                )
+            if session_controller.should_task_interact:
+                yield SessionStep(
+                    lambda: task.interact(session),
+                    self.callback_handler.on_task_interact,
+                )
+                if (
+                    self.session_checkpoint_dir is not None
+                    and session.sample_status == SampleStatus.RUNNING
+                ):
+                    # The round is completed, and the callbacks of the round are dispatched.
+                    self._save_session_checkpoint(session)
+        if session_controller.should_task_complete:
+            yield SessionStep(
+                lambda: task.complete(session), self.callback_handler.on_task_complete
+            )
+
+    def _admit(
+        self, admission_index: int, sample_index: SampleIndex, task: Task[DatasetItem]
+    ) -> SessionSlot:
+        session = Session(task_name=task.task_name, sample_index=sample_index)
+        callback_args = CallbackArguments(
+            current_session=session,
+            task=task,
+            agent=self.agent,
+            session_list=self.session_sequence,
+        )
+        self.callback_handler.on_session_create(callback_args)
+        SafeLogger.info(f"Sample {sample_index} start.")
+        session_slot = SessionSlot(
+            admission_index=admission_index,
+            task=task,
+            callback_args=callback_args,
+            step_generator=self._generate_step(task, callback_args),
+            retry_budget=(
+                RetryBudget(self.retry_budget_per_sample)
+                if self.retry_budget_per_sample is not None
+                else None
+            ),
+        )
+        return session_slot
+
+    def _commit(self, session_slot: SessionSlot) -> None:
+        session = session_slot.callback_args.current_session
+        self.agent.release_session(session)
+        self.session_log.append(session)
+        self._remove_session_checkpoint(session.sample_index)
+        session_metric_aggregator = self.session_log.get_session_metric_aggregator()
+        SafeLogger.info(
+            f"Sample {session.sample_index} end. Session status: {session.sample_status}. "
+            f"Evaluation outcome: {session.evaluation_record.outcome}. "
+            f"Correct count: {session_metric_aggregator.get_correct_count()}/{len(session_metric_aggregator)}."
+        )
+        # The state of callback will be used to restore the previous incomplete assignment.
+        self.callback_handler.on_state_save(session_slot.callback_args)
+
+    def _commit_in_order(
+        self, finished_session_slot_dict: dict[int, SessionSlot], commit_count: int
+    ) -> int:
+        # A finished session waits in finished_session_slot_dict until all the sessions admitted before it are
+        # committed.
+        while commit_count in finished_session_slot_dict:
+            self._commit(finished_session_slot_dict.pop(commit_count))
+            commit_count += 1
+        return commit_count
+
+    @staticmethod
+    def _submit_step(
+        session_slot: SessionSlot,
+        task_executor: ThreadPoolExecutor,
+        inference_executor: ThreadPoolExecutor,
+    ) -> Future[None]:
+        assert session_slot.pending_step is not None
+        executor = (
+            inference_executor
+            if session_slot.pending_step.inference_flag
+            else task_executor
+        )
+        return executor.submit(session_slot.pending_step.action)
+
+    def _run_serially(self, sample_order: Sequence[SampleIndex]) -> None:
+        # The same as the original serial loop, all the steps are executed in the main thread.
+        task = self.task_list[0]
+        for admission_index, sample_index in enumerate(sample_order):
+            session_slot = self._admit(admission_index, sample_index, task)
+            while session_slot.advance():
+                assert session_slot.pending_step is not None
+                session_slot.pending_step.action()
+                session_slot.pending_step.callback_event(session_slot.callback_args)
+            self._commit(session_slot)
+
+    def run(self, sample_order: Sequence[SampleIndex]) -> None:
+        if len(self.task_list) == 1:
+            self._run_serially(sample_order)
+            return
+        pending_sample_index_queue = deque(sample_order)
+        free_task_list = list(self.task_list)
+        # Every active session has exactly one step in flight.
+        session_slot_future_dict: dict[Future[None], SessionSlot] = {}
+        finished_session_slot_dict: dict[int, SessionSlot] = {}
+        admission_count = 0
+        commit_count = 0
+        # Every session owns one task, so the task steps never wait for each other.
+        task_executor = ThreadPoolExecutor(
+            max_workers=len(self.task_list), thread_name_prefix="session_runner_task"
+        )
+        # The agent (and the language model behind it) is not expected to be thread-safe, unless it says so.
+        inference_executor = ThreadPoolExecutor(
+            max_workers=(
+                len(self.task_list) if self.agent.supports_concurrent_inference() else 1
+            ),
+            thread_name_prefix="session_runner_inference",
+        )
+        try:
+            while (
+                len(pending_sample_index_queue) > 0 or len(session_slot_future_dict) > 0
+            ):
+                # region Admit new sessions
+                while len(pending_sample_index_queue) > 0 and len(free_task_list) > 0:
+                    session_slot = self._admit(
+                        admission_count,
+                        pending_sample_index_queue.popleft(),
+                        free_task_list.pop(0),
+                    )
+                    admission_count += 1
+                    if session_slot.advance():
+                        session_slot_future_dict[
+                            SessionRunner._submit_step(
+                                session_slot, task_executor, inference_executor
+                            )
+                        ] = session_slot
+                    else:
+                        # The session is finished without any step, e.g., it is aborted by a callback.
+                        free_task_list.append(session_slot.task)
+                        finished_session_slot_dict[session_slot.admission_index] = (
+                            session_slot
+                        )
+                        commit_count = self._commit_in_order(
+                            finished_session_slot_dict, commit_count
+                        )
+                if len(session_slot_future_dict) == 0:
+                    continue
+                # endregion
+                # region Wait for any step, dispatch its callback event and submit the next step of its session
+                done_future_set, _ = wait(
+                    session_slot_future_dict.keys(), return_when=FIRST_COMPLETED
+                )
+                # The steps finished at the same time are handled in the order of admission.
+                for future in sorted(
+                    done_future_set,
+                    key=lambda f: session_slot_future_dict[f].admission_index,
+                ):
+                    session_slot = session_slot_future_dict.pop(future)
+                    # Re-raise the exception of the step (if any) in the main thread.
+                    future.result()
+                    assert session_slot.pending_step is not None
+                    session_slot.pending_step.callback_event(session_slot.callback_args)
+                    if session_slot.advance():
+                        session_slot_future_dict[
+                            SessionRunner._submit_step(
+                                session_slot, task_executor, inference_executor
+                            )
+                        ] = session_slot
+                    else:
+                        free_task_list.append(session_slot.task)
+                        finished_session_slot_dict[session_slot.admission_index] = (
+                            session_slot
+                        )
+                # endregion
+                commit_count = self._commit_in_order(
+                    finished_session_slot_dict, commit_count
+                )
+        finally:
+            task_executor.shutdown(wait=True, cancel_futures=True)
+            inference_executor.shutdown(wait=True, cancel_futures=True)
@@ -1,21 +1,74 @@
-from typing import Sequence
+import uuid
+from typing import ClassVar, Sequence
 
 from src.typings import (
     TaskResponse,
     TaskRequest,
     Session,
+    SessionDelta,
     SampleIndex,
     MetricDict,
     SessionMetricCalculationPartial,
+    HttpUnknownException,
 )
-from src.utils import Client
+from src.utils import Client, Tracer, SafeLogger
 from .task import TaskInterface
 
 
 class TaskClient(Client, TaskInterface):
-    def __init__(self, server_address: str, request_timeout: int):
+    cached_attribute_name_set: ClassVar[frozenset[str]] = frozenset(
+        {"task_name", "max_round", "chat_history_item_factory"}
+    )
+    # If session_delta_flag is True, reset(), interact() and complete() only send the change of the session since the
+    # last request, and the server only returns the change made by the task. See SessionDelta.
+    session_delta_flag: bool = True
+
+    def __init__(
+        self,
+        server_address: str,
+        request_timeout: int,
+        session_delta_flag: bool = True,
+    ):
         Client.__init__(
-            self, server_address=server_address, request_timeout=request_timeout
+            self,
+            server_address=server_address,
+            request_timeout=request_timeout,
+            session_delta_flag=session_delta_flag,
+        )
+        # Client.__setattr__() sets the attribute on the server, so __dict__ is used for the client-side states.
+        # _synced_chat_history_item_tuple is the chat history of the session held by the server.
+        self.__dict__["_session_id"] = ""
+        self.__dict__["_synced_chat_history_item_tuple"] = ()
+
+    def _call_server_with_session_delta(self, api: str, session: Session) -> None:
+        session_id: str = self.__dict__["_session_id"]
+        session_delta = SessionDelta.create(
+            session_id, session, self.__dict__["_synced_chat_history_item_tuple"]
+        )
+        response: TaskResponse.ApplySessionDelta = self._call_server(
+            api,
+            TaskRequest.ApplySessionDelta(session_delta=session_delta),
+            TaskResponse.ApplySessionDelta,
+        )
+        if response.session_delta is None:
+            # The server does not hold the same session (e.g., the server is restarted), send the full session.
+            SafeLogger.warning(
+                f"The session of sample {session.sample_index} is out of sync with the server. "
+                f"Send the full session to {api}."
+            )
+            response = self._call_server(
+                api,
+                TaskRequest.ApplySessionDelta(
+                    session_delta=SessionDelta.create(session_id, session, ())
+                ),
+                TaskResponse.ApplySessionDelta,
+            )
+        if response.session_delta is None or not response.session_delta.apply(session):
+            raise HttpUnknownException(
+                f"Failed to synchronize the session of sample {session.sample_index} with the server through {api}."
+            )
+        self.__dict__["_synced_chat_history_item_tuple"] = tuple(
+            session.chat_history.get_value_view()
         )
 
     def get_sample_index_list(self) -> list[SampleIndex]:
@@ -24,26 +77,74 @@ class TaskClient(Client, TaskInterface):
         )
         return response.sample_index_list
 
-    def reset(self, session: Session) -> None:
-        response: TaskResponse.Reset = self._call_server(
-            "/reset", TaskRequest.Reset(session=session), TaskResponse.Reset
+    def get_estimated_sample_cost_dict(self) -> dict[SampleIndex, float]:
+        response: TaskResponse.GetEstimatedSampleCostDict = self._call_server(
+            "/get_estimated_sample_cost_dict",
+            None,
+            TaskResponse.GetEstimatedSampleCostDict,
         )
+        return dict(response.sample_cost_pair_list)
+
+    def reset(self, session: Session) -> None:
+        self.__dict__["_session_id"] = uuid.uuid4().hex
+        self.__dict__["_synced_chat_history_item_tuple"] = ()
+        if self.session_delta_flag:
+            with Tracer.span("task.reset", "task", session.sample_index):
+                self._call_server_with_session_delta("/reset_delta", session)
+            return
+        with Tracer.span("task.reset", "task", session.sample_index):
+            response: TaskResponse.Reset = self._call_server(
+                "/reset",
+                TaskRequest.Reset(
+                    session=session, session_id=self.__dict__["_session_id"]
+                ),
+                TaskResponse.Reset,
+            )
         session.__dict__.update(response.session.__dict__)  # In-place update
 
     def interact(self, session: Session) -> None:
-        response: TaskResponse.Interact = self._call_server(
-            "/interact",
-            TaskRequest.Interact(session=session),
-            TaskResponse.Interact,
-        )
+        if self.session_delta_flag:
+            with Tracer.span("task.interact", "task", session.sample_index):
+                self._call_server_with_session_delta("/interact_delta", session)
+            return
+        with Tracer.span("task.interact", "task", session.sample_index):
+            response: TaskResponse.Interact = self._call_server(
+                "/interact",
+                TaskRequest.Interact(
+                    session=session, session_id=self.__dict__["_session_id"]
+                ),
+                TaskResponse.Interact,
+            )
         session.__dict__.update(response.session.__dict__)
 
     def complete(self, session: Session) -> None:
-        response: TaskResponse.Complete = self._call_server(
-            "/complete",
-            TaskRequest.Complete(session=session),
-            TaskResponse.Complete,
-        )
+        if self.session_delta_flag:
+            with Tracer.span("task.complete", "task", session.sample_index):
+                self._call_server_with_session_delta("/complete_delta", session)
+            return
+        with Tracer.span("task.complete", "task", session.sample_index):
+            response: TaskResponse.Complete = self._call_server(
+                "/complete",
+                TaskRequest.Complete(
+                    session=session, session_id=self.__dict__["_session_id"]
+                ),
+                TaskResponse.Complete,
+            )
+        session.__dict__.update(response.session.__dict__)
+
+    def replay(self, session: Session) -> None:
+        self.__dict__["_session_id"] = uuid.uuid4().hex
+        self.__dict__["_synced_chat_history_item_tuple"] = ()
+        with Tracer.span("task.replay", "task", session.sample_index):
+            response: TaskResponse.Replay = self._call_server(
+                "/replay",
+                TaskRequest.Replay(
+                    session=session, session_id=self.__dict__["_session_id"]
+                ),
+                TaskResponse.Replay,
+            )
+        # The replayed session is not held by the server as a session delta, so the next request sends the full
+        # session with the same session id.
         session.__dict__.update(response.session.__dict__)
 
     def release(self) -> None:
@@ -56,9 +157,13 @@ class TaskClient(Client, TaskInterface):
     def calculate_metric(
         self, session_partial_list: Sequence[SessionMetricCalculationPartial]
     ) -> MetricDict:
+        # session_partial_list may be a SessionMetricAggregator, which cannot be serialized by pydantic. The counters
+        # of the aggregator are not sent, the server calculates the metric from the partials.
         response: TaskResponse.CalculateMetric = self._call_server(
             "/calculate_metric",
-            TaskRequest.CalculateMetric(session_partial_list=session_partial_list),
+            TaskRequest.CalculateMetric(
+                session_partial_list=list(session_partial_list)
+            ),
             TaskResponse.CalculateMetric,
         )
         return response.metric
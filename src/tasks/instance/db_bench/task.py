@@ -121,6 +121,14 @@ class DBBenchDatasetItem(DatasetItem):
     def get_difficulty_level(self) -> int:
         return 0
 
+    def get_estimated_cost(self) -> float:
+        # The rows are inserted into the database in reset(), and the query results are returned as the observations.
+        # So the number of the cells is counted together with the length of the instruction.
+        cell_count = len(self.table_info.row_list) * len(
+            self.table_info.column_info_list
+        )
+        return float(len(self.instruction) + cell_count)
+
 
 class DirectTypeAnswerValidator:
     @staticmethod
@@ -482,19 +490,17 @@ class DBBench(Task[DBBenchDatasetItem]):
         current_dataset_item: DBBenchDatasetItem = self._get_current_dataset_item()
         init_sql = DBBench._build_init_sql(current_dataset_item)
         self.container.execute(init_sql)
-        session.chat_history.inject(
-            self.chat_history_item_factory.construct(0, expected_role=Role.USER)
-        )
-        session.chat_history.inject(
-            self.chat_history_item_factory.construct(1, expected_role=Role.AGENT)
-        )
+        for chat_history_item in self.chat_history_item_factory.construct_list(
+            [(0, Role.USER), (1, Role.AGENT)]
+        ):
+            session.chat_history.inject(chat_history_item)
         prompt = current_dataset_item.instruction
         session.chat_history.inject({"role": Role.USER, "content": prompt})
 
     def _interact(self, session: Session) -> None:
         # region Preparation
         parser_result = DBBench._parse_agent_response(
-            session.chat_history.get_item_deep_copy(-1).content
+            session.chat_history.get_item(-1).content
         )
         current_dataset_item: DBBenchDatasetItem = self._get_current_dataset_item()
         # endregion
@@ -586,6 +592,9 @@ class DBBench(Task[DBBenchDatasetItem]):
         except Exception as e:
             raise TaskReleaseException(str(e))
 
+    def get_gauge_dict(self) -> dict[str, float]:
+        return {"active_container_count": int(not self.container.deleted)}
+
     def calculate_metric(
         self, session_partial_list: Sequence[SessionMetricCalculationPartial]
     ) -> MetricDict:
@@ -7,6 +7,7 @@ from src.tasks.instance.db_bench.single_skill_task_generator import (
 )
 from src.typings import Session, SampleIndex, TaskName, SampleStatus
 from src.factories.chat_history_item import ChatHistoryItemFactory
+from src.utils import Tracer
 from src.tasks.task import Task
 from src.typings import (
     ContinualAgentBenchException,
@@ -104,7 +105,8 @@ class DBBenchSingleSkill(DBBench):
         session.sample_status = SampleStatus.RUNNING
         
         try:
-            self._reset(session)
+            with Tracer.span("task.reset", "task", session.sample_index):
+                self._reset(session)
         except ContinualAgentBenchException as e:
             session.finish_reason = str(e)
             if isinstance(e, TaskEnvironmentException):
@@ -67,6 +67,9 @@ class KnowledgeGraphDatasetItem(DatasetItem):
     def get_difficulty_level(self) -> int:
         return 0
 
+    def get_estimated_cost(self) -> float:
+        return float(len(self.question))
+
 
 class KnowledgeGraph(Task[KnowledgeGraphDatasetItem]):
     def __init__(
@@ -238,12 +241,10 @@ class KnowledgeGraph(Task[KnowledgeGraphDatasetItem]):
         current_dataset_item: KnowledgeGraphDatasetItem = (
             self._get_current_dataset_item()
         )
-        session.chat_history.inject(
-            self.chat_history_item_factory.construct(0, expected_role=Role.USER)
-        )
-        session.chat_history.inject(
-            self.chat_history_item_factory.construct(1, expected_role=Role.AGENT)
-        )
+        for chat_history_item in self.chat_history_item_factory.construct_list(
+            [(0, Role.USER), (1, Role.AGENT)]
+        ):
+            session.chat_history.inject(chat_history_item)
         question = current_dataset_item.question
         entity_list = list(current_dataset_item.entity_dict.keys())
         session.chat_history.inject(
@@ -258,7 +259,7 @@ class KnowledgeGraph(Task[KnowledgeGraphDatasetItem]):
     def _interact(self, session: Session) -> None:
         # region Parse agent response, ensure the code pass the type check
         parser_result = KnowledgeGraph._parse_agent_response(
-            session.chat_history.get_item_deep_copy(-1).content
+            session.chat_history.get_item(-1).content
         )
         assert self.variable_list is not None
         # endregion
@@ -541,6 +542,14 @@ class KnowledgeGraph(Task[KnowledgeGraphDatasetItem]):
     def _release(self) -> None:
         return  # Do nothing
 
+    def get_counter_dict(self) -> dict[str, float]:
+        # The results of SPARQL queries are not cached, so the load on the endpoint is exported instead of a hit rate.
+        sparql_executor = self.knowledge_graph_api.sparql_executor
+        return {
+            "sparql_query_total": sparql_executor.query_count,
+            "sparql_query_duration_seconds_total": sparql_executor.query_duration_sum,
+        }
+
     def calculate_metric(
         self, session_partial_list: Sequence[SessionMetricCalculationPartial]
     ) -> MetricDict:
@@ -1,3 +1,4 @@
+import time
 from typing import List, Tuple, Any
 from SPARQLWrapper import SPARQLWrapper, JSON
 import urllib
@@ -11,9 +12,13 @@ class SparqlExecutor:
     def __init__(self, url: str):
         self.sparql_wrapper = SPARQLWrapper(url)
         self.sparql_wrapper.setReturnFormat(JSON)
+        # Exported as counters by KnowledgeGraph.get_counter_dict().
+        self.query_count = 0
+        self.query_duration_sum = 0.0  # Second
 
     def _query_endpoint(self, query: str) -> dict[str, Any]:
         self.sparql_wrapper.setQuery(query)
+        start_time = time.perf_counter()
         try:
             results = self.sparql_wrapper.query().convert()
         except urllib.error.URLError as e:
@@ -21,6 +26,9 @@ class SparqlExecutor:
                 f"Cannot get result for query: {query}. Check whether the endpoint is reachable."
             )
             raise TaskEnvironmentException(f"Query failed:\n{query}") from e
+        finally:
+            self.query_count += 1
+            self.query_duration_sum += time.perf_counter() - start_time
         assert isinstance(results, dict)
         return results
 
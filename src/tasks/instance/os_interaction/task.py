@@ -86,6 +86,9 @@ class OSInteractionDatasetItem(DatasetItem):
     def get_difficulty_level(self) -> int:
         return 0
 
+    def get_estimated_cost(self) -> float:
+        return float(len(self.instruction))
+
 
 class OSInteraction(Task[OSInteractionDatasetItem]):
     def __init__(
@@ -169,12 +172,10 @@ class OSInteraction(Task[OSInteractionDatasetItem]):
                 f"Command Item: {command_item}"
             )
         # endregion
-        session.chat_history.inject(
-            self.chat_history_item_factory.construct(0, expected_role=Role.USER)
-        )
-        session.chat_history.inject(
-            self.chat_history_item_factory.construct(1, expected_role=Role.AGENT)
-        )
+        for chat_history_item in self.chat_history_item_factory.construct_list(
+            [(0, Role.USER), (1, Role.AGENT)]
+        ):
+            session.chat_history.inject(chat_history_item)
         session.chat_history.inject(
             {"role": Role.USER, "content": current_dataset_item.instruction}
         )
@@ -183,7 +184,7 @@ class OSInteraction(Task[OSInteractionDatasetItem]):
         # region Parse agent response, ensure the code pass the type check
         parser_response: AgentResponseParserResult = (
             OSInteraction._parse_agent_response(
-                session.chat_history.get_item_deep_copy(-1).content
+                session.chat_history.get_item(-1).content
             )
         )
         assert self.container is not None
@@ -276,6 +277,10 @@ class OSInteraction(Task[OSInteractionDatasetItem]):
             except Exception as e:
                 raise TaskReleaseException(str(e))
 
+    def get_gauge_dict(self) -> dict[str, float]:
+        # The container is created by reset() and terminated by complete().
+        return {"active_container_count": int(self.container is not None)}
+
     def calculate_metric(
         self, session_partial_list: Sequence[SessionMetricCalculationPartial]
     ) -> MetricDict:
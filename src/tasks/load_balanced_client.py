@@ -0,0 +1,296 @@
+import threading
+import time
+from typing import Any, Callable, ClassVar, Optional, Sequence
+
+import requests
+
+from src.typings import (
+    Session,
+    SampleIndex,
+    MetricDict,
+    SessionMetricCalculationPartial,
+    HttpException,
+    HttpServerException,
+    HttpTimeoutException,
+    HttpUnknownException,
+    HttpCircuitOpenException,
+)
+from src.utils import SafeLogger, RetryHandler, ExponentialBackoffStrategy
+from .client import TaskClient
+from .task import TaskInterface
+
+
+class BackendState:
+    def __init__(self) -> None:
+        # The sessions placed on the backend that are not completed, including the ones of other
+        # LoadBalancedTaskClient instances in the same process.
+        self.outstanding_session_count = 0
+        # The backend is not used for new sessions until the deadline (time.monotonic()).
+        self.ejection_deadline = 0.0
+
+
+class LoadBalancedTaskClient(TaskInterface):
+    """
+    A TaskClient over a fleet of TaskServers that serve the same task. Like TaskClient, an instance runs one session
+    at a time, SessionRunner creates one instance for every concurrent session (see ConfigUtility.construct_task_list).
+    - Session affinity: The session is pinned to a backend by reset() or replay(), the following interact() and
+      complete() are sent to the same backend.
+    - Placement: A new session is placed on the healthy backend with the least outstanding sessions. The count is
+      shared by all the instances in the process.
+    - Ejection: If the backend fails the health check (/ping with health_check_timeout) before a session is placed on
+      it, or fails to reset (or replay) the session, it is ejected for ejection_duration seconds, and the session is
+      placed on another backend by RetryHandler. The ejected backend is used again after the deadline. A failure after
+      the session is placed is raised, since the state of the session is on the backend.
+    The other methods and the attributes (e.g., task_name) are served by the first healthy backend. An attribute set on
+    the client is set on every backend, in the same way as TaskServer sets it on every task of the pool. The backends
+    that cannot be reached (or are not used yet) receive it before they are used.
+    A session that is not completed (e.g., interact() raises and the session is abandoned) is released when the next
+    session is placed, or by release(), so that it is not counted as an outstanding session forever.
+    """
+
+    # HttpClientException is caused by the request (e.g., an invalid sample index), the backend is not ejected for it.
+    _ejection_exception_tuple: ClassVar[tuple[type[HttpException], ...]] = (
+        HttpServerException,
+        HttpTimeoutException,
+        HttpUnknownException,
+        HttpCircuitOpenException,
+    )
+    _backend_state_dict: ClassVar[dict[str, BackendState]] = {}
+    _backend_state_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(
+        self,
+        server_address_list: Sequence[str],
+        request_timeout: int,
+        session_delta_flag: bool = True,
+        ejection_duration: float = 60,
+        health_check_timeout: float = 5,
+    ):
+        assert len(server_address_list) > 0
+        self._server_address_list = [
+            server_address.rstrip("/") for server_address in server_address_list
+        ]
+        self._request_timeout = request_timeout
+        self._session_delta_flag = session_delta_flag
+        self._ejection_duration = ejection_duration
+        self._health_check_timeout = health_check_timeout
+        # The TaskClient of each backend is created when the backend is used for the first time, since creating it
+        # pings the backend.
+        self._task_client_dict: dict[str, TaskClient] = {}
+        self._session_server_address: Optional[str] = None
+        # The attributes set on the client, and the ones that are set on each backend.
+        self._attribute_dict: dict[str, Any] = {}
+        self._applied_attribute_dict_dict: dict[str, dict[str, Any]] = {}
+        with LoadBalancedTaskClient._backend_state_lock:
+            for server_address in self._server_address_list:
+                LoadBalancedTaskClient._backend_state_dict.setdefault(
+                    server_address, BackendState()
+                )
+
+    @staticmethod
+    def _get_backend_state(server_address: str) -> BackendState:
+        return LoadBalancedTaskClient._backend_state_dict[server_address]
+
+    def _get_task_client(self, server_address: str) -> TaskClient:
+        if server_address not in self._task_client_dict:
+            self._task_client_dict[server_address] = TaskClient(
+                server_address=server_address,
+                request_timeout=self._request_timeout,
+                session_delta_flag=self._session_delta_flag,
+            )
+        task_client = self._task_client_dict[server_address]
+        applied_attribute_dict = self._applied_attribute_dict_dict.setdefault(
+            server_address, {}
+        )
+        for name, value in self._attribute_dict.items():
+            if name not in applied_attribute_dict or (
+                applied_attribute_dict[name] is not value
+            ):
+                setattr(task_client, name, value)
+                applied_attribute_dict[name] = value
+        return task_client
+
+    def _eject(self, server_address: str, error: Exception) -> None:
+        SafeLogger.error(
+            f"Backend {server_address} is ejected for {self._ejection_duration} seconds. Reason: {error}"
+        )
+        with LoadBalancedTaskClient._backend_state_lock:
+            LoadBalancedTaskClient._get_backend_state(
+                server_address
+            ).ejection_deadline = (time.monotonic() + self._ejection_duration)
+
+    def _check_health(self, server_address: str) -> None:
+        # TaskClient retries a failed request for up to 10 minutes, so an unreachable backend is detected by pinging it
+        # with a short timeout before a session is placed on it.
+        try:
+            response = requests.post(
+                f"{server_address}/ping", json={}, timeout=self._health_check_timeout
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise HttpServerException(
+                f"Health check of backend {server_address} failed: {e}"
+            ) from e
+
+    def _get_healthy_server_address_list(self) -> list[str]:
+        # If all the backends are ejected, the one that is ejected first is tried.
+        current_time = time.monotonic()
+        healthy_server_address_list = [
+            server_address
+            for server_address in self._server_address_list
+            if LoadBalancedTaskClient._get_backend_state(
+                server_address
+            ).ejection_deadline
+            <= current_time
+        ]
+        if len(healthy_server_address_list) > 0:
+            return healthy_server_address_list
+        return [
+            min(
+                self._server_address_list,
+                key=lambda server_address: LoadBalancedTaskClient._get_backend_state(
+                    server_address
+                ).ejection_deadline,
+            )
+        ]
+
+    def _call_healthy_backend(self, func: Callable[[TaskClient], Any]) -> Any:
+        # Used by the methods that can be served by any backend.
+        @RetryHandler.handle(
+            max_retries=len(self._server_address_list) - 1,
+            retry_on=LoadBalancedTaskClient._ejection_exception_tuple,
+            waiting_strategy=ExponentialBackoffStrategy(interval=(0, 0)),
+        )
+        def call() -> Any:
+            server_address = self._get_healthy_server_address_list()[0]
+            try:
+                self._check_health(server_address)
+                return func(self._get_task_client(server_address))
+            except LoadBalancedTaskClient._ejection_exception_tuple as e:
+                self._eject(server_address, e)
+                raise e
+
+        return call()
+
+    def _release_session(self) -> None:
+        if self._session_server_address is None:
+            return
+        with LoadBalancedTaskClient._backend_state_lock:
+            LoadBalancedTaskClient._get_backend_state(
+                self._session_server_address
+            ).outstanding_session_count -= 1
+        self._session_server_address = None
+
+    def _place_session(self, func: Callable[[TaskClient], None]) -> None:
+        if self._session_server_address is not None:
+            SafeLogger.warning(
+                f"The previous session on backend {self._session_server_address} is not completed, it is released."
+            )
+            self._release_session()
+
+        @RetryHandler.handle(
+            max_retries=len(self._server_address_list) - 1,
+            retry_on=LoadBalancedTaskClient._ejection_exception_tuple,
+            waiting_strategy=ExponentialBackoffStrategy(interval=(0, 0)),
+        )
+        def place() -> None:
+            with LoadBalancedTaskClient._backend_state_lock:
+                server_address = min(
+                    self._get_healthy_server_address_list(),
+                    key=lambda address: LoadBalancedTaskClient._get_backend_state(
+                        address
+                    ).outstanding_session_count,
+                )
+                LoadBalancedTaskClient._get_backend_state(
+                    server_address
+                ).outstanding_session_count += 1
+            try:
+                self._check_health(server_address)
+                func(self._get_task_client(server_address))
+            except Exception as e:
+                with LoadBalancedTaskClient._backend_state_lock:
+                    LoadBalancedTaskClient._get_backend_state(
+                        server_address
+                    ).outstanding_session_count -= 1
+                if isinstance(e, LoadBalancedTaskClient._ejection_exception_tuple):
+                    self._eject(server_address, e)
+                raise e
+            self._session_server_address = server_address
+
+        place()
+
+    def _get_session_task_client(self) -> TaskClient:
+        assert self._session_server_address is not None
+        return self._get_task_client(self._session_server_address)
+
+    def get_sample_index_list(self) -> list[SampleIndex]:
+        sample_index_list: list[SampleIndex] = self._call_healthy_backend(
+            lambda task_client: task_client.get_sample_index_list()
+        )
+        return sample_index_list
+
+    def get_estimated_sample_cost_dict(self) -> dict[SampleIndex, float]:
+        sample_cost_dict: dict[SampleIndex, float] = self._call_healthy_backend(
+            lambda task_client: task_client.get_estimated_sample_cost_dict()
+        )
+        return sample_cost_dict
+
+    def reset(self, session: Session) -> None:
+        self._place_session(lambda task_client: task_client.reset(session))
+
+    def interact(self, session: Session) -> None:
+        self._get_session_task_client().interact(session)
+
+    def complete(self, session: Session) -> None:
+        try:
+            self._get_session_task_client().complete(session)
+        finally:
+            self._release_session()
+
+    def replay(self, session: Session) -> None:
+        self._place_session(lambda task_client: task_client.replay(session))
+
+    def release(self) -> None:
+        # The servers drop the sessions that are not completed.
+        self._release_session()
+        for server_address in self._server_address_list:
+            try:
+                self._check_health(server_address)
+                self._get_task_client(server_address).release()
+            except HttpException as e:
+                SafeLogger.error(f"Failed to release backend {server_address}: {e}")
+
+    def calculate_metric(
+        self, session_partial_list: Sequence[SessionMetricCalculationPartial]
+    ) -> MetricDict:
+        metric: MetricDict = self._call_healthy_backend(
+            lambda task_client: task_client.calculate_metric(session_partial_list)
+        )
+        return metric
+
+    def __getattr__(self, name: str) -> Any:
+        # The attributes of the task (e.g., task_name, chat_history_item_factory) are read from the backend of the
+        # current session, or the first healthy backend.
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if self._session_server_address is not None:
+            return getattr(self._get_session_task_client(), name)
+        return self._call_healthy_backend(
+            lambda task_client: getattr(task_client, name)
+        )
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # The private attributes belong to the client, the others are set on the backends. See the class docstring.
+        if name.startswith("_"):
+            super().__setattr__(name, value)
+            return
+        self._attribute_dict[name] = value
+        for server_address in self._server_address_list:
+            try:
+                self._check_health(server_address)
+                _ = self._get_task_client(server_address)
+            except HttpException as e:
+                SafeLogger.warning(
+                    f"Failed to set attribute {name} on backend {server_address}, it is set before the backend is "
+                    f"used. Reason: {e}"
+                )
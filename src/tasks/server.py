@@ -1,57 +1,291 @@
-from fastapi import FastAPI, APIRouter
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, APIRouter, HTTPException
+from typing import Callable, Optional, Sequence
 import uvicorn
 
 from .task import Task, DatasetItem
-from src.typings import TaskRequest, TaskResponse
-from src.utils import Server
+from src.typings import (
+    GeneralRequest,
+    TaskRequest,
+    TaskResponse,
+    Session,
+    SessionDelta,
+    InstanceFactoryUtility,
+    SampleStatus,
+)
+from src.utils import Server, SafeLogger
 
 
 class TaskServer(Server):
-    def __init__(self, router: APIRouter, task: Task[DatasetItem]) -> None:
-        Server.__init__(self, router, task)
-        self.task = task
+    """
+    Serve a pool of tasks, so that the sessions of the concurrent TaskClients (see SessionRunner) run in one server.
+    The pool is used in the same way as the task list of SessionRunner: A session is bound to an idle task by
+    reset() or replay(), and the task is returned to the pool by complete(). The session is identified by the
+    session id sent by TaskClient.
+    The methods of the tasks are blocking (e.g., running commands in the container), they are run in a thread pool
+    with one thread per task, instead of the event loop.
+    task_acquisition_timeout: The time in seconds that reset() and replay() wait for an idle task. The task of a
+        session is not returned if its client dies before complete(), so the requests fail with 503 instead of waiting
+        forever when the pool is exhausted. The sessions that are not completed are dropped by release().
+    """
+
+    def __init__(
+        self,
+        router: APIRouter,
+        task_list: Sequence[Task[DatasetItem]],
+        task_acquisition_timeout: float = 60,
+    ) -> None:
+        assert len(task_list) > 0 and task_acquisition_timeout > 0
+        # get_attribute() reads the attributes of the first task. set_attribute() is applied to all the tasks.
+        Server.__init__(self, router, task_list[0])
+        self.task_list = list(task_list)
+        self.task_acquisition_timeout = task_acquisition_timeout
+        self.executor = ThreadPoolExecutor(
+            max_workers=len(self.task_list), thread_name_prefix="task_server"
+        )
+        self.idle_task_queue: asyncio.Queue[Task[DatasetItem]] = asyncio.Queue()
+        for task in self.task_list:
+            self.idle_task_queue.put_nowait(task)
+        # The tasks bound to the running sessions, keyed by session id.
+        self.session_task_dict: dict[str, Task[DatasetItem]] = {}
+        # The sessions updated by session deltas, keyed by session id. See SessionDelta.
+        self.session_dict: dict[str, Session] = {}
         self.router.post("/get_sample_index_list")(self.get_sample_index_list)
+        self.router.post("/get_estimated_sample_cost_dict")(
+            self.get_estimated_sample_cost_dict
+        )
         self.router.post("/reset")(self.reset)
         self.router.post("/interact")(self.interact)
         self.router.post("/complete")(self.complete)
+        self.router.post("/replay")(self.replay)
+        self.router.post("/reset_delta")(self.reset_delta)
+        self.router.post("/interact_delta")(self.interact_delta)
+        self.router.post("/complete_delta")(self.complete_delta)
         self.router.post("/release")(self.release)
         self.router.post("/calculate_metric")(self.calculate_metric)
+        self.metric_registry.register_gauge_collector(self._collect_task_gauge)
+        self.metric_registry.register_counter_collector(self._collect_task_counter)
+
+    def _collect_task_gauge(self) -> dict[str, float]:
+        # The gauges of the tasks (see Task.get_gauge_dict()) are summed over the pool, so that they describe the
+        # whole server. The pool size is exported for calculating the utilization.
+        gauge_dict: dict[str, float] = {
+            "task_server_task_count": len(self.task_list),
+            "task_server_running_session_count": len(self.session_task_dict),
+        }
+        for task in self.task_list:
+            for name, value in task.get_gauge_dict().items():
+                gauge_dict[f"task_{name}"] = gauge_dict.get(f"task_{name}", 0) + value
+        return gauge_dict
+
+    def _collect_task_counter(self) -> dict[str, float]:
+        # The tasks are kept by the server, so the sum over the pool only increases.
+        counter_dict: dict[str, float] = {}
+        for task in self.task_list:
+            for name, value in task.get_counter_dict().items():
+                counter_dict[f"task_{name}"] = (
+                    counter_dict.get(f"task_{name}", 0) + value
+                )
+        return counter_dict
+
+    def set_attribute(self, data: GeneralRequest.SetAttribute) -> None:
+        for task in self.task_list:
+            value = InstanceFactoryUtility.restore_instance_for_http_transfer(
+                instance_factory_type=data.instance_factory_type,
+                parameter_dict=data.instance_factory_parameter_dict,
+            )
+            setattr(task, data.name, value)
+        self.attribute_version = uuid.uuid4().hex
+        return
+
+    async def _acquire_task(self, session_id: str) -> Task[DatasetItem]:
+        # The request may be sent again by the client (e.g., the session delta is out of sync), the session keeps its
+        # task in this case. Otherwise, wait until a task is returned to the pool.
+        if (task := self.session_task_dict.get(session_id)) is not None:
+            return task
+        try:
+            task = await asyncio.wait_for(
+                self.idle_task_queue.get(), self.task_acquisition_timeout
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=503,
+                detail=f"No idle task in {self.task_acquisition_timeout} seconds. "
+                f"All the {len(self.task_list)} tasks are held by the running sessions.",
+            )
+        if (bound_task := self.session_task_dict.get(session_id)) is not None:
+            # The request is sent again while this one is waiting, and the other one gets a task first.
+            self.idle_task_queue.put_nowait(task)
+            return bound_task
+        self.session_task_dict[session_id] = task
+        return task
+
+    def _get_session_task(self, session_id: str) -> Task[DatasetItem]:
+        if (task := self.session_task_dict.get(session_id)) is None:
+            # E.g., the server is restarted or released. 409 is not retried by the client.
+            raise HTTPException(
+                status_code=409,
+                detail=f"The session {session_id} is not held by the server.",
+            )
+        return task
+
+    def _return_task(self, session_id: str) -> None:
+        self.idle_task_queue.put_nowait(self.session_task_dict.pop(session_id))
+
+    async def _run_in_executor(
+        self, func: Callable[[Session], None], session: Session
+    ) -> None:
+        await asyncio.get_running_loop().run_in_executor(self.executor, func, session)
 
     def get_sample_index_list(self) -> TaskResponse.GetSampleIndexList:
-        sample_index_list = self.task.get_sample_index_list()
+        sample_index_list = self.task_list[0].get_sample_index_list()
         return TaskResponse.GetSampleIndexList(sample_index_list=sample_index_list)
 
-    def reset(self, data: TaskRequest.Reset) -> TaskResponse.Reset:
-        self.task.reset(data.session)
+    def get_estimated_sample_cost_dict(
+        self,
+    ) -> TaskResponse.GetEstimatedSampleCostDict:
+        sample_cost_dict = self.task_list[0].get_estimated_sample_cost_dict()
+        return TaskResponse.GetEstimatedSampleCostDict(
+            sample_cost_pair_list=list(sample_cost_dict.items())
+        )
+
+    async def reset(self, data: TaskRequest.Reset) -> TaskResponse.Reset:
+        task = await self._acquire_task(data.session_id)
+        await self._run_in_executor(task.reset, data.session)
         return TaskResponse.Reset(session=data.session)
 
-    def interact(self, data: TaskRequest.Interact) -> TaskResponse.Interact:
-        self.task.interact(data.session)
+    async def interact(self, data: TaskRequest.Interact) -> TaskResponse.Interact:
+        task = self._get_session_task(data.session_id)
+        await self._run_in_executor(task.interact, data.session)
         return TaskResponse.Interact(session=data.session)
 
-    def complete(self, data: TaskRequest.Complete) -> TaskResponse.Complete:
-        self.task.complete(data.session)
+    async def complete(self, data: TaskRequest.Complete) -> TaskResponse.Complete:
+        task = self._get_session_task(data.session_id)
+        try:
+            await self._run_in_executor(task.complete, data.session)
+        finally:
+            self._return_task(data.session_id)
         return TaskResponse.Complete(session=data.session)
 
-    def release(self) -> None:
-        self.task.release()
+    async def replay(self, data: TaskRequest.Replay) -> TaskResponse.Replay:
+        task = await self._acquire_task(data.session_id)
+        await self._run_in_executor(task.replay, data.session)
+        return TaskResponse.Replay(session=data.session)
+
+    async def _apply_session_delta(
+        self, session_delta: SessionDelta, func: Callable[[Session], None]
+    ) -> Optional[SessionDelta]:
+        session: Optional[Session]
+        if session_delta.chat_history_start_index == 0:
+            session = Session(
+                task_name=session_delta.task_name,
+                sample_index=session_delta.sample_index,
+            )
+        else:
+            session = self.session_dict.get(session_delta.session_id)
+        if session is None:
+            return None
+        if not session_delta.apply(session):
+            return None
+        self.session_dict[session_delta.session_id] = session
+        chat_history_item_tuple = tuple(session.chat_history.get_value_view())
+        await self._run_in_executor(func, session)
+        return SessionDelta.create(
+            session_delta.session_id, session, chat_history_item_tuple
+        )
+
+    async def reset_delta(
+        self, data: TaskRequest.ApplySessionDelta
+    ) -> TaskResponse.ApplySessionDelta:
+        task = await self._acquire_task(data.session_delta.session_id)
+        session_delta = await self._apply_session_delta(data.session_delta, task.reset)
+        return TaskResponse.ApplySessionDelta(session_delta=session_delta)
+
+    async def interact_delta(
+        self, data: TaskRequest.ApplySessionDelta
+    ) -> TaskResponse.ApplySessionDelta:
+        task = self.session_task_dict.get(data.session_delta.session_id)
+        if task is None:
+            # The session is not held by the server (e.g., the server is restarted or released). Returning None lets
+            # the client fall back to the full session, instead of retrying an HTTP 500 error.
+            return TaskResponse.ApplySessionDelta(session_delta=None)
+        session_delta = await self._apply_session_delta(
+            data.session_delta, task.interact
+        )
+        return TaskResponse.ApplySessionDelta(session_delta=session_delta)
+
+    async def complete_delta(
+        self, data: TaskRequest.ApplySessionDelta
+    ) -> TaskResponse.ApplySessionDelta:
+        session_id = data.session_delta.session_id
+        task = self.session_task_dict.get(session_id)
+        if task is None:
+            # See interact_delta().
+            return TaskResponse.ApplySessionDelta(session_delta=None)
+        try:
+            session_delta = await self._apply_session_delta(
+                data.session_delta, task.complete
+            )
+        except Exception:
+            # The same as complete(), the task is returned even if it fails.
+            self.session_dict.pop(session_id, None)
+            self._return_task(session_id)
+            raise
+        if session_delta is not None:
+            # The task is kept if the session is out of sync, since the client sends the full session again.
+            del self.session_dict[session_id]
+            self._return_task(session_id)
+        return TaskResponse.ApplySessionDelta(session_delta=session_delta)
+
+    async def release(self) -> None:
+        # The sessions that are not completed (e.g., the client is restarted) are dropped. Their tasks are completed
+        # with an aborted session, so that the tasks can be reset again.
+        self.session_dict.clear()
+        for session_id, task in list(self.session_task_dict.items()):
+            if task.current_sample_index is not None:
+                session = Session(
+                    task_name=task.task_name, sample_index=task.current_sample_index
+                )
+                session.sample_status = SampleStatus.TASK_UNKNOWN_ERROR
+                session.finish_reason = (
+                    "The session is dropped by TaskServer.release()."
+                )
+                try:
+                    await self._run_in_executor(task.complete, session)
+                except Exception as e:
+                    SafeLogger.error(
+                        f"Failed to complete the dropped session of sample {session.sample_index}: {e}"
+                    )
+            self._return_task(session_id)
+        for task in self.task_list:
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, task.release
+            )
         return
 
     def calculate_metric(
         self, data: TaskRequest.CalculateMetric
     ) -> TaskResponse.CalculateMetric:
-        metric = self.task.calculate_metric(data.session_partial_list)
+        metric = self.task_list[0].calculate_metric(data.session_partial_list)
         return TaskResponse.CalculateMetric(metric=metric)
 
-    def shutdown(self) -> None:
-        self.release()
+    async def shutdown(self) -> None:
+        await self.release()
+        self.executor.shutdown()
 
     @staticmethod
-    def start_server(task: Task[DatasetItem], port: int, prefix: str) -> None:
+    def start_server(
+        task_list: Sequence[Task[DatasetItem]],
+        port: int,
+        prefix: str,
+        task_acquisition_timeout: float = 60,
+    ) -> None:
         app = FastAPI()
         router = APIRouter()
         # Create an instance to access the shutdown method
-        server_instance = TaskServer(router, task)
+        server_instance = TaskServer(router, task_list, task_acquisition_timeout)
         app.include_router(router, prefix=prefix)
         # Add the shutdown event handler using lifespan events
         # https://fastapi.tiangolo.com/advanced/events/#alternative-events-deprecated
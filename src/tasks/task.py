@@ -1,4 +1,4 @@
-from typing import final, Optional, Any, TypeVar, Generic, Sequence
+from typing import final, Optional, Any, TypeVar, Generic, Sequence, Self
 from abc import ABC, abstractmethod
 
 from pydantic import BaseModel
@@ -19,8 +19,9 @@ from src.typings import (
     SessionEvaluationOutcome,
     MetricDict,
     SessionMetricCalculationPartial,
+    SessionMetricAggregator,
 )
-from src.utils import SafeLogger
+from src.utils import SafeLogger, Tracer
 from src.factories.chat_history_item import ChatHistoryItemFactory
 
 
@@ -64,12 +65,21 @@ class DatasetItem(BaseModel):
         # It can also be overridden by the subclass, such as the most difficult skill.
         return self.get_skill_list()
 
+    def get_estimated_cost(self) -> float:
+        # Used by the "cost_aware" sample order. Only the relative value between the samples of the same task matters.
+        # By default, all samples are deemed to have the same cost.
+        return 1.0
+
 
 class TaskInterface(ABC):
     @abstractmethod
     def get_sample_index_list(self) -> list[SampleIndex]:
         raise NotImplementedError()
 
+    @abstractmethod
+    def get_estimated_sample_cost_dict(self) -> dict[SampleIndex, float]:
+        raise NotImplementedError()
+
     @abstractmethod
     def reset(self, session: Session) -> None:
         raise NotImplementedError()
@@ -82,6 +92,10 @@ class TaskInterface(ABC):
     def complete(self, session: Session) -> None:
         raise NotImplementedError()
 
+    @abstractmethod
+    def replay(self, session: Session) -> None:
+        raise NotImplementedError()
+
     @abstractmethod
     def release(self) -> None:
         raise NotImplementedError()
@@ -131,6 +145,19 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         self.__dataset: Optional[dict[SampleIndex, DatasetItemSubclass]] = None
         self.__current_dataset_item: Optional[DatasetItemSubclass] = None
 
+    @classmethod
+    @final
+    def create_metric_calculator(cls) -> Self:
+        """
+        Create an instance that is only used to call calculate_metric(), without loading the dataset or starting the
+        environment (e.g., the container of DBBench). The aggregator passed to calculate_metric() must already be
+        synchronized, e.g., by SessionMetricAggregator.merge_dataset_counter_dict().
+        """
+        task = cls.__new__(cls)
+        task.__dataset = None
+        task.__current_dataset_item = None
+        return task
+
     @final
     def _set_dataset(self, dataset: dict[SampleIndex, DatasetItemSubclass]) -> None:
         # Must be called in the __init__ method of the subclass
@@ -144,12 +171,17 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
 
     @final
     def __get_dataset_item(self, sample_index: SampleIndex) -> DatasetItemSubclass:
-        caller_frame = inspect.stack()[1]
+        # Do not use inspect.stack(), it reads the source code of all the frames, which is slow.
+        current_frame = inspect.currentframe()
+        caller_function_name = (
+            current_frame.f_back.f_code.co_name
+            if current_frame is not None and current_frame.f_back is not None
+            else None
+        )
         expected_function_name_list = [
-            self._calculate_metric_based_on_skill.__name__,
-            self._calculate_metric_based_on_difficulty_level.__name__,
+            self._sync_session_metric_aggregator.__name__,
         ]
-        if caller_frame.function not in expected_function_name_list:
+        if caller_function_name not in expected_function_name_list:
             allowed_function_str = ""
             for expected_function_name in expected_function_name_list:
                 allowed_function_str += f"Task.{expected_function_name}, "
@@ -192,38 +224,87 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
                 correct_rate_dict[key] = correct_count_dict[key] / count_dict[key]
         return correct_rate_dict
 
+    @final
+    def _sync_session_metric_aggregator(
+        self, session_partial_list: Sequence[SessionMetricCalculationPartial]
+    ) -> SessionMetricAggregator:
+        """
+        Update the counters of the aggregator that depend on the dataset items. Only the partials that are appended
+        after the last synchronization are processed.
+        If session_partial_list is not a SessionMetricAggregator, a temporary aggregator is created.
+        """
+        if isinstance(session_partial_list, SessionMetricAggregator):
+            aggregator = session_partial_list
+        else:
+            aggregator = SessionMetricAggregator(session_partial_list)
+        for session_partial in aggregator[aggregator.dataset_synced_count :]:
+            dataset_item: DatasetItemSubclass = self.__get_dataset_item(
+                session_partial.sample_index
+            )
+            correct_flag = (
+                session_partial.evaluation_record.outcome
+                == SessionEvaluationOutcome.CORRECT
+            )
+            effective_skill_list = dataset_item.get_effective_skill_list()
+            for skill in dataset_item.get_skill_list():
+                # region Handle total count
+                aggregator.skill_count_dict[skill] = (
+                    aggregator.skill_count_dict.get(skill, 0) + 1
+                )
+                if skill in effective_skill_list:
+                    aggregator.effective_skill_count_dict[skill] = (
+                        aggregator.effective_skill_count_dict.get(skill, 0) + 1
+                    )
+                # endregion
+                # region Handle correct count
+                if correct_flag:
+                    aggregator.skill_correct_count_dict[skill] = (
+                        aggregator.skill_correct_count_dict.get(skill, 0) + 1
+                    )
+                    if skill in effective_skill_list:
+                        aggregator.effective_skill_correct_count_dict[skill] = (
+                            aggregator.effective_skill_correct_count_dict.get(skill, 0)
+                            + 1
+                        )
+                # endregion
+            difficulty_level = dataset_item.get_difficulty_level()
+            aggregator.difficulty_level_count_dict[difficulty_level] = (
+                aggregator.difficulty_level_count_dict.get(difficulty_level, 0) + 1
+            )
+            if correct_flag:
+                aggregator.difficulty_level_correct_count_dict[difficulty_level] = (
+                    aggregator.difficulty_level_correct_count_dict.get(
+                        difficulty_level, 0
+                    )
+                    + 1
+                )
+        aggregator.dataset_synced_count = len(aggregator)
+        return aggregator
+
     @final
     def _calculate_metric_based_on_skill(
         self,
         skill_utility_cls: type[SkillUtility],
         session_partial_list: Sequence[SessionMetricCalculationPartial],
     ) -> dict[str, dict[str, float]]:
-        count_dict = {key: 0 for key in skill_utility_cls.get_all_skill_list()}
-        correct_count_dict = {key: 0 for key in skill_utility_cls.get_all_skill_list()}
+        aggregator = self._sync_session_metric_aggregator(session_partial_list)
+        all_skill_list = skill_utility_cls.get_all_skill_list()
+        assert set(aggregator.skill_count_dict.keys()) <= set(all_skill_list)
+        count_dict = {
+            key: aggregator.skill_count_dict.get(key, 0) for key in all_skill_list
+        }
+        correct_count_dict = {
+            key: aggregator.skill_correct_count_dict.get(key, 0)
+            for key in all_skill_list
+        }
         effective_count_dict = {
-            key: 0 for key in skill_utility_cls.get_all_skill_list()
+            key: aggregator.effective_skill_count_dict.get(key, 0)
+            for key in all_skill_list
         }
         effective_correct_count_dict = {
-            key: 0 for key in skill_utility_cls.get_all_skill_list()
+            key: aggregator.effective_skill_correct_count_dict.get(key, 0)
+            for key in all_skill_list
         }
-        for session_partial in session_partial_list:
-            sample_index = session_partial.sample_index
-            dataset_item: DatasetItemSubclass = self.__get_dataset_item(sample_index)
-            for skill in dataset_item.get_skill_list():
-                # region Handle total count
-                count_dict[skill] += 1
-                if skill in dataset_item.get_effective_skill_list():
-                    effective_count_dict[skill] += 1
-                # endregion
-                # region Handle correct count
-                if (
-                    session_partial.evaluation_record.outcome
-                    == SessionEvaluationOutcome.CORRECT
-                ):
-                    correct_count_dict[skill] += 1
-                    if skill in dataset_item.get_effective_skill_list():
-                        effective_correct_count_dict[skill] += 1
-                # endregion
         skill_correct_rate_dict = Task._calculate_correct_rate(
             count_dict, correct_count_dict
         )
@@ -245,29 +326,18 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         self,
         session_partial_list: Sequence[SessionMetricCalculationPartial],
     ) -> dict[str, dict[str, float]]:
-        # region Preparation
-        difficulty_level_set: set[int] = set()
-        for session_partial in session_partial_list:
-            # Use for-loop instead of list comprehension to mute warnings.
-            difficulty_level: int = self.__get_dataset_item(
-                session_partial.sample_index
-            ).get_difficulty_level()
-            difficulty_level_set.add(difficulty_level)
-        difficulty_level_list: list[int] = sorted(list(difficulty_level_set))
-        count_dict = {str(key): 0 for key in difficulty_level_list}
-        # endregion
-        correct_count_dict = {str(key): 0 for key in difficulty_level_list}
-        for session_partial in session_partial_list:
-            sample_index = session_partial.sample_index
-            dataset_item: DatasetItemSubclass = self.__get_dataset_item(sample_index)
-            difficulty_level = dataset_item.get_difficulty_level()
-            difficulty_level_str = str(difficulty_level)
-            count_dict[difficulty_level_str] += 1
-            if (
-                session_partial.evaluation_record.outcome
-                == SessionEvaluationOutcome.CORRECT
-            ):
-                correct_count_dict[difficulty_level_str] += 1
+        aggregator = self._sync_session_metric_aggregator(session_partial_list)
+        difficulty_level_list: list[int] = sorted(
+            aggregator.difficulty_level_count_dict.keys()
+        )
+        count_dict = {
+            str(key): aggregator.difficulty_level_count_dict[key]
+            for key in difficulty_level_list
+        }
+        correct_count_dict = {
+            str(key): aggregator.difficulty_level_correct_count_dict.get(key, 0)
+            for key in difficulty_level_list
+        }
         sample_level_correct_rate_dict = Task._calculate_correct_rate(
             count_dict, correct_count_dict
         )
@@ -285,8 +355,12 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         """
         The method can be overridden in the subclass, if necessary.
         """
+        if isinstance(session_partial_list, SessionMetricAggregator):
+            aggregator = session_partial_list
+        else:
+            aggregator = SessionMetricAggregator(session_partial_list)
         # region Record the number of sessions
-        session_count = len(session_partial_list)
+        session_count = len(aggregator)
         overall_metric_dict: dict[str, dict[str, float]] = {
             "basic": {"session_count": float(session_count)},
         }
@@ -296,13 +370,7 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         # region Calculate the rate of each SessionEvaluationOutcome
         evaluation_outcome_metric_dict = {}
         for evaluation_outcome in SessionEvaluationOutcome:
-            outcome_count = len(
-                [
-                    session
-                    for session in session_partial_list
-                    if session.evaluation_record.outcome == evaluation_outcome
-                ]
-            )
+            outcome_count = aggregator.evaluation_outcome_count_dict[evaluation_outcome]
             evaluation_outcome_metric_dict[str(evaluation_outcome)] = (
                 outcome_count / session_count
             )
@@ -311,13 +379,7 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         # region Calculate the rate of each SampleStatus
         sample_status_metric_dict = {}
         for sample_status in SampleStatus:
-            status_count = len(
-                [
-                    session
-                    for session in session_partial_list
-                    if session.sample_status == sample_status
-                ]
-            )
+            status_count = aggregator.sample_status_count_dict[sample_status]
             sample_status_metric_dict[str(sample_status)] = status_count / session_count
         overall_metric_dict["sample_status"] = sample_status_metric_dict
         # endregion
@@ -328,6 +390,14 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         assert self.__dataset is not None
         return list(self.__dataset.keys())
 
+    @final
+    def get_estimated_sample_cost_dict(self) -> dict[SampleIndex, float]:
+        assert self.__dataset is not None
+        return {
+            sample_index: dataset_item.get_estimated_cost()
+            for sample_index, dataset_item in self.__dataset.items()
+        }
+
     @final
     def reset(self, session: Session) -> None:
         """
@@ -344,7 +414,8 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         self.__current_dataset_item = self.__dataset[session.sample_index]
         session.sample_status = SampleStatus.RUNNING
         try:
-            self._reset(session)
+            with Tracer.span("task.reset", "task", session.sample_index):
+                self._reset(session)
         except ContinualAgentBenchException as e:
             session.finish_reason = str(e)
             if isinstance(e, TaskEnvironmentException):
@@ -377,7 +448,7 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         ) or session.sample_status.is_agent_inference_process_abnormal()
         assert session.sample_index == self.current_sample_index
         assert session.task_name == self.task_name
-        assert session.chat_history.get_item_deep_copy(-1).role == Role.AGENT
+        assert session.chat_history.get_item(-1).role == Role.AGENT
         assert session.task_output is None
         # endregion
         try:
@@ -397,7 +468,11 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
             self.current_round += 1
             # endregion
             # region Finally, the agent is allowed to interact with the task
-            self._interact(session)
+            with Tracer.span(
+                "task.interact", "task", session.sample_index
+            ) as span_arg_dict:
+                span_arg_dict["round"] = self.current_round
+                self._interact(session)
             # endregion
         except ContinualAgentBenchException as e:
             session.finish_reason = str(e)
@@ -443,7 +518,8 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         # Following statement is NOT allowed, since the method of getting default task output may also throw exceptions.
         #   assert session.task_output is not None
         try:
-            self._complete(session)
+            with Tracer.span("task.complete", "task", session.sample_index):
+                self._complete(session)
         except ContinualAgentBenchException as e:
             if session.finish_reason is None:
                 session.finish_reason = str(e)
@@ -470,6 +546,53 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         """
         raise NotImplementedError()
 
+    @final
+    def replay(self, session: Session) -> None:
+        """
+        Restore the state of the task for a session restored from a round checkpoint, so that the session can be
+        continued from the last completed round. It is called instead of reset().
+        The task is reset with a scratch session, then the agent responses recorded in the session are interacted
+        one by one. The chat history of the session is kept unchanged, since it may be modified by the callbacks
+        (e.g., PreviousSampleUtilizationCallback).
+        If the replay cannot reach the recorded round, the session is marked as SampleStatus.TASK_UNKNOWN_ERROR.
+        """
+        assert session.sample_status == SampleStatus.RUNNING
+        assert session.task_name == self.task_name
+        assert session.chat_history.get_item(-1).role == Role.USER
+        scratch_session = Session(
+            task_name=session.task_name, sample_index=session.sample_index
+        )
+        with Tracer.span("task.replay", "task", session.sample_index):
+            self.reset(scratch_session)
+            replay_start_index = scratch_session.chat_history.get_value_length()
+            for item_index in range(
+                replay_start_index, session.chat_history.get_value_length(), 2
+            ):
+                if scratch_session.sample_status != SampleStatus.RUNNING:
+                    break
+                # item_index points to the agent response, item_index + 1 points to the observation of the round.
+                scratch_session.chat_history.inject(
+                    session.chat_history.get_item(item_index)
+                )
+                self.interact(scratch_session)
+                if (
+                    scratch_session.sample_status == SampleStatus.RUNNING
+                    and scratch_session.chat_history.get_item(-1)
+                    != session.chat_history.get_item(item_index + 1)
+                ):
+                    # The environment may be nondeterministic, e.g., the output of `date`.
+                    SafeLogger.warning(
+                        f"The observation of sample {session.sample_index} at chat history index {item_index + 1} "
+                        f"is different from the recorded one after replay."
+                    )
+        if scratch_session.sample_status != SampleStatus.RUNNING:
+            session.sample_status = SampleStatus.TASK_UNKNOWN_ERROR
+            session.finish_reason = (
+                f"Replay failed at round {self.current_round}. "
+                f"Session status: {scratch_session.sample_status}. "
+                f"Finish reason: {scratch_session.finish_reason}"
+            )
+
     @final
     def release(self) -> None:
         """
@@ -498,6 +621,21 @@ class Task(TaskInterface, Generic[DatasetItemSubclass]):
         """
         raise NotImplementedError()
 
+    def get_gauge_dict(self) -> dict[str, float]:
+        """
+        The gauges of the resources held by the task, e.g., {"active_container_count": 1}. They are exported by the
+        /metrics route of TaskServer, with the prefix "task_". It is called from another thread while the task is
+        running, so it should only read the attributes of the task.
+        """
+        return {}
+
+    def get_counter_dict(self) -> dict[str, float]:
+        """
+        The counters of the work done by the task, e.g., {"sparql_query_total": 3}. The values only increase, and the
+        names end with "_total". They are exported in the same way as get_gauge_dict().
+        """
+        return {}
+
     @abstractmethod
     def calculate_metric(
         self, session_partial_list: Sequence[SessionMetricCalculationPartial]
@@ -7,7 +7,10 @@ from .general import SampleIndex
 from .instance_factory import GeneralInstanceFactory
 
 
-SampleOrderDescription = Literal["default"]  # Execute all the samples one by one
+# "default": Execute all the samples one by one, in the order of the dataset.
+# "cost_aware": Execute the most expensive samples first, see SampleOrderScheduler. The order is saved to
+#   sample_order.json in output_dir, and it is reused when the assignment is restored.
+SampleOrderDescription = Literal["default", "cost_aware"]
 
 
 class LoggerConfig(BaseModel):
@@ -24,6 +27,26 @@ class AssignmentConfig(BaseModel):
     callback_dict: Mapping[str, GeneralInstanceFactory]
     output_dir: str
     sample_order: Sequence[SampleIndex] | SampleOrderDescription
+    # The output_dir of a previous assignment of the same task. It is only used by the "cost_aware" sample order, the
+    # round count of the sessions in it are used as the cost of the samples.
+    sample_cost_reference_dir: Optional[str] = None
+    # The number of sessions that are run concurrently. Each session owns one task instance. A session is created
+    # before the sessions admitted earlier are completed, so the callbacks that depend on the previous sessions (see
+    # Callback.is_previous_session_dependent()) are rejected when it is larger than 1. With the other callbacks, the
+    # sessions are the same as running them one by one, but the callback events of different sessions interleave.
+    concurrent_session_count: int = 1
+    # If shard_count > 1, sample_order is split into shard_count shards, and each shard is run in its own process.
+    # shard_index is only set for the shards, it is None for the assignment that launches the shards.
+    shard_count: int = 1
+    shard_index: Optional[int] = None
+    # If tracing_flag is True, the duration of the phases of the sessions are saved to trace.json. See Tracer.
+    tracing_flag: bool = False
+    # If round_checkpoint_flag is True, the running session is saved after every round, so that an interrupted session
+    # can be continued from the last completed round when the assignment is restored. See Task.replay().
+    round_checkpoint_flag: bool = False
+    # The total time (in seconds) that the retries of a sample can spend on waiting, see RetryBudget. None means that
+    # the waiting time is only limited by the retry policy of each call.
+    retry_budget_per_sample: Optional[float] = None
 
     @field_validator("output_dir", mode="before")  # noqa
     @classmethod
@@ -72,6 +95,16 @@ class PathConfig(BaseModel):
 
     exception_record_file_path: str
     config_output_path: str
+    # session_list_output_path is the legacy runs.json, which is exported from the session log at the end of the
+    # assignment. The sessions are appended to session_log_path during the assignment.
     session_list_output_path: str
+    session_log_path: str
+    session_log_index_path: str
     metric_output_path: str
+    # The dataset counters of the session metric aggregator, written by the shards of a sharded assignment, so that
+    # the metric of the merged sessions is calculated without constructing the task.
+    metric_counter_output_path: str
     coredumpy_output_dir: str
+    trace_output_path: str
+    sample_order_output_path: str
+    session_checkpoint_dir: str
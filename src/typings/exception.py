@@ -153,4 +153,13 @@ class HttpUnknownException(HttpException):
         super().__init__(detail)
 
 
+class HttpCircuitOpenException(HttpException):
+    def __init__(self, detail: Optional[str] = None) -> None:
+        """
+        The request is not sent, since the circuit breaker of the destination server is open, i.e., the server failed
+        too many times recently. See CircuitBreaker.
+        """
+        super().__init__(detail)
+
+
 # endregion
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, ConfigDict, field_validator
 from enum import StrEnum, unique
 from typing import Mapping
 
@@ -13,6 +13,10 @@ class Role(StrEnum):
 
 
 class ChatHistoryItem(BaseModel):
+    # The item is immutable, so it can be shared between chat histories (and returned by ChatHistory.get_item())
+    # without copying. Use ChatHistory.set() to replace an item.
+    model_config = ConfigDict(frozen=True)
+
     role: Role
     content: str
 
@@ -1,7 +1,7 @@
 from pydantic import BaseModel
 from typing import Optional, Any, Sequence
 
-from .session import Session, SessionMetricCalculationPartial
+from .session import Session, SessionMetricCalculationPartial, SessionDelta
 from .general import Role
 from .instance_factory import InstanceFactoryType
 
@@ -15,16 +15,37 @@ class GeneralRequest:
         instance_factory_type: InstanceFactoryType
         instance_factory_parameter_dict: dict[str, Any]
 
+    class BatchCall(BaseModel):
+        api: str
+        # The request payload of the api, None if the api takes no argument.
+        data: Optional[dict[str, Any]]
+
+    class Batch(BaseModel):
+        call_list: list["GeneralRequest.BatchCall"]
+
 
 class TaskRequest:
+    # session_id identifies the session among the sessions served by the same TaskServer. It is the same as
+    # SessionDelta.session_id.
     class Reset(BaseModel):
         session: Session
+        session_id: str = ""
 
     class Interact(BaseModel):
         session: Session
+        session_id: str = ""
 
     class Complete(BaseModel):
         session: Session
+        session_id: str = ""
+
+    class Replay(BaseModel):
+        session: Session
+        session_id: str = ""
+
+    class ApplySessionDelta(BaseModel):
+        # Used by /reset_delta, /interact_delta and /complete_delta.
+        session_delta: SessionDelta
 
     class CalculateMetric(BaseModel):
         session_partial_list: Sequence[SessionMetricCalculationPartial]
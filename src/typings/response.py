@@ -1,7 +1,7 @@
 from pydantic import BaseModel
 from typing import Optional, Any
 
-from .session import Session
+from .session import Session, SessionDelta
 from .general import SampleIndex, ChatHistoryItem, ChatHistoryItemDict, MetricDict
 from .instance_factory import InstanceFactoryType
 
@@ -14,11 +14,19 @@ class GeneralResponse:
     class Ping(BaseModel):
         response: str
 
+    class Batch(BaseModel):
+        # The response payloads of the calls, in the same order as the calls. None if the api returns nothing.
+        result_list: list[Any]
+
 
 class TaskResponse:
     class GetSampleIndexList(BaseModel):
         sample_index_list: list[SampleIndex]
 
+    class GetEstimatedSampleCostDict(BaseModel):
+        # A dict is not used, since the keys of a JSON object are always str, but SampleIndex can be int.
+        sample_cost_pair_list: list[tuple[SampleIndex, float]]
+
     class Reset(BaseModel):
         session: Session
 
@@ -28,6 +36,13 @@ class TaskResponse:
     class Complete(BaseModel):
         session: Session
 
+    class Replay(BaseModel):
+        session: Session
+
+    class ApplySessionDelta(BaseModel):
+        # None if the session delta in the request cannot be applied, the client should send the full session.
+        session_delta: Optional[SessionDelta]
+
     class CalculateMetric(BaseModel):
         metric: MetricDict
 
@@ -1,4 +1,5 @@
-from typing import Optional, Any, Mapping, Generator
+import hashlib
+from typing import Optional, Any, Mapping, Generator, Iterable, Sequence, overload
 from pydantic import BaseModel
 from enum import StrEnum
 
@@ -6,6 +7,32 @@ from .general import SampleIndex, ChatHistoryItem, TaskName, Role
 from .status import SampleStatus
 
 
+class ChatHistoryView(Sequence[ChatHistoryItem]):
+    """
+    A read-only view of the items of a ChatHistory. The items are not copied, since they are immutable.
+    The view is not a snapshot: the items injected into the chat history later are also visible through the view.
+    """
+
+    def __init__(self, value: list[ChatHistoryItem]):
+        self._value = value
+
+    def __len__(self) -> int:
+        return len(self._value)
+
+    @overload
+    def __getitem__(self, index: int) -> ChatHistoryItem: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[ChatHistoryItem]: ...
+
+    def __getitem__(
+        self, index: int | slice
+    ) -> ChatHistoryItem | Sequence[ChatHistoryItem]:
+        if isinstance(index, slice):
+            return tuple(self._value[index])
+        return self._value[index]
+
+
 class ChatHistory(BaseModel):
     # Comment out __getattribute__ and __setattr__ if bugs in accessing the value appear.
     # But REMEMBER, There are NO situations in which you should access the value directly.
@@ -43,10 +70,27 @@ class ChatHistory(BaseModel):
         value: list[ChatHistoryItem] = super().__getattribute__("value")
         return value.pop(item_index)
 
-    def get_item_deep_copy(self, item_index: int) -> ChatHistoryItem:
-        item = super().__getattribute__("value")[item_index]
-        item_copy: ChatHistoryItem = item.model_copy(deep=True)
-        return item_copy
+    def get_item(self, item_index: int) -> ChatHistoryItem:
+        # The item is immutable, so it is returned without copying.
+        item: ChatHistoryItem = super().__getattribute__("value")[item_index]
+        return item
+
+    def get_value_view(self) -> ChatHistoryView:
+        return ChatHistoryView(super().__getattribute__("value"))
+
+    def get_checksum(self) -> str:
+        hasher = hashlib.sha256()
+        for item in super().__getattribute__("value"):
+            # The length is written before the content, so that the boundaries of the items are unambiguous.
+            encoded_content = item.content.encode("utf-8")
+            hasher.update(f"{item.role}:{len(encoded_content)}:".encode("utf-8"))
+            hasher.update(encoded_content)
+        return hasher.hexdigest()
+
+    def get_copy(self) -> "ChatHistory":
+        # Only the list is copied, the items are shared since they are immutable. It is much cheaper than
+        # model_copy(deep=True), and modifying the copy does not affect the original chat history.
+        return ChatHistory(value=list(super().__getattribute__("value")))
 
     def get_value_length(self) -> int:
         # To better track the usage of this method, we use a method instead of a property.
@@ -66,8 +110,7 @@ class ChatHistory(BaseModel):
         assert start_index < end_index <= self.get_value_length()
         chat_history_item_str_list: list[str] = []
         exist_empty_agent_response_flag = False
-        for item_index in range(start_index, end_index):
-            chat_history_item = self.get_item_deep_copy(item_index)
+        for chat_history_item in self.get_value_view()[start_index:end_index]:
             content = chat_history_item.content
             if chat_history_item.role == Role.AGENT and content == "":
                 exist_empty_agent_response_flag = True
@@ -168,3 +211,194 @@ class SessionMetricCalculationPartial(BaseModel):
     sample_index: SampleIndex
     sample_status: SampleStatus
     evaluation_record: SessionEvaluationRecord
+
+
+class SessionMetricAggregator(Sequence[SessionMetricCalculationPartial]):
+    """
+    An append-only list of SessionMetricCalculationPartial, which also keeps the counters used to calculate the metric.
+    Pass it to Task.calculate_metric() instead of a list, then the metric is calculated from the counters, without
+    iterating over all the sessions. So the metric can be calculated after every session at O(1) cost.
+    - The counters of evaluation outcome and sample status are updated in append().
+    - The counters of skill and difficulty level depend on the dataset items of the task, so they are updated by
+        Task._sync_session_metric_aggregator() when the metric is calculated. Only the new partials are processed.
+    The aggregator is still a Sequence, so it can be sent to TaskServer as a list.
+    """
+
+    def __init__(
+        self, session_partial_list: Iterable[SessionMetricCalculationPartial] = ()
+    ):
+        self._session_partial_list: list[SessionMetricCalculationPartial] = []
+        self.evaluation_outcome_count_dict: dict[SessionEvaluationOutcome, int] = {
+            evaluation_outcome: 0 for evaluation_outcome in SessionEvaluationOutcome
+        }
+        self.sample_status_count_dict: dict[SampleStatus, int] = {
+            sample_status: 0 for sample_status in SampleStatus
+        }
+        # region Counters updated by Task
+        self.dataset_synced_count = 0
+        self.skill_count_dict: dict[str, int] = {}
+        self.skill_correct_count_dict: dict[str, int] = {}
+        self.effective_skill_count_dict: dict[str, int] = {}
+        self.effective_skill_correct_count_dict: dict[str, int] = {}
+        self.difficulty_level_count_dict: dict[int, int] = {}
+        self.difficulty_level_correct_count_dict: dict[int, int] = {}
+        # endregion
+        for session_partial in session_partial_list:
+            self.append(session_partial)
+
+    def append(self, session_partial: SessionMetricCalculationPartial) -> None:
+        self._session_partial_list.append(session_partial)
+        self.evaluation_outcome_count_dict[
+            session_partial.evaluation_record.outcome
+        ] += 1
+        self.sample_status_count_dict[session_partial.sample_status] += 1
+
+    def get_correct_count(self) -> int:
+        return self.evaluation_outcome_count_dict[SessionEvaluationOutcome.CORRECT]
+
+    def get_dataset_counter_dict(self) -> dict[str, Any]:
+        """
+        Return the counters updated by Task, which can be saved to a JSON file. Used by the shards of a sharded
+        assignment, so that the metric of the merged sessions is calculated without the dataset. See
+        merge_dataset_counter_dict().
+        """
+        assert self.dataset_synced_count == len(self)
+        return {
+            "dataset_synced_count": self.dataset_synced_count,
+            "skill_count_dict": dict(self.skill_count_dict),
+            "skill_correct_count_dict": dict(self.skill_correct_count_dict),
+            "effective_skill_count_dict": dict(self.effective_skill_count_dict),
+            "effective_skill_correct_count_dict": dict(
+                self.effective_skill_correct_count_dict
+            ),
+            # The keys of JSON objects are strings.
+            "difficulty_level_count_dict": {
+                str(key): value
+                for key, value in self.difficulty_level_count_dict.items()
+            },
+            "difficulty_level_correct_count_dict": {
+                str(key): value
+                for key, value in self.difficulty_level_correct_count_dict.items()
+            },
+        }
+
+    def merge_dataset_counter_dict(
+        self, dataset_counter_dict: Mapping[str, Any]
+    ) -> None:
+        """
+        Add the counters returned by get_dataset_counter_dict() of another aggregator, whose partials are also
+        appended to this one.
+        """
+        self.dataset_synced_count += dataset_counter_dict["dataset_synced_count"]
+        assert self.dataset_synced_count <= len(self)
+        for name in [
+            "skill_count_dict",
+            "skill_correct_count_dict",
+            "effective_skill_count_dict",
+            "effective_skill_correct_count_dict",
+        ]:
+            counter_dict: dict[str, int] = getattr(self, name)
+            for key, value in dataset_counter_dict[name].items():
+                counter_dict[key] = counter_dict.get(key, 0) + value
+        for name in [
+            "difficulty_level_count_dict",
+            "difficulty_level_correct_count_dict",
+        ]:
+            difficulty_level_counter_dict: dict[int, int] = getattr(self, name)
+            for key, value in dataset_counter_dict[name].items():
+                difficulty_level_counter_dict[int(key)] = (
+                    difficulty_level_counter_dict.get(int(key), 0) + value
+                )
+
+    def __len__(self) -> int:
+        return len(self._session_partial_list)
+
+    @overload
+    def __getitem__(self, index: int) -> SessionMetricCalculationPartial: ...
+
+    @overload
+    def __getitem__(
+        self, index: slice
+    ) -> Sequence[SessionMetricCalculationPartial]: ...
+
+    def __getitem__(
+        self, index: int | slice
+    ) -> SessionMetricCalculationPartial | Sequence[SessionMetricCalculationPartial]:
+        return self._session_partial_list[index]
+
+
+class SessionDelta(BaseModel):
+    """
+    The change of a Session relative to the version held by the receiver. It is used by TaskClient and TaskServer, so
+    that the whole chat history is not sent in every request.
+    The receiver keeps the first chat_history_start_index items of its chat history, and appends
+    chat_history_item_list to them. The other fields of Session are small, so they are always sent in full.
+    chat_history_checksum is the checksum of the resulting chat history. If it does not match, the two sides have
+    diverged (e.g., an item is modified by ChatHistory.set()), and the sender should send the full session instead
+    (a delta with chat_history_start_index set to 0).
+    """
+
+    session_id: str
+    task_name: TaskName
+    sample_index: SampleIndex
+    sample_status: SampleStatus
+    finish_reason: Optional[str]
+    task_output: Optional[dict[str, Optional[str]]]
+    evaluation_record: SessionEvaluationRecord
+    chat_history_start_index: int
+    chat_history_item_list: list[ChatHistoryItem]
+    chat_history_checksum: str
+
+    @staticmethod
+    def create(
+        session_id: str,
+        session: Session,
+        base_item_sequence: Sequence[ChatHistoryItem],
+    ) -> "SessionDelta":
+        """
+        base_item_sequence is the chat history known by the receiver. Pass an empty sequence to send the full session.
+        """
+        value_view = session.chat_history.get_value_view()
+        chat_history_start_index = 0
+        for base_item, item in zip(base_item_sequence, value_view):
+            # The items are immutable, so the identity check is enough in most cases.
+            if base_item is not item and base_item != item:
+                break
+            chat_history_start_index += 1
+        return SessionDelta(
+            session_id=session_id,
+            task_name=session.task_name,
+            sample_index=session.sample_index,
+            sample_status=session.sample_status,
+            finish_reason=session.finish_reason,
+            task_output=session.task_output,
+            evaluation_record=session.evaluation_record,
+            chat_history_start_index=chat_history_start_index,
+            chat_history_item_list=list(value_view[chat_history_start_index:]),
+            chat_history_checksum=session.chat_history.get_checksum(),
+        )
+
+    def apply(self, session: Session) -> bool:
+        """
+        Apply the delta to the session in place. Return False if the delta cannot be applied, the session is not
+        modified in this case.
+        """
+        value_view = session.chat_history.get_value_view()
+        if (
+            session.task_name != self.task_name
+            or session.sample_index != self.sample_index
+            or self.chat_history_start_index > len(value_view)
+        ):
+            return False
+        chat_history = ChatHistory(
+            value=list(value_view[: self.chat_history_start_index])
+            + self.chat_history_item_list
+        )
+        if chat_history.get_checksum() != self.chat_history_checksum:
+            return False
+        session.sample_status = self.sample_status
+        session.chat_history = chat_history
+        session.finish_reason = self.finish_reason
+        session.task_output = self.task_output
+        session.evaluation_record = self.evaluation_record
+        return True
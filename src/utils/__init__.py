@@ -1,6 +1,16 @@
 from .config_loader import ConfigLoader
 from .logger import SingletonLogger, SafeLogger
 from .color_message import ColorMessage
-from .client import Client
+from .client import Client, ClientConnectionStatistics
 from .server import Server
-from .retry import RetryHandler, ExponentialBackoffStrategy
+from .metric_registry import MetricRegistry
+from .readiness_probe import ReadinessProbe
+from .retry import (
+    RetryHandler,
+    ExponentialBackoffStrategy,
+    FullJitterBackoffStrategy,
+    CircuitBreaker,
+    RetryBudget,
+)
+from .tracer import Tracer
+from .session_log import SessionLog, SessionLogIndexEntry, SessionLogSessionSequence
@@ -1,4 +1,14 @@
-from typing import Any, Optional, Type, TypeVar, overload, reveal_type
+from typing import (
+    Any,
+    ClassVar,
+    Optional,
+    Sequence,
+    Type,
+    TypeVar,
+    overload,
+    reveal_type,
+)
+import orjson
 import requests
 from pydantic import BaseModel
 
@@ -12,14 +22,27 @@ from src.typings import (
     HttpClientException,
     HttpUnknownException,
 )
-from .retry import RetryHandler, ExponentialBackoffStrategy
+from .retry import RetryHandler, FullJitterBackoffStrategy
 from .logger import SafeLogger
+from .tracer import Tracer
+from .rpc_codec import RpcCodec
 
 
 T = TypeVar("T", bound=BaseModel)
 
 
+class ClientConnectionStatistics(BaseModel):
+    # request_count includes the retried requests.
+    request_count: int
+    new_connection_count: int
+    reused_connection_count: int
+
+
 class Client(BaseModel):
+    # The attributes of the server that are only changed by set_attribute(), e.g., the name of the task. They are read
+    # from the server once, and cached by the client until the attribute version of the server is changed. See
+    # Server.attribute_version. The change made by another client is seen after the next request of this client.
+    cached_attribute_name_set: ClassVar[frozenset[str]] = frozenset()
     server_address: str
     request_timeout: int
 
@@ -31,6 +54,13 @@ class Client(BaseModel):
         Post-initialization processing to clean server address and verify connectivity.
         Removes trailing slash from the server address and pings the server to ensure connectivity.
         """
+        # The connections to the server are kept alive and reused by the requests sent by the client.
+        # Client.__setattr__() sets the attribute on the server, so __dict__ is used for the client-side states.
+        self.__dict__["_http_session"] = requests.Session()
+        # The Accept-Encoding header of the last response, which lists the codings the server can decompress.
+        self.__dict__["_server_accept_encoding"] = None
+        self.__dict__["_attribute_cache_dict"] = {}
+        self.__dict__["_attribute_version"] = None
         if self.server_address.endswith("/"):
             self.server_address = self.server_address.rstrip("/")
         # Verify connectivity
@@ -76,8 +106,19 @@ class Client(BaseModel):
             requests.exceptions.HTTPError,
             HttpException,
         ),
-        waiting_strategy=ExponentialBackoffStrategy(interval=(None, 30), multiplier=2),
-    )  # The retry will take at most 10 minutes.
+        waiting_strategy=FullJitterBackoffStrategy(interval=(None, 30), multiplier=2),
+        # The clients of the same server share the circuit breaker. A request with incorrect parameters does not mean
+        # that the server is unhealthy.
+        circuit_breaker_endpoint_getter=lambda client, *_, **__: client.server_address,
+        circuit_breaker_failure_on=(
+            requests.exceptions.Timeout,
+            HttpTimeoutException,
+            HttpServerException,
+            HttpUnknownException,
+        ),
+        # The request is rejected by the server (e.g., the session is unknown to the server), retrying it is useless.
+        give_up_on=(HttpClientException,),
+    )  # The retry will take at most 10 minutes, or fail immediately when the server is known to be unhealthy.
     def _call_server(
         self,
         api: str,
@@ -96,42 +137,57 @@ class Client(BaseModel):
         # region Preparation
         assert api.startswith("/")
         address = self.server_address + api
-        if data is None:
-            data_dict = {}
-        else:
-            data_dict = data.model_dump()
-        request_info_str = (
-            f"Request information:\n"
-            f"- address: {address}\n"
-            f"- response_cls: {response_cls}\n"
-            f"- data_cls: {str(type(data))}\n"
-            f"- data_dict_str_length: {len(str(data_dict))}\n"
-            f"- data_dict: {data_dict}"
-        )
-        error_description_placeholder = "<<ERROR_DESCRIPTION>>"
-        error_message_template = f"{error_description_placeholder}\n{request_info_str}"
+        body = b"{}" if data is None else orjson.dumps(data.model_dump(mode="json"))
+        header_dict = {
+            "Content-Type": "application/json",
+            "Accept-Encoding": ", ".join(
+                RpcCodec.get_supported_content_encoding_list()
+            ),
+        }
+        if (
+            content_encoding := RpcCodec.select_content_encoding(
+                self.__dict__["_server_accept_encoding"], len(body)
+            )
+        ) is not None:
+            body = RpcCodec.compress(body, content_encoding)
+            header_dict["Content-Encoding"] = content_encoding
+
+        def get_error_message(error_description: str) -> str:
+            # The request information is only formatted when an error occurs, since str(data_dict) is slow for a
+            # large payload (e.g., a session with a long chat history).
+            data_dict_str = str({} if data is None else data.model_dump())
+            return (
+                f"{error_description}\n"
+                f"Request information:\n"
+                f"- address: {address}\n"
+                f"- response_cls: {response_cls}\n"
+                f"- data_cls: {str(type(data))}\n"
+                f"- data_dict_str_length: {len(data_dict_str)}\n"
+                f"- data_dict: {data_dict_str}"
+            )
+
         # endregion
         # region Send request
         try:
-            response = requests.post(
-                address, json=data_dict, timeout=self.request_timeout
-            )
+            with Tracer.span(f"http{api}", "http"):
+                response = self.__dict__["_http_session"].post(
+                    address,
+                    data=body,
+                    headers=header_dict,
+                    timeout=self.request_timeout,
+                )
         except requests.exceptions.Timeout as e:
-            error_message = error_message_template.replace(
-                error_description_placeholder, "Request timeout."
-            )
+            error_message = get_error_message("Request timeout.")
             SafeLogger.error(error_message)
             raise HttpTimeoutException(error_message) from e
         except requests.exceptions.ConnectionError as e:
-            error_message = error_message_template.replace(
-                error_description_placeholder,
+            error_message = get_error_message(
                 "Error occurs when reaching the destination server. Do you start the server?",
             )
             SafeLogger.error(error_message)
             raise HttpServerException(error_message) from e
         except Exception as e:
-            error_message = error_message_template.replace(
-                error_description_placeholder,
+            error_message = get_error_message(
                 "Unknown error occurs when sending request.",
             )
             SafeLogger.error(error_message)
@@ -139,10 +195,18 @@ class Client(BaseModel):
         # endregion
         # region Process response
         if response.ok:  # response will always be assigned in the try block.
+            self.__dict__["_server_accept_encoding"] = response.headers.get(
+                "accept-encoding"
+            )
+            if (
+                attribute_version := response.headers.get("x-attribute-version")
+            ) != self.__dict__["_attribute_version"]:
+                self.invalidate_attribute_cache()
+                self.__dict__["_attribute_version"] = attribute_version
             if response_cls is None:
                 return None
-            response_dict = response.json()
-            return response_cls.model_validate(response_dict)
+            # The response is decompressed by requests.
+            return response_cls.model_validate(orjson.loads(response.content))
         else:
             error_info_str = (
                 "Error information:\n"
@@ -153,8 +217,7 @@ class Client(BaseModel):
                 response.raise_for_status()  # The statement will definitely raise requests.exceptions.HTTPError.
             except requests.exceptions.HTTPError as e:
                 if 400 <= response.status_code < 600:
-                    error_message = error_message_template.replace(
-                        error_description_placeholder,
+                    error_message = get_error_message(
                         f"Original error message: {e}\n{error_info_str}",
                     )
                     SafeLogger.error(error_message)
@@ -165,8 +228,7 @@ class Client(BaseModel):
                 else:
                     # This block is not expected to be triggered. Since `response.raise_for_status()` will only raise
                     # requests.exceptions.HTTPError when the status code is in of the range of [400, 600).
-                    error_message = error_message_template.replace(
-                        error_description_placeholder,
+                    error_message = get_error_message(
                         f"The status code of the request is out of the range of [400, 600).\n{error_info_str}",
                     )
                     SafeLogger.error(error_message)
@@ -174,8 +236,7 @@ class Client(BaseModel):
             except Exception as e:
                 # This block is not expected to be triggered. Since ``response.raise_for_status()`` will only raise
                 # requests.exceptions.HTTPError.
-                error_message = error_message_template.replace(
-                    error_description_placeholder,
+                error_message = get_error_message(
                     f"`response.raise_for_status()` raises an unknown error.\n{error_info_str}",
                 )
                 SafeLogger.error(error_message)
@@ -183,6 +244,97 @@ class Client(BaseModel):
             return None  # Will never reach here, added for type checking
         # endregion
 
+    def _call_server_batch(
+        self,
+        call_list: Sequence[tuple[str, Optional[BaseModel], Optional[Type[BaseModel]]]],
+    ) -> list[Optional[BaseModel]]:
+        """
+        Send the calls in one request, and return the responses in the same order. Each call is a tuple of the
+        arguments of _call_server(). See Server.batch().
+        """
+        response: GeneralResponse.Batch = self._call_server(
+            "/batch",
+            GeneralRequest.Batch(
+                call_list=[
+                    GeneralRequest.BatchCall(
+                        api=api,
+                        data=None if data is None else data.model_dump(mode="json"),
+                    )
+                    for api, data, _ in call_list
+                ]
+            ),
+            GeneralResponse.Batch,
+        )
+        return [
+            None if response_cls is None else response_cls.model_validate(result)
+            for (_, _, response_cls), result in zip(call_list, response.result_list)
+        ]
+
+    @staticmethod
+    def _restore_attribute(name: str, response: GeneralResponse.GetAttribute) -> Any:
+        if response.instance_factory_type is None:
+            SafeLogger.error(f"Attribute '{name}' not found on the server.")
+            raise AttributeError(f"Attribute '{name}' is not found.")
+        if response.instance_factory_parameter_dict is None:
+            raise RuntimeError(
+                "The instance factory has no parameter, which is unexpected."
+            )
+        return InstanceFactoryUtility.restore_instance_for_http_transfer(
+            instance_factory_type=response.instance_factory_type,
+            parameter_dict=response.instance_factory_parameter_dict,
+        )
+
+    def get_attribute_list(self, name_list: Sequence[str]) -> list[Any]:
+        # Get multiple attributes of the server in one request, instead of calling __getattr__() for each of them.
+        attribute_cache_dict: dict[str, Any] = self.__dict__["_attribute_cache_dict"]
+        uncached_name_list = [
+            name for name in name_list if name not in attribute_cache_dict
+        ]
+        response_list = self._call_server_batch(
+            [
+                (
+                    "/get_attribute",
+                    GeneralRequest.GetAttribute(name=name),
+                    GeneralResponse.GetAttribute,
+                )
+                for name in uncached_name_list
+            ]
+        )
+        uncached_attribute_dict: dict[str, Any] = {}
+        for name, response in zip(uncached_name_list, response_list):
+            assert isinstance(response, GeneralResponse.GetAttribute)
+            uncached_attribute_dict[name] = Client._restore_attribute(name, response)
+            if name in self.cached_attribute_name_set:
+                attribute_cache_dict[name] = uncached_attribute_dict[name]
+        return [
+            (
+                uncached_attribute_dict[name]
+                if name in uncached_attribute_dict
+                else attribute_cache_dict[name]
+            )
+            for name in name_list
+        ]
+
+    def invalidate_attribute_cache(self) -> None:
+        self.__dict__["_attribute_cache_dict"].clear()
+
+    def get_connection_statistics(self) -> ClientConnectionStatistics:
+        request_count = 0
+        new_connection_count = 0
+        http_session: requests.Session = self.__dict__["_http_session"]
+        http_adapter = http_session.get_adapter(self.server_address)
+        assert isinstance(http_adapter, requests.adapters.HTTPAdapter)
+        pool_manager = http_adapter.poolmanager
+        for pool_key in pool_manager.pools.keys():
+            pool = pool_manager.pools[pool_key]
+            request_count += pool.num_requests
+            new_connection_count += pool.num_connections
+        return ClientConnectionStatistics(
+            request_count=request_count,
+            new_connection_count=new_connection_count,
+            reused_connection_count=request_count - new_connection_count,
+        )
+
     def __getattr__(self, name: str) -> Any:
         """
         Args:
@@ -199,22 +351,18 @@ class Client(BaseModel):
             # I cannot even stop the process when names are assigned by these two values.
             # So I have to add this to prevent the server from being called if the name is "shape" or "__len__".
             return super().__getattr__(name)  # type: ignore[misc]
+        attribute_cache_dict: dict[str, Any] = self.__dict__["_attribute_cache_dict"]
+        if name in attribute_cache_dict:
+            return attribute_cache_dict[name]
         response: GeneralResponse.GetAttribute = self._call_server(
             "/get_attribute",
             GeneralRequest.GetAttribute(name=name),
             GeneralResponse.GetAttribute,
         )
-        if response.instance_factory_type is None:
-            SafeLogger.error(f"Attribute '{name}' not found on the server.")
-            raise AttributeError(f"Attribute '{name}' is not found.")
-        if response.instance_factory_parameter_dict is None:
-            raise RuntimeError(
-                "The instance factory has no parameter, which is unexpected."
-            )
-        return InstanceFactoryUtility.restore_instance_for_http_transfer(
-            instance_factory_type=response.instance_factory_type,
-            parameter_dict=response.instance_factory_parameter_dict,
-        )
+        value = Client._restore_attribute(name, response)
+        if name in self.cached_attribute_name_set:
+            attribute_cache_dict[name] = value
+        return value
 
     def __setattr__(self, name: str, value: Any) -> None:
         """
@@ -234,6 +382,7 @@ class Client(BaseModel):
             ),
             None,
         )
+        self.__dict__["_attribute_cache_dict"].pop(name, None)
 
     def __delattr__(self, name: str) -> None:
         """
@@ -0,0 +1,231 @@
+import bisect
+import threading
+from typing import Callable, Mapping, Optional, Sequence
+
+
+class HistogramValue:
+    def __init__(self, bucket_upper_bound_list: Sequence[float]) -> None:
+        self.bucket_upper_bound_list = bucket_upper_bound_list
+        # The count of each bucket is not cumulative, the last element is the count of +Inf.
+        self.bucket_count_list = [0] * (len(bucket_upper_bound_list) + 1)
+        self.value_sum = 0.0
+
+    def observe(self, value: float) -> None:
+        bucket_index = bisect.bisect_left(self.bucket_upper_bound_list, value)
+        self.bucket_count_list[bucket_index] += 1
+        self.value_sum += value
+
+
+class Metric:
+    def __init__(
+        self,
+        name: str,
+        metric_type: str,
+        help_text: str,
+        bucket_upper_bound_list: Optional[Sequence[float]] = None,
+    ) -> None:
+        assert metric_type in {"counter", "gauge", "histogram"}
+        assert (metric_type == "histogram") == (bucket_upper_bound_list is not None)
+        self.name = name
+        self.metric_type = metric_type
+        self.help_text = help_text
+        self.bucket_upper_bound_list = bucket_upper_bound_list
+        # Keyed by the sorted label items.
+        self.value_dict: dict[tuple[tuple[str, str], ...], float] = {}
+        self.histogram_value_dict: dict[tuple[tuple[str, str], ...], HistogramValue] = (
+            {}
+        )
+
+
+class MetricRegistry:
+    """
+    An in-process registry of metrics, exported in the Prometheus text format (version 0.0.4) without any third-party
+    library. A metric is created when it is updated for the first time, the help text and the buckets of later updates
+    are ignored. The registry is thread-safe, since the endpoints of Server may run in the thread pool of FastAPI.
+    """
+
+    # Second
+    LATENCY_BUCKET_UPPER_BOUND_LIST: Sequence[float] = (
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1,
+        2.5,
+        5,
+        10,
+        30,
+        60,
+    )
+    # Byte
+    SIZE_BUCKET_UPPER_BOUND_LIST: Sequence[float] = (
+        256,
+        1024,
+        4 * 1024,
+        16 * 1024,
+        64 * 1024,
+        256 * 1024,
+        1024 * 1024,
+        4 * 1024 * 1024,
+        16 * 1024 * 1024,
+    )
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self) -> None:
+        self._metric_dict: dict[str, Metric] = {}
+        # The metrics that are read when the metrics are exported, e.g., the number of running containers of the
+        # tasks. Each element is the metric type and the collector.
+        self._collector_list: list[tuple[str, Callable[[], Mapping[str, float]]]] = []
+        self._lock = threading.Lock()
+
+    def _get_metric(
+        self,
+        name: str,
+        metric_type: str,
+        help_text: str,
+        bucket_upper_bound_list: Optional[Sequence[float]] = None,
+    ) -> Metric:
+        # The caller must hold the lock.
+        if (metric := self._metric_dict.get(name)) is None:
+            metric = Metric(name, metric_type, help_text, bucket_upper_bound_list)
+            self._metric_dict[name] = metric
+        assert metric.metric_type == metric_type
+        return metric
+
+    @staticmethod
+    def _get_label_key(
+        label_dict: Optional[Mapping[str, str]],
+    ) -> tuple[tuple[str, str], ...]:
+        if label_dict is None:
+            return ()
+        return tuple(sorted(label_dict.items()))
+
+    def increase_counter(
+        self,
+        name: str,
+        help_text: str,
+        label_dict: Optional[Mapping[str, str]] = None,
+        value: float = 1,
+    ) -> None:
+        assert value >= 0
+        label_key = MetricRegistry._get_label_key(label_dict)
+        with self._lock:
+            metric = self._get_metric(name, "counter", help_text)
+            metric.value_dict[label_key] = metric.value_dict.get(label_key, 0) + value
+
+    def increase_gauge(
+        self,
+        name: str,
+        help_text: str,
+        label_dict: Optional[Mapping[str, str]] = None,
+        value: float = 1,
+    ) -> None:
+        label_key = MetricRegistry._get_label_key(label_dict)
+        with self._lock:
+            metric = self._get_metric(name, "gauge", help_text)
+            metric.value_dict[label_key] = metric.value_dict.get(label_key, 0) + value
+
+    def set_gauge(
+        self,
+        name: str,
+        help_text: str,
+        label_dict: Optional[Mapping[str, str]] = None,
+        value: float = 0,
+    ) -> None:
+        label_key = MetricRegistry._get_label_key(label_dict)
+        with self._lock:
+            self._get_metric(name, "gauge", help_text).value_dict[label_key] = value
+
+    def observe_histogram(
+        self,
+        name: str,
+        help_text: str,
+        bucket_upper_bound_list: Sequence[float],
+        value: float,
+        label_dict: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        label_key = MetricRegistry._get_label_key(label_dict)
+        with self._lock:
+            metric = self._get_metric(
+                name, "histogram", help_text, bucket_upper_bound_list
+            )
+            if (histogram_value := metric.histogram_value_dict.get(label_key)) is None:
+                assert metric.bucket_upper_bound_list is not None
+                histogram_value = HistogramValue(metric.bucket_upper_bound_list)
+                metric.histogram_value_dict[label_key] = histogram_value
+            histogram_value.observe(value)
+
+    def register_gauge_collector(
+        self, gauge_collector: Callable[[], Mapping[str, float]]
+    ) -> None:
+        """
+        The collector returns the values of the gauges keyed by the metric name. It is called by export().
+        """
+        with self._lock:
+            self._collector_list.append(("gauge", gauge_collector))
+
+    def register_counter_collector(
+        self, counter_collector: Callable[[], Mapping[str, float]]
+    ) -> None:
+        """
+        The same as register_gauge_collector(), but the values only increase (e.g., the number of queries sent by the
+        tasks), so that rate() can be used on them. The metric names must end with "_total".
+        """
+        with self._lock:
+            self._collector_list.append(("counter", counter_collector))
+
+    @staticmethod
+    def _format_label(label_key: tuple[tuple[str, str], ...]) -> str:
+        if len(label_key) == 0:
+            return ""
+        label_str = ",".join(
+            f'{label_name}="{MetricRegistry._escape_label_value(label_value)}"'
+            for label_name, label_value in label_key
+        )
+        return f"{{{label_str}}}"
+
+    @staticmethod
+    def _escape_label_value(label_value: str) -> str:
+        return (
+            label_value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+
+    def export(self) -> str:
+        line_list: list[str] = []
+        with self._lock:
+            collector_list = list(self._collector_list)
+            for metric in self._metric_dict.values():
+                line_list.append(f"# HELP {metric.name} {metric.help_text}")
+                line_list.append(f"# TYPE {metric.name} {metric.metric_type}")
+                for label_key, value in metric.value_dict.items():
+                    line_list.append(
+                        f"{metric.name}{MetricRegistry._format_label(label_key)} {value}"
+                    )
+                for label_key, histogram_value in metric.histogram_value_dict.items():
+                    cumulative_count = 0
+                    for upper_bound, bucket_count in zip(
+                        [*histogram_value.bucket_upper_bound_list, "+Inf"],
+                        histogram_value.bucket_count_list,
+                    ):
+                        cumulative_count += bucket_count
+                        bucket_label = MetricRegistry._format_label(
+                            (*label_key, ("le", str(upper_bound)))
+                        )
+                        line_list.append(
+                            f"{metric.name}_bucket{bucket_label} {cumulative_count}"
+                        )
+                    label = MetricRegistry._format_label(label_key)
+                    line_list.append(
+                        f"{metric.name}_sum{label} {histogram_value.value_sum}"
+                    )
+                    line_list.append(f"{metric.name}_count{label} {cumulative_count}")
+        # The collectors are called without the lock, since they may be slow.
+        for metric_type, collector in collector_list:
+            for name, value in collector().items():
+                assert metric_type != "counter" or name.endswith("_total")
+                line_list.append(f"# TYPE {name} {metric_type}")
+                line_list.append(f"{name} {value}")
+        return "\n".join(line_list) + "\n"
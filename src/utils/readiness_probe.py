@@ -0,0 +1,57 @@
+import time
+from typing import Callable, Optional
+
+import requests
+
+from src.typings import HttpServerException, HttpTimeoutException
+from .logger import SafeLogger
+
+
+class ReadinessProbe:
+    """
+    Wait until a Server is ready, instead of sleeping for a fixed time after starting it. The server is ready when
+    /ping responds. The principal of the server (e.g., the tasks and their containers) is constructed before the server
+    starts listening, so the server is not ready until the construction is finished.
+    """
+
+    @staticmethod
+    def wait_until_ready(
+        server_address: str,
+        timeout: float,
+        alive_checker: Optional[Callable[[], bool]] = None,
+        interval: tuple[float, float] = (0.1, 2.0),
+    ) -> None:
+        """
+        Args:
+            server_address (str): The address of the server, without the trailing slash.
+            timeout (float): The deadline in seconds.
+            alive_checker (Optional[Callable[[], bool]]): Returns False if the process of the server has exited, so
+                that the failure is reported without waiting for the deadline.
+            interval (tuple[float, float]): The initial and the maximum waiting time between two probes. The waiting
+                time is doubled after each probe.
+        """
+        deadline = time.monotonic() + timeout
+        waiting_time = interval[0]
+        while True:
+            try:
+                response = requests.post(
+                    f"{server_address}/ping", json={}, timeout=interval[1]
+                )
+                if response.ok:
+                    SafeLogger.info(f"Server at {server_address} is ready.")
+                    return
+            except requests.exceptions.RequestException:
+                pass  # The server is not listening yet.
+            if alive_checker is not None and not alive_checker():
+                error_message = f"Server at {server_address} exited before it is ready."
+                SafeLogger.error(error_message)
+                raise HttpServerException(error_message)
+            remaining_time = deadline - time.monotonic()
+            if remaining_time <= 0:
+                error_message = (
+                    f"Server at {server_address} is not ready in {timeout} seconds."
+                )
+                SafeLogger.error(error_message)
+                raise HttpTimeoutException(error_message)
+            time.sleep(min(waiting_time, remaining_time))
+            waiting_time = min(waiting_time * 2, interval[1])
@@ -4,11 +4,27 @@ The original code can be accessed using: from python_retry import retry.
 The modified code provides better type hinting.
 """
 
+import asyncio
+import contextvars
+import enum
 import functools
+import inspect
+import random
+import threading
 import time
-from typing import Callable, Optional, ParamSpec, TypeVar, final
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Optional,
+    ParamSpec,
+    TypeVar,
+    cast,
+    final,
+)
 from abc import ABC, abstractmethod
 
+from src.typings import HttpCircuitOpenException
 from .logger import SafeLogger
 
 
@@ -54,6 +70,145 @@ class ExponentialBackoffStrategy(BackoffStrategyInterface):
         return backoff_time
 
 
+class FullJitterBackoffStrategy(ExponentialBackoffStrategy):
+    """
+    The waiting time is drawn uniformly from [0, exponential backoff time], the upper bound is capped by interval[1].
+    The callers that fail at the same time (e.g., all the sessions on a restarted server) retry at different times,
+    instead of retrying together in every round.
+    """
+
+    def _calculate(self, retry_index: int) -> float:
+        backoff_time = super()._calculate(retry_index)
+        if self.interval[1] is not None:
+            backoff_time = min(backoff_time, self.interval[1])
+        return random.uniform(0, backoff_time)
+
+
+class CircuitBreakerState(enum.StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    The circuit breaker of an endpoint, shared by all the callers in the process. See RetryHandler.handle().
+    - CLOSED: The calls are allowed. After failure_threshold consecutive failures, the breaker is opened.
+    - OPEN: The calls fail immediately with HttpCircuitOpenException, without reaching the endpoint. After
+      recovery_timeout seconds, the breaker becomes half-open.
+    - HALF_OPEN: One trial call is allowed at a time, the other calls fail immediately. The breaker is closed if the
+      trial call succeeds, and opened again if it fails.
+    """
+
+    failure_threshold: ClassVar[int] = 5
+    recovery_timeout: ClassVar[float] = 30  # Second
+    _instance_dict: ClassVar[dict[str, "CircuitBreaker"]] = {}
+    _instance_dict_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, endpoint: str) -> None:
+        self.endpoint = endpoint
+        self._state = CircuitBreakerState.CLOSED
+        self._consecutive_failure_count = 0
+        self._open_time = 0.0
+        self._trial_call_flag = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def set_config(cls, failure_threshold: int, recovery_timeout: float) -> None:
+        assert failure_threshold > 0 and recovery_timeout >= 0
+        cls.failure_threshold = failure_threshold
+        cls.recovery_timeout = recovery_timeout
+
+    @classmethod
+    def get_instance(cls, endpoint: str) -> "CircuitBreaker":
+        with cls._instance_dict_lock:
+            if endpoint not in cls._instance_dict:
+                cls._instance_dict[endpoint] = CircuitBreaker(endpoint)
+            return cls._instance_dict[endpoint]
+
+    def get_state(self) -> CircuitBreakerState:
+        with self._lock:
+            return self._state
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._state == CircuitBreakerState.CLOSED:
+                return
+            if self._state == CircuitBreakerState.OPEN:
+                if time.monotonic() - self._open_time < self.recovery_timeout:
+                    raise HttpCircuitOpenException(
+                        f"The circuit breaker of {self.endpoint} is open."
+                    )
+                self._state = CircuitBreakerState.HALF_OPEN
+                self._trial_call_flag = False
+            if self._trial_call_flag:
+                raise HttpCircuitOpenException(
+                    f"The circuit breaker of {self.endpoint} is half-open, and the trial call is running."
+                )
+            self._trial_call_flag = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CircuitBreakerState.CLOSED:
+                SafeLogger.info(f"The circuit breaker of {self.endpoint} is closed.")
+            self._state = CircuitBreakerState.CLOSED
+            self._consecutive_failure_count = 0
+            self._trial_call_flag = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failure_count += 1
+            if self._state == CircuitBreakerState.HALF_OPEN or (
+                self._state == CircuitBreakerState.CLOSED
+                and self._consecutive_failure_count >= self.failure_threshold
+            ):
+                SafeLogger.error(
+                    f"The circuit breaker of {self.endpoint} is opened after "
+                    f"{self._consecutive_failure_count} consecutive failures."
+                )
+                self._state = CircuitBreakerState.OPEN
+                self._open_time = time.monotonic()
+                self._trial_call_flag = False
+
+
+class RetryBudget:
+    """
+    The total waiting time of the retries that belong to a sample. SessionRunner activates the budget of the session
+    while its steps are running, and RetryHandler stops retrying when the next waiting time exceeds the remaining
+    budget, so a sample cannot spend more than the budget on waiting, however many calls it makes. The active budget
+    is stored in a ContextVar, so the concurrent sessions in different threads (or coroutines) do not share it.
+    """
+
+    _current_budget: ClassVar[contextvars.ContextVar[Optional["RetryBudget"]]] = (
+        contextvars.ContextVar("retry_budget", default=None)
+    )
+
+    def __init__(self, total_waiting_time: float) -> None:
+        self.remaining_waiting_time = total_waiting_time
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_current(cls) -> Optional["RetryBudget"]:
+        return cls._current_budget.get()
+
+    def run(self, func: Callable[[], None]) -> None:
+        token = RetryBudget._current_budget.set(self)
+        try:
+            func()
+        finally:
+            RetryBudget._current_budget.reset(token)
+
+    def consume(self, waiting_time: float) -> bool:
+        """
+        Return False (and consume nothing) if the remaining budget is not enough.
+        """
+        with self._lock:
+            if waiting_time > self.remaining_waiting_time:
+                return False
+            self.remaining_waiting_time -= waiting_time
+            return True
+
+
 # https://stackoverflow.com/a/68290080
 Param = ParamSpec("Param")
 RetType = TypeVar("RetType")
@@ -65,23 +220,102 @@ class RetryHandler:
         max_retries: int = 3,
         waiting_strategy: BackoffStrategyInterface = ExponentialBackoffStrategy(),
         retry_on: Optional[tuple[type[Exception], ...]] = None,
+        circuit_breaker_endpoint_getter: Optional[Callable[..., str]] = None,
+        circuit_breaker_failure_on: Optional[tuple[type[Exception], ...]] = None,
+        give_up_on: Optional[tuple[type[Exception], ...]] = None,
     ) -> Callable[[Callable[Param, RetType]], Callable[Param, RetType]]:
+        """
+        The decorated function can be a coroutine function, the waiting is done by asyncio.sleep() in that case.
+        Args:
+            circuit_breaker_endpoint_getter: Receives the arguments of the call and returns the endpoint, e.g., the
+                server address. If it is set, every attempt goes through the CircuitBreaker of the endpoint, and
+                HttpCircuitOpenException is raised without retrying when the breaker is open.
+            circuit_breaker_failure_on: The exceptions that are failures of the endpoint. The other exceptions mean
+                that the endpoint responded, they are recorded as successes. Defaults to retry_on.
+            give_up_on: The exceptions in retry_on that are raised without retrying, e.g., the request is rejected by
+                the server, so sending it again does not help.
+        The retries stop early if the waiting time exceeds the RetryBudget of the current sample.
+        """
+        failure_on = circuit_breaker_failure_on or retry_on or (Exception,)
+
+        def get_circuit_breaker(*args: Any, **kwargs: Any) -> Optional[CircuitBreaker]:
+            if circuit_breaker_endpoint_getter is None:
+                return None
+            return CircuitBreaker.get_instance(
+                circuit_breaker_endpoint_getter(*args, **kwargs)
+            )
+
+        def record_exception(
+            circuit_breaker: Optional[CircuitBreaker], e: Exception
+        ) -> None:
+            if circuit_breaker is None:
+                return
+            if isinstance(e, failure_on):
+                circuit_breaker.record_failure()
+            else:
+                circuit_breaker.record_success()
+
+        def get_waiting_time(n: int, e: Exception) -> float:
+            # Raise e if the retries are exhausted.
+            if give_up_on is not None and isinstance(e, give_up_on):
+                raise e
+            if n == max_retries:
+                SafeLogger.error(f"{e}, retried has been exhausted...")
+                raise e
+            seconds = waiting_strategy.calculate(n)
+            retry_budget = RetryBudget.get_current()
+            if retry_budget is not None and not retry_budget.consume(seconds):
+                SafeLogger.error(f"{e}, the retry budget of the sample is exhausted...")
+                raise e
+            SafeLogger.warning(f"{e}, retrying in {seconds} seconds...")
+            return seconds
+
         def decorator(func: Callable[Param, RetType]) -> Callable[Param, RetType]:
+            if inspect.iscoroutinefunction(func):
+
+                @functools.wraps(func)
+                async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                    circuit_breaker = get_circuit_breaker(*args, **kwargs)
+                    for n in range(max_retries + 1):
+                        if circuit_breaker is not None:
+                            circuit_breaker.before_call()
+                        try:
+                            result = await func(*args, **kwargs)
+                        except retry_on or Exception as e:
+                            record_exception(circuit_breaker, e)
+                            await asyncio.sleep(get_waiting_time(n, e))
+                            continue
+                        except Exception as e:
+                            record_exception(circuit_breaker, e)
+                            raise e
+                        if circuit_breaker is not None:
+                            circuit_breaker.record_success()
+                        return result
+                    raise RuntimeError("This should never be reached")
+
+                return cast(Callable[Param, RetType], async_wrapper)
+
             # https://stackoverflow.com/a/309000
             @functools.wraps(func)
             def wrapper(*args: Param.args, **kwargs: Param.kwargs) -> RetType:
+                circuit_breaker = get_circuit_breaker(*args, **kwargs)
                 for n in range(max_retries + 1):
+                    if circuit_breaker is not None:
+                        circuit_breaker.before_call()
                     try:
-                        return func(*args, **kwargs)
+                        result = func(*args, **kwargs)
                     except retry_on or Exception as e:
                         # return with/without Exception
-                        if n == max_retries:
-                            SafeLogger.error(f"{e}, retried has been exhausted...")
-                            raise e
+                        record_exception(circuit_breaker, e)
                         # time sleep
-                        seconds = waiting_strategy.calculate(n)
-                        SafeLogger.warning(f"{e}, retrying in {seconds} seconds...")
-                        time.sleep(seconds)
+                        time.sleep(get_waiting_time(n, e))
+                        continue
+                    except Exception as e:
+                        record_exception(circuit_breaker, e)
+                        raise e
+                    if circuit_breaker is not None:
+                        circuit_breaker.record_success()
+                    return result
                 raise RuntimeError("This should never be reached")
 
             return wrapper
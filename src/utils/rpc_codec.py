@@ -0,0 +1,228 @@
+import gzip
+import time
+from typing import Any, Callable, Coroutine, Optional, Sequence
+
+import orjson
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from .metric_registry import MetricRegistry
+
+try:
+    import zstandard  # type: ignore[import-not-found]
+except ImportError:
+    # zstandard is optional, gzip is used instead.
+    zstandard = None
+
+
+class RpcCodec:
+    """
+    The encoding of the payloads between Client and Server. The payloads are always JSON, so the peers written by the
+    previous version (which send and accept plain JSON) still work. On top of that:
+    - The JSON is produced and parsed by orjson, instead of the json module.
+    - The payloads larger than compression_threshold are compressed with the first coding in
+      compression_content_encoding_list that is accepted by the peer. The server lists the codings it can decompress in
+      the Accept-Encoding header of the response (RFC 7694), and the client only compresses the requests after it has
+      seen the header. The responses are compressed according to the Accept-Encoding header of the request.
+    By default, only zstd (if zstandard is installed) is used to compress the payloads. gzip is always accepted, but it
+    is slower than sending the uncompressed payload over a LAN. See benchmarks/serialization_benchmark.py.
+    """
+
+    compression_threshold: int = 256 * 1024  # Byte
+    compression_content_encoding_list: Sequence[str] = (
+        ["zstd"] if zstandard is not None else []
+    )
+
+    @classmethod
+    def set_compression(
+        cls,
+        compression_threshold: int,
+        compression_content_encoding_list: Sequence[str],
+    ) -> None:
+        for content_encoding in compression_content_encoding_list:
+            assert content_encoding in cls.get_supported_content_encoding_list()
+        cls.compression_threshold = compression_threshold
+        cls.compression_content_encoding_list = compression_content_encoding_list
+
+    @staticmethod
+    def get_supported_content_encoding_list() -> list[str]:
+        # The codings that can be decompressed, ordered by preference.
+        if zstandard is not None:
+            return ["zstd", "gzip"]
+        return ["gzip"]
+
+    @staticmethod
+    def select_content_encoding(
+        accept_encoding: Optional[str], body_size: int
+    ) -> Optional[str]:
+        # The q-values in Accept-Encoding are ignored, the peers only send the codings they support.
+        if accept_encoding is None or body_size < RpcCodec.compression_threshold:
+            return None
+        accepted_content_encoding_set = {
+            content_encoding.split(";")[0].strip()
+            for content_encoding in accept_encoding.split(",")
+        }
+        for content_encoding in RpcCodec.compression_content_encoding_list:
+            if content_encoding in accepted_content_encoding_set:
+                return content_encoding
+        return None
+
+    @staticmethod
+    def compress(body: bytes, content_encoding: str) -> bytes:
+        match content_encoding:
+            case "zstd":
+                assert zstandard is not None
+                compressed_body: bytes = zstandard.ZstdCompressor(level=3).compress(
+                    body
+                )
+                return compressed_body
+            case "gzip":
+                # The chat history is mostly text, level 1 is much faster than the default level 9, and the ratio is
+                # close.
+                return gzip.compress(body, compresslevel=1)
+            case _:
+                raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+    @staticmethod
+    def decompress(body: bytes, content_encoding: str) -> bytes:
+        match content_encoding:
+            case "zstd":
+                if zstandard is None:
+                    raise ValueError("zstandard is not installed.")
+                decompressed_body: bytes = zstandard.ZstdDecompressor().decompress(body)
+                return decompressed_body
+            case "gzip":
+                return gzip.decompress(body)
+            case "identity":
+                return body
+            case _:
+                raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+
+class RpcRequest(Request):
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            if (content_encoding := self.headers.get("content-encoding")) is not None:
+                body = RpcCodec.decompress(body, content_encoding)
+            self._body = body
+        return self._body
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class RpcRoute(APIRoute):
+    """
+    The route class used by Server. It decodes the requests and encodes the responses by RpcCodec. If metric_registry
+    is set (see with_metric_registry()), the requests are recorded in it.
+    """
+
+    metric_registry: Optional[MetricRegistry] = None
+
+    @classmethod
+    def with_metric_registry(cls, metric_registry: MetricRegistry) -> type["RpcRoute"]:
+        # The route class is instantiated by the router, so the registry of each Server is bound to a subclass.
+        return type(cls.__name__, (cls,), {"metric_registry": metric_registry})
+
+    def _record_request(
+        self,
+        metric_registry: MetricRegistry,
+        status_code: int,
+        latency: float,
+        request_size: int,
+        response_size: int,
+    ) -> None:
+        label_dict = {"api": self.path}
+        metric_registry.increase_counter(
+            "server_request_total",
+            "The requests handled by the server.",
+            {**label_dict, "status_code": str(status_code)},
+        )
+        metric_registry.observe_histogram(
+            "server_request_latency_seconds",
+            "The time from receiving the request to creating the response.",
+            MetricRegistry.LATENCY_BUCKET_UPPER_BOUND_LIST,
+            latency,
+            label_dict,
+        )
+        metric_registry.observe_histogram(
+            "server_request_size_bytes",
+            "The size of the request bodies, after compression.",
+            MetricRegistry.SIZE_BUCKET_UPPER_BOUND_LIST,
+            request_size,
+            label_dict,
+        )
+        metric_registry.observe_histogram(
+            "server_response_size_bytes",
+            "The size of the response bodies, after compression.",
+            MetricRegistry.SIZE_BUCKET_UPPER_BOUND_LIST,
+            response_size,
+            label_dict,
+        )
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        rpc_route_handler = RpcRoute._get_rpc_route_handler(super().get_route_handler())
+        metric_registry = self.metric_registry
+        if metric_registry is None:
+            return rpc_route_handler
+
+        async def recorded_rpc_route_handler(request: Request) -> Response:
+            start_time = time.perf_counter()
+            metric_registry.increase_gauge(
+                "server_in_flight_request_count",
+                "The requests that are being handled by the server.",
+                {"api": self.path},
+                1,
+            )
+            status_code = 500
+            response_size = 0
+            try:
+                response = await rpc_route_handler(request)
+                status_code = response.status_code
+                response_size = len(response.body)
+                return response
+            except Exception as e:
+                # E.g., HTTPException, which is converted to the response by FastAPI.
+                status_code = getattr(e, "status_code", 500)
+                raise e
+            finally:
+                metric_registry.increase_gauge(
+                    "server_in_flight_request_count",
+                    "The requests that are being handled by the server.",
+                    {"api": self.path},
+                    -1,
+                )
+                self._record_request(
+                    metric_registry,
+                    status_code,
+                    time.perf_counter() - start_time,
+                    int(request.headers.get("content-length", 0)),
+                    response_size,
+                )
+
+        return recorded_rpc_route_handler
+
+    @staticmethod
+    def _get_rpc_route_handler(
+        original_route_handler: Callable[[Request], Coroutine[Any, Any, Response]],
+    ) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        async def rpc_route_handler(request: Request) -> Response:
+            request = RpcRequest(request.scope, request.receive)
+            response = await original_route_handler(request)
+            content_encoding = RpcCodec.select_content_encoding(
+                request.headers.get("accept-encoding"), len(response.body)
+            )
+            if content_encoding is not None:
+                response.body = RpcCodec.compress(response.body, content_encoding)
+                response.headers["content-encoding"] = content_encoding
+                response.headers["content-length"] = str(len(response.body))
+            # Tell the client which codings can be used to compress the requests.
+            response.headers["accept-encoding"] = ", ".join(
+                RpcCodec.get_supported_content_encoding_list()
+            )
+            return response
+
+        return rpc_route_handler
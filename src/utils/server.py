@@ -1,5 +1,11 @@
-from fastapi import APIRouter
-from typing import Any
+import anyio.from_thread
+import inspect
+import uuid
+from fastapi import APIRouter, Depends, Response
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from typing import Any, get_type_hints
 
 from src.typings import (
     GeneralRequest,
@@ -8,21 +14,46 @@ from src.typings import (
     InstanceFactoryType,
 )
 from .client import Client
+from .metric_registry import MetricRegistry
+from .rpc_codec import RpcRoute
 from abc import ABC, abstractmethod
 
 
 class Server(ABC):
     def __init__(self, router: APIRouter, principal: object):
         self.router = router
+        # The requests are recorded in metric_registry, and exported by /metrics. The subclasses can add their own
+        # metrics, e.g., by MetricRegistry.register_gauge_collector().
+        self.metric_registry = MetricRegistry()
+        # The route class and the response class must be set before adding the routes. See RpcCodec.
+        self.router.route_class = RpcRoute.with_metric_registry(self.metric_registry)
+        self.router.default_response_class = ORJSONResponse
         self.principal = principal
+        # It is changed by every set_attribute() call, and sent in the X-Attribute-Version header of every response,
+        # so that the clients can invalidate their attribute cache. See Client.cached_attribute_name_set.
+        self.attribute_version = uuid.uuid4().hex
+        self.router.dependencies.append(Depends(self._set_attribute_version_header))
         self.router.post("/ping")(self.ping)
         self.router.post("/get_attribute")(self.get_attribute)
         self.router.post("/set_attribute")(self.set_attribute)
+        self.router.post("/batch")(self.batch)
+        # Prometheus scrapes the metrics by GET.
+        self.router.get("/metrics")(self.get_metrics)
+
+    def _set_attribute_version_header(self, response: Response) -> None:
+        # The header is set before the api is called, so the response of set_attribute() carries the previous
+        # version. It only causes one more cache miss on the client.
+        response.headers["x-attribute-version"] = self.attribute_version
 
     @staticmethod
     def ping() -> GeneralResponse.Ping:
         return GeneralResponse.Ping(response="Hello, World!")
 
+    def get_metrics(self) -> PlainTextResponse:
+        return PlainTextResponse(
+            self.metric_registry.export(), media_type=MetricRegistry.CONTENT_TYPE
+        )
+
     def get_attribute(
         self, data: GeneralRequest.GetAttribute
     ) -> GeneralResponse.GetAttribute:
@@ -51,8 +82,43 @@ class Server(ABC):
             parameter_dict=data.instance_factory_parameter_dict,
         )
         setattr(self.principal, data.name, value)
+        self.attribute_version = uuid.uuid4().hex
         return
 
+    def batch(self, data: GeneralRequest.Batch) -> GeneralResponse.Batch:
+        """
+        Run the calls to the other apis of the server in order, so that the client can send them in one request (see
+        Client._call_server_batch()). The batch stops at the first exception, which is raised as if the api is called
+        directly. The calls before it are not rolled back.
+        """
+        endpoint_dict = {
+            route.path: route.endpoint
+            for route in self.router.routes
+            if isinstance(route, APIRoute)
+        }
+        result_list: list[Any] = []
+        for call in data.call_list:
+            assert call.api != "/batch"
+            endpoint = endpoint_dict[call.api]
+            # The apis take no argument, or a single pydantic model as the request payload.
+            argument_list: list[Any] = []
+            parameter_list = list(inspect.signature(endpoint).parameters.values())
+            if len(parameter_list) > 0:
+                assert len(parameter_list) == 1 and call.data is not None
+                request_cls: type[BaseModel] = get_type_hints(endpoint)[
+                    parameter_list[0].name
+                ]
+                argument_list.append(request_cls.model_validate(call.data))
+            if inspect.iscoroutinefunction(endpoint):
+                # batch() is run in the thread pool of FastAPI, the coroutine is run in the event loop.
+                result = anyio.from_thread.run(endpoint, *argument_list)
+            else:
+                result = endpoint(*argument_list)
+            if isinstance(result, BaseModel):
+                result = result.model_dump(mode="json")
+            result_list.append(result)
+        return GeneralResponse.Batch(result_list=result_list)
+
     @staticmethod
     @abstractmethod
     def start_server(*args: Any, **kwargs: Any) -> None:
@@ -0,0 +1,267 @@
+import json
+import os
+from typing import Any, BinaryIO, Iterator, Optional, Sequence, overload
+from pydantic import BaseModel
+
+from src.typings import (
+    Session,
+    SampleIndex,
+    SampleStatus,
+    SessionEvaluationRecord,
+    SessionMetricCalculationPartial,
+    SessionMetricAggregator,
+)
+from .logger import SafeLogger
+
+
+class SessionLogIndexEntry(BaseModel):
+    """
+    The entry of the index file of SessionLog. The evaluation related fields are stored in the index, so that the
+    metric can be calculated without reading the (large) session log.
+    """
+
+    offset: int
+    length: int
+    sample_index: SampleIndex
+    sample_status: SampleStatus
+    evaluation_record: SessionEvaluationRecord
+
+
+class SessionLogSessionSequence(Sequence[Session]):
+    """
+    A read-only view of the sessions in SessionLog. The sessions are read from the disk only when they are accessed,
+    so that restoring a large assignment does not load all the sessions into memory.
+    The view always reflects the latest state of the log.
+    """
+
+    def __init__(self, session_log: "SessionLog"):
+        self._session_log = session_log
+
+    def __len__(self) -> int:
+        return self._session_log.get_session_count()
+
+    @overload
+    def __getitem__(self, index: int) -> Session: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[Session]: ...
+
+    def __getitem__(self, index: int | slice) -> Session | Sequence[Session]:
+        index_entry_list = self._session_log.get_index_entry_list()
+        if isinstance(index, slice):
+            return [
+                self._session_log.read_session(index_entry)
+                for index_entry in index_entry_list[index]
+            ]
+        return self._session_log.read_session(index_entry_list[index])
+
+    def __iter__(self) -> Iterator[Session]:
+        return self._session_log.iterate_session()
+
+
+class SessionLog:
+    """
+    An append-only log of the finished sessions.
+    - log_path: JSONL file, one session per line.
+    - index_path: JSONL file, one SessionLogIndexEntry per line, pointing to the line in log_path.
+    A session is first appended to log_path, then to index_path. So a session is committed if and only if its index
+    entry is written completely and points to a complete line of log_path. The damaged tail caused by a crash is
+    truncated when the log is opened, see _repair().
+    fsync is called once every fsync_interval sessions (and in close()), since calling it for every session is slow on
+    network file systems. The sessions that are not fsynced may be lost if the machine (not the process) crashes, and
+    they will be run again when the assignment is restored.
+    """
+
+    def __init__(self, log_path: str, index_path: str, fsync_interval: int = 16):
+        assert fsync_interval > 0
+        self.log_path = log_path
+        self.index_path = index_path
+        self.fsync_interval = fsync_interval
+        self._index_entry_list: list[SessionLogIndexEntry] = []
+        self._session_metric_aggregator = SessionMetricAggregator()
+        self._unsynced_count = 0
+        for path in [log_path, index_path]:
+            output_dir = os.path.dirname(path)
+            if output_dir != "" and not os.path.exists(output_dir):
+                os.makedirs(output_dir)
+        self._repair()
+        self._log_file: BinaryIO = open(self.log_path, "ab")
+        self._index_file: BinaryIO = open(self.index_path, "ab")
+
+    def _repair(self) -> None:
+        """
+        The files are only appended, so a crash can only damage their tails: A torn line, a tail filled with zeros
+        (the blocks that are not fsynced before the machine crashes), or the index entries that point beyond the end
+        of the log (the index is written to the disk but the log is not). Every index entry is checked against the
+        log, and both files are truncated after the last valid entry.
+        """
+        # region Read the index entries that are valid in both files
+        valid_index_size = 0
+        valid_log_size = 0
+        if os.path.exists(self.index_path):
+            with (
+                open(self.index_path, "rb") as index_file,
+                open(self.log_path, "ab+") as log_file,
+            ):
+                for line in index_file:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        index_entry = SessionLogIndexEntry.model_validate_json(line)
+                    except ValueError:
+                        break
+                    if not SessionLog._is_log_line_valid(
+                        log_file, index_entry, valid_log_size
+                    ):
+                        break
+                    self._index_entry_list.append(index_entry)
+                    self._session_metric_aggregator.append(
+                        SessionLog._get_session_metric_calculation_partial(index_entry)
+                    )
+                    valid_index_size += len(line)
+                    valid_log_size += index_entry.length
+        # endregion
+        # region Truncate the damaged tail of the index file and the log file
+        for path, valid_size in [
+            (self.index_path, valid_index_size),
+            (self.log_path, valid_log_size),
+        ]:
+            if os.path.exists(path) and os.path.getsize(path) > valid_size:
+                SafeLogger.warning(
+                    f"Truncate the incomplete tail of {path} "
+                    f"from {os.path.getsize(path)} bytes to {valid_size} bytes."
+                )
+                with open(path, "r+b") as f:
+                    f.truncate(valid_size)
+        # endregion
+
+    @staticmethod
+    def _is_log_line_valid(
+        log_file: BinaryIO, index_entry: SessionLogIndexEntry, expected_offset: int
+    ) -> bool:
+        # The entries are contiguous, and each of them points to a complete JSON line of the same sample.
+        if index_entry.offset != expected_offset:
+            return False
+        log_file.seek(index_entry.offset)
+        line = log_file.read(index_entry.length)
+        if len(line) != index_entry.length or not line.endswith(b"\n"):
+            return False
+        try:
+            session_dict = json.loads(line)
+        except ValueError:
+            return False
+        return (
+            isinstance(session_dict, dict)
+            and session_dict.get("sample_index") == index_entry.sample_index
+        )
+
+    def append(self, session: Session) -> None:
+        encoded_line = (
+            json.dumps(session.model_dump(), ensure_ascii=False) + "\n"
+        ).encode("utf-8")
+        self._log_file.write(encoded_line)
+        self._log_file.flush()
+        offset = (
+            0
+            if len(self._index_entry_list) == 0
+            else self._index_entry_list[-1].offset + self._index_entry_list[-1].length
+        )
+        index_entry = SessionLogIndexEntry(
+            offset=offset,
+            length=len(encoded_line),
+            sample_index=session.sample_index,
+            sample_status=session.sample_status,
+            evaluation_record=session.evaluation_record,
+        )
+        self._index_file.write((index_entry.model_dump_json() + "\n").encode("utf-8"))
+        self._index_file.flush()
+        self._index_entry_list.append(index_entry)
+        self._session_metric_aggregator.append(
+            SessionLog._get_session_metric_calculation_partial(index_entry)
+        )
+        self._unsynced_count += 1
+        if self._unsynced_count >= self.fsync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        # The log file must be synced before the index file, see the docstring of the class.
+        os.fsync(self._log_file.fileno())
+        os.fsync(self._index_file.fileno())
+        self._unsynced_count = 0
+
+    def close(self) -> None:
+        if self._log_file.closed:
+            return
+        self.sync()
+        self._log_file.close()
+        self._index_file.close()
+
+    def get_index_entry_list(self) -> Sequence[SessionLogIndexEntry]:
+        return self._index_entry_list
+
+    def get_session_count(self) -> int:
+        return len(self._index_entry_list)
+
+    def get_completed_sample_index_set(self) -> set[SampleIndex]:
+        return {index_entry.sample_index for index_entry in self._index_entry_list}
+
+    @staticmethod
+    def _get_session_metric_calculation_partial(
+        index_entry: SessionLogIndexEntry,
+    ) -> SessionMetricCalculationPartial:
+        return SessionMetricCalculationPartial(
+            sample_index=index_entry.sample_index,
+            sample_status=index_entry.sample_status,
+            evaluation_record=index_entry.evaluation_record,
+        )
+
+    def get_session_metric_aggregator(self) -> SessionMetricAggregator:
+        # The aggregator is updated when a session is appended. Only the index is used, the sessions are not read from
+        # the disk. Pass it to Task.calculate_metric() to calculate the metric incrementally.
+        return self._session_metric_aggregator
+
+    def get_session_sequence(self) -> SessionLogSessionSequence:
+        return SessionLogSessionSequence(self)
+
+    def read_session(self, index_entry: SessionLogIndexEntry) -> Session:
+        with open(self.log_path, "rb") as f:
+            f.seek(index_entry.offset)
+            return Session.model_validate_json(f.read(index_entry.length))
+
+    def iterate_session_dict(self) -> Iterator[dict[str, Any]]:
+        # Stream the committed sessions, the whole log is never loaded into memory.
+        with open(self.log_path, "rb") as f:
+            # Copy the list, since new sessions may be appended during the iteration.
+            for index_entry in list(self._index_entry_list):
+                f.seek(index_entry.offset)
+                session_dict: dict[str, Any] = json.loads(f.read(index_entry.length))
+                yield session_dict
+
+    def iterate_session(self) -> Iterator[Session]:
+        for session_dict in self.iterate_session_dict():
+            yield Session.model_validate(session_dict)
+
+    def export(self, output_path: str) -> None:
+        """
+        Export the log to the legacy format (runs.json), which is a JSON list dumped with indent=2.
+        The output is the same as `json.dump([s.model_dump() for s in session_list], f, indent=2)`, but the sessions
+        are written one by one.
+        """
+        temp_output_path = f"{output_path}.tmp"
+        with open(temp_output_path, "w") as f:
+            f.write("[")
+            for session_index, session_dict in enumerate(self.iterate_session_dict()):
+                f.write(",\n  " if session_index > 0 else "\n  ")
+                f.write(json.dumps(session_dict, indent=2).replace("\n", "\n  "))
+            f.write("\n]" if self.get_session_count() > 0 else "]")
+        os.replace(temp_output_path, output_path)
+
+    def import_legacy(self, legacy_output_path: str) -> None:
+        # Convert the runs.json written by the previous version into the log.
+        assert self.get_session_count() == 0
+        legacy_session_dict_list: Optional[list[dict[str, Any]]] = json.load(
+            open(legacy_output_path, "r")
+        )
+        for session_dict in legacy_session_dict_list or []:
+            self.append(Session.model_validate(session_dict))
+        self.sync()
@@ -0,0 +1,118 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Any, Iterator, Optional, Sequence
+
+from src.typings import SampleIndex
+
+
+class Tracer:
+    """
+    Record the duration of the phases of the sessions (task, agent, callback, http) and save them in the Chrome trace
+    event format, which can be opened by https://ui.perfetto.dev or chrome://tracing.
+    The tracer is a process-wide singleton, and it is disabled by default. When it is disabled, span() does nothing.
+    The sample index of the enclosing span is inherited by the nested spans (e.g., the http request sent by
+    TaskClient.interact()), so that every event can be attributed to a sample.
+    """
+
+    _enabled_flag: bool = False
+    _event_list: list[dict[str, Any]] = []
+    _thread_name_dict: dict[int, str] = {}
+    _lock = threading.Lock()
+    _sample_index_context: contextvars.ContextVar[Optional[SampleIndex]] = (
+        contextvars.ContextVar("tracer_sample_index", default=None)
+    )
+
+    @classmethod
+    def enable(cls) -> None:
+        cls._enabled_flag = True
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls._enabled_flag
+
+    @classmethod
+    @contextlib.contextmanager
+    def span(
+        cls, name: str, category: str, sample_index: Optional[SampleIndex] = None
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Record the code in the with-block as a complete event. The yielded dict is saved as the args of the event, so
+        the caller can attach information that is only known at the end of the block (e.g., the round of the task).
+        """
+        span_arg_dict: dict[str, Any] = {}
+        if not cls._enabled_flag:
+            yield span_arg_dict
+            return
+        token: Optional[contextvars.Token[Optional[SampleIndex]]] = None
+        if sample_index is not None:
+            token = cls._sample_index_context.set(sample_index)
+        else:
+            sample_index = cls._sample_index_context.get()
+        start_time = time.time_ns()
+        try:
+            yield span_arg_dict
+        finally:
+            end_time = time.time_ns()
+            if token is not None:
+                cls._sample_index_context.reset(token)
+            if sample_index is not None:
+                span_arg_dict["sample_index"] = sample_index
+            thread = threading.current_thread()
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start_time / 1000,  # Microsecond
+                "dur": (end_time - start_time) / 1000,
+                "pid": os.getpid(),
+                "tid": thread.ident,
+                "args": span_arg_dict,
+            }
+            with cls._lock:
+                cls._event_list.append(event)
+                if thread.ident is not None:
+                    cls._thread_name_dict[thread.ident] = thread.name
+
+    @classmethod
+    def save(cls, output_path: str) -> None:
+        with cls._lock:
+            event_list = list(cls._event_list)
+            thread_name_dict = dict(cls._thread_name_dict)
+        pid = os.getpid()
+        metadata_event_list: list[dict[str, Any]] = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": thread_name},
+            }
+            for tid, thread_name in thread_name_dict.items()
+        ]
+        output_dir = os.path.dirname(output_path)
+        if output_dir != "" and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        json.dump(
+            {
+                "traceEvents": metadata_event_list + event_list,
+                "displayTimeUnit": "ms",
+            },
+            open(output_path, "w"),  # noqa
+        )
+
+    @staticmethod
+    def merge(trace_path_list: Sequence[str], output_path: str) -> None:
+        # Merge the traces saved by different processes (e.g., the shards of an assignment). The events are
+        # distinguished by pid.
+        event_list: list[dict[str, Any]] = []
+        for trace_path in trace_path_list:
+            if os.path.exists(trace_path):
+                event_list.extend(json.load(open(trace_path, "r"))["traceEvents"])
+        json.dump(
+            {"traceEvents": event_list, "displayTimeUnit": "ms"},
+            open(output_path, "w"),  # noqa
+        )
@@ -0,0 +1,125 @@
+import threading
+from typing import Any, Mapping, Sequence
+
+from src.language_models import BatchInferenceScheduler, LanguageModel
+from src.typings import (
+    ChatHistory,
+    ChatHistoryItem,
+    LanguageModelUnknownException,
+    Role,
+)
+
+# Long enough for all the requests of a test to arrive before the first batch is flushed.
+MAX_WAIT_TIME = 1.0
+
+
+class EchoLanguageModel(LanguageModel):
+    """
+    Reply with the content of the last chat history item, and record the content of every batch. The chat histories
+    whose content contains "fail" make the whole batch fail.
+    """
+
+    def __init__(self) -> None:
+        super().__init__({"user": "user", "agent": "assistant"})
+        self.batch_list: list[tuple[list[str], str]] = []
+        self._batch_list_lock = threading.Lock()
+
+    def _inference(
+        self,
+        batch_chat_history: Sequence[ChatHistory],
+        inference_config_dict: Mapping[str, Any],
+        system_prompt: str,
+    ) -> Sequence[ChatHistoryItem]:
+        content_list = [
+            chat_history.get_item(-1).content for chat_history in batch_chat_history
+        ]
+        with self._batch_list_lock:
+            self.batch_list.append((content_list, system_prompt))
+        for content in content_list:
+            if "fail" in content:
+                raise ValueError(f"Cannot reply to {content}.")
+        return [
+            ChatHistoryItem(role=Role.AGENT, content=f"{system_prompt} {content}")
+            for content in content_list
+        ]
+
+
+def create_chat_history(content: str) -> ChatHistory:
+    chat_history = ChatHistory()
+    chat_history.inject({"role": Role.USER, "content": content})
+    return chat_history
+
+
+class TestClass:
+    def test_grouping(self):
+        language_model = EchoLanguageModel()
+        scheduler = BatchInferenceScheduler(language_model, 8, MAX_WAIT_TIME)
+        future_list = [
+            scheduler.submit(create_chat_history(str(index)), None, system_prompt)
+            for index, system_prompt in enumerate(["a", "b", "a", "b", "a"])
+        ]
+        for future in future_list:
+            future.result(timeout=10)
+        # The requests with different system prompts are never put into the same batch.
+        assert sorted(language_model.batch_list) == [
+            (["0", "2", "4"], "a"),
+            (["1", "3"], "b"),
+        ]
+
+    def test_max_batch_size(self):
+        language_model = EchoLanguageModel()
+        scheduler = BatchInferenceScheduler(language_model, 2, MAX_WAIT_TIME)
+        future_list = [
+            scheduler.submit(create_chat_history(str(index))) for index in range(5)
+        ]
+        for future in future_list:
+            future.result(timeout=10)
+        assert [content_list for content_list, _ in language_model.batch_list] == [
+            ["0", "1"],
+            ["2", "3"],
+            ["4"],
+        ]
+
+    def test_result_routing(self):
+        language_model = EchoLanguageModel()
+        scheduler = BatchInferenceScheduler(language_model, 8, MAX_WAIT_TIME)
+        result_dict: dict[int, str] = {}
+
+        def run_session(index: int) -> None:
+            result_dict[index] = scheduler.inference(
+                create_chat_history(str(index)), None, "s"
+            ).content
+
+        thread_list = [
+            threading.Thread(target=run_session, args=(index,)) for index in range(6)
+        ]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join(timeout=10)
+        # Every session receives the reply to its own chat history, although they are generated in one batch.
+        assert len(language_model.batch_list) == 1
+        assert result_dict == {index: f"s {index}" for index in range(6)}
+
+    def test_single_item_fallback(self):
+        language_model = EchoLanguageModel()
+        scheduler = BatchInferenceScheduler(language_model, 8, MAX_WAIT_TIME)
+        future_list = [
+            scheduler.submit(create_chat_history(content))
+            for content in ["0", "fail", "2"]
+        ]
+        # The failed batch is retried one by one, so only the request that causes the exception receives it.
+        assert future_list[0].result(timeout=10).content.endswith(" 0")
+        assert future_list[2].result(timeout=10).content.endswith(" 2")
+        try:
+            future_list[1].result(timeout=10)
+        except LanguageModelUnknownException:
+            pass
+        else:
+            raise AssertionError("The exception should be delivered to the request.")
+        assert [content_list for content_list, _ in language_model.batch_list] == [
+            ["0", "fail", "2"],
+            ["0"],
+            ["fail"],
+            ["2"],
+        ]
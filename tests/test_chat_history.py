@@ -0,0 +1,72 @@
+from pydantic import ValidationError
+
+from src.typings import ChatHistory, ChatHistoryItem, Role
+
+
+def create_chat_history() -> ChatHistory:
+    chat_history = ChatHistory()
+    chat_history.inject({"role": Role.USER, "content": "Instruction."})
+    chat_history.inject({"role": Role.AGENT, "content": "Act."})
+    chat_history.inject({"role": Role.USER, "content": "Observation."})
+    return chat_history
+
+
+class TestClass:
+    def test_immutable_item(self):
+        chat_history = create_chat_history()
+        item = chat_history.get_item(0)
+        try:
+            item.content = "Modified."
+        except ValidationError:
+            pass
+        else:
+            raise AssertionError("The item should be immutable.")
+        # The item is returned without copying.
+        assert chat_history.get_item(0) is item
+        # The items are replaced by set(), and the role cannot be changed.
+        chat_history.set(0, {"role": Role.USER, "content": "Modified."})
+        assert chat_history.get_item(0).content == "Modified."
+        assert item.content == "Instruction."
+        try:
+            chat_history.set(1, {"role": Role.USER, "content": "Act."})
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError("The role of the item should not be changed.")
+
+    def test_value_view(self):
+        chat_history = create_chat_history()
+        value_view = chat_history.get_value_view()
+        assert [item.content for item in value_view] == [
+            "Instruction.",
+            "Act.",
+            "Observation.",
+        ]
+        # The view is live, and the slices are read-only.
+        chat_history.inject({"role": Role.AGENT, "content": "Finish."})
+        assert len(value_view) == 4
+        assert value_view[-1].content == "Finish."
+        assert isinstance(value_view[1:3], tuple)
+        try:
+            value_view[0] = ChatHistoryItem(role=Role.USER, content="Modified.")  # type: ignore[index]
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("The view should be read-only.")
+
+    def test_copy(self):
+        chat_history = create_chat_history()
+        chat_history_copy = chat_history.get_copy()
+        # The items are shared, but the lists are not.
+        assert chat_history_copy.get_item(1) is chat_history.get_item(1)
+        chat_history_copy.inject({"role": Role.AGENT, "content": "Finish."})
+        chat_history_copy.set(0, {"role": Role.USER, "content": "Modified."})
+        assert chat_history.get_value_length() == 3
+        assert chat_history.get_item(0).content == "Instruction."
+        # The copy is serialized in the same way as the original chat history.
+        assert (
+            ChatHistory.model_validate_json(
+                chat_history.get_copy().model_dump_json()
+            ).get_checksum()
+            == chat_history.get_checksum()
+        )
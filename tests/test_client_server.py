@@ -2,12 +2,13 @@ from abc import ABC, abstractmethod
 from multiprocessing import Process
 
 from pydantic import BaseModel
+import requests
 import uvicorn
 from fastapi import FastAPI, APIRouter
 import time
 import socket
 
-from src.utils import Server, Client
+from src.utils import Server, Client, MetricRegistry
 
 
 class Request:
@@ -156,6 +157,10 @@ class PrincipleClient(Client, PrincipleInterface):
         return response.str_identity, response.int_identity, response.bool_identity
 
 
+class CachedPrincipleClient(PrincipleClient):
+    cached_attribute_name_set = frozenset({"int_identity", "left_parent"})
+
+
 """
 Hierarchy:
 f   g
@@ -271,6 +276,86 @@ class TestClass:
         client_g2 = client_a.left_parent.right_parent.left_parent
         assert client_g1.str_identity == client_g2.str_identity
 
+    def test_batch(self):
+        str_identity, int_identity, none_value = client_c.get_attribute_list(
+            ["str_identity", "int_identity", "none_value"]
+        )
+        assert (str_identity, int_identity, none_value) == ("c", 2, None)
+        response_list = client_c._call_server_batch(
+            [
+                ("/set_str_identity", Request.SetStrIdentity(str_identity="x"), None),
+                ("/get_str_identity", None, Response.GetStrIdentity),
+                (
+                    "/func_with_args",
+                    Request.FunctionWithArgs(arg1=0, arg2="c"),
+                    Response.FunctionWithArgs,
+                ),
+            ]
+        )
+        assert response_list[0] is None
+        assert response_list[1].str_identity == "x"
+        assert response_list[2].str_identity == "x"
+        client_c.str_identity = "c"
+
+    def test_attribute_cache(self):
+        cached_client_c = CachedPrincipleClient(f"http://localhost:{port_list[2]}", 1)
+        assert cached_client_c.int_identity == 2
+        assert cached_client_c.left_parent is None
+        request_count = cached_client_c.get_connection_statistics().request_count
+        assert cached_client_c.int_identity == 2
+        assert cached_client_c.left_parent is None
+        assert cached_client_c.bool_identity is True  # Not cached
+        assert (
+            cached_client_c.get_connection_statistics().request_count
+            == request_count + 1
+        )
+        # Set by the client itself
+        cached_client_c.int_identity = 20
+        assert cached_client_c.int_identity == 20
+        # Set by another client, the cache is invalidated after the next request
+        client_c.int_identity = 2
+        _ = cached_client_c.get_str_identity()
+        assert cached_client_c.int_identity == 2
+
+    def test_metrics(self):
+        _ = client_c.func_with_args(0, "c")
+        response = requests.get(f"http://localhost:{port_list[2]}/metrics")
+        assert response.ok
+        metric_text = response.text
+        assert 'server_request_total{api="/func_with_args",status_code="200"}' in (
+            metric_text
+        )
+        assert 'server_request_latency_seconds_bucket{api="/ping",le="+Inf"}' in (
+            metric_text
+        )
+        assert 'server_in_flight_request_count{api="/func_with_args"} 0' in (
+            metric_text
+        )
+
+    def test_metric_collector(self):
+        metric_registry = MetricRegistry()
+        query_count_list = [0]
+        metric_registry.register_gauge_collector(lambda: {"running_query_count": 1})
+        metric_registry.register_counter_collector(
+            lambda: {"query_total": query_count_list[0]}
+        )
+        query_count_list[0] += 2
+        metric_text = metric_registry.export()
+        assert (
+            "# TYPE running_query_count gauge\nrunning_query_count 1\n" in metric_text
+        )
+        assert "# TYPE query_total counter\nquery_total 2\n" in metric_text
+        # The counters must follow the naming convention of Prometheus.
+        metric_registry.register_counter_collector(lambda: {"query_count": 0})
+        try:
+            metric_registry.export()
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError(
+                "The counter without the _total suffix should be rejected."
+            )
+
     def test_finish(self):
         for process in process_list:
             process.terminate()
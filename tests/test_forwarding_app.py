@@ -0,0 +1,104 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from fastapi.testclient import TestClient
+
+from src.distributed_deployment_utils.forwarding_app import main as forwarding_app
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    # Reply with the path, the body and the custom header of the request.
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        response_body = json.dumps(
+            {
+                "path": self.path,
+                "body": body.decode("utf-8"),
+                "x_test": self.headers.get("X-Test"),
+            }
+        ).encode("utf-8")
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response_body)))
+        self.send_header("X-Backend", "echo")
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("localhost", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+def set_route_list(routes: str) -> None:
+    # The routes are read from the environment variable when the module is imported.
+    forwarding_app.route_list[:] = forwarding_app.parse_route_list(routes)
+
+
+class TestClass:
+    def test_route_matching(self):
+        assert forwarding_app.parse_route_list(
+            " task/ =http://a:1, /task/db=http://b:2,,/=http://c:3"
+        ) == [("/task/db", "http://b:2"), ("/task", "http://a:1"), ("/", "http://c:3")]
+        set_route_list("/task=http://a:1,/task/db=http://b:2")
+        try:
+            # The longest matching prefix is used, and a prefix only matches whole path segments.
+            assert (
+                forwarding_app.get_backend_url("/task/db/reset", 8000) == "http://b:2"
+            )
+            assert (
+                forwarding_app.get_backend_url("/task/os/reset", 8000) == "http://a:1"
+            )
+            assert forwarding_app.get_backend_url("/task", 8000) == "http://a:1"
+            assert (
+                forwarding_app.get_backend_url("/tasks/reset", 8000)
+                == f"{forwarding_app.DESTINATION_SERVER}:8000"
+            )
+        finally:
+            set_route_list("")
+
+    def test_forwarding(self):
+        port = get_free_port()
+        http_server = ThreadingHTTPServer(("localhost", port), EchoHandler)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        set_route_list(f"/api=http://localhost:{port}")
+        try:
+            with TestClient(forwarding_app.app) as client:
+                response = client.post(
+                    "/api/reset?flag=1",
+                    content=b"x" * 65536,
+                    headers={"X-Test": "forwarded", "Connection": "keep-alive"},
+                )
+            assert response.status_code == 201
+            assert response.headers["X-Backend"] == "echo"
+            assert response.json() == {
+                "path": "/api/reset?flag=1",
+                "body": "x" * 65536,
+                "x_test": "forwarded",
+            }
+        finally:
+            set_route_list("")
+            http_server.shutdown()
+            http_server.server_close()
+
+    def test_unreachable_backend(self):
+        backend_url = f"http://localhost:{get_free_port()}"
+        set_route_list(f"/api={backend_url}")
+        try:
+            with TestClient(forwarding_app.app) as client:
+                response = client.post("/api/reset", content=b"{}")
+                assert response.status_code == 503
+                metric_text = client.get("/metrics").text
+            assert (
+                f'forwarding_app_request_error_total{{backend="{backend_url}"}} 1'
+                in metric_text
+            )
+        finally:
+            set_route_list("")
@@ -0,0 +1,496 @@
+import json
+import os
+import tempfile
+import threading
+from typing import Any
+
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, decoders, trainers
+from transformers import (
+    GPT2Config,
+    GPT2LMHeadModel,
+    LlamaConfig,
+    LlamaForCausalLM,
+    DynamicCache,
+    PreTrainedTokenizerFast,
+)
+
+from benchmarks.synthetic_task import SyntheticTask
+from src.agents.instance.language_model_agent import LanguageModelAgent
+from src.callbacks import CallbackHandler
+from src.factories.chat_history_item import ChatHistoryItemFactory
+from src.language_models.instance.huggingface_kv_cache_pool import (
+    HuggingfaceKVCachePool,
+)
+from src.language_models.instance.huggingface_language_model import (
+    HuggingfaceLanguageModel,
+)
+from src.runners import SessionRunner
+from src.typings import (
+    ChatHistory,
+    ChatHistoryItem,
+    Role,
+    SampleStatus,
+    Session,
+    TaskName,
+)
+from src.utils import SessionLog
+
+
+CHAT_TEMPLATE = (
+    "{% for message in messages %}"
+    "<|{{ message['role'] }}|>{{ message['content'] }}<|end|>"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}<|assistant|>{% endif %}"
+)
+INFERENCE_CONFIG_DICT = {"do_sample": False, "max_new_tokens": 8}
+TASK_REQUIREMENT = (
+    "You are an assistant that operates a Linux shell. In every round, answer with one command in a code block, "
+    "and the output of the command will be given in the next round. Answer with the final result when you are done.\n"
+)
+
+
+def create_tiny_model_dir(model_type: str) -> str:
+    # A randomly initialized model with a byte-level BPE tokenizer trained in place, so that no file is downloaded.
+    model_dir = tempfile.mkdtemp()
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    special_token_list = ["<|end|>", "<|system|>", "<|user|>", "<|assistant|>"]
+    tokenizer.train_from_iterator(
+        ["You are a helpful assistant. List the files in the directory. ls -a"] * 8,
+        trainers.BpeTrainer(
+            vocab_size=384,
+            special_tokens=special_token_list,
+            initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+        ),
+    )
+    pretrained_tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, eos_token="<|end|>"
+    )
+    pretrained_tokenizer.chat_template = CHAT_TEMPLATE
+    pretrained_tokenizer.save_pretrained(model_dir)
+    torch.manual_seed(0)
+    model: LlamaForCausalLM | GPT2LMHeadModel
+    if model_type == "llama":
+        model = LlamaForCausalLM(
+            LlamaConfig(
+                vocab_size=len(pretrained_tokenizer),
+                hidden_size=32,
+                intermediate_size=64,
+                num_hidden_layers=2,
+                num_attention_heads=4,
+                max_position_embeddings=1024,
+            )
+        )
+    else:
+        model = GPT2LMHeadModel(
+            GPT2Config(
+                vocab_size=len(pretrained_tokenizer),
+                n_embd=32,
+                n_layer=2,
+                n_head=4,
+                n_positions=1024,
+                # The tied embeddings of a small initialization repeat the last token of the prompt.
+                initializer_range=0.5,
+            )
+        )
+    model.save_pretrained(model_dir)
+    return model_dir
+
+
+model_dir_dict = {
+    model_type: create_tiny_model_dir(model_type) for model_type in ["llama", "gpt2"]
+}
+
+
+def create_language_model(
+    max_kv_cache_size_mb: float | None = None,
+    continuous_batching_max_batch_size: int | None = None,
+    model_type: str = "llama",
+) -> HuggingfaceLanguageModel:
+    return HuggingfaceLanguageModel(
+        model_name_or_path=model_dir_dict[model_type],
+        role_dict={"user": "user", "agent": "assistant"},
+        dtype=torch.float32,
+        device_map="cpu",
+        max_kv_cache_size_mb=max_kv_cache_size_mb,
+        continuous_batching_max_batch_size=continuous_batching_max_batch_size,
+    )
+
+
+def create_chat_history(content: str) -> ChatHistory:
+    chat_history = ChatHistory()
+    chat_history.inject(ChatHistoryItem(role=Role.USER, content=content))
+    return chat_history
+
+
+def create_synthetic_task() -> SyntheticTask:
+    chat_history_item_dict_path = os.path.join(
+        tempfile.mkdtemp(), "chat_history_item.json"
+    )
+    with open(chat_history_item_dict_path, "w") as f:
+        json.dump(
+            {
+                "value": {
+                    "0": {"role": "user", "content": TASK_REQUIREMENT},
+                    "1": {"role": "agent", "content": "OK."},
+                }
+            },
+            f,
+        )
+    return SyntheticTask(
+        task_name=TaskName.OS_INTERACTION,
+        chat_history_item_factory=ChatHistoryItemFactory(chat_history_item_dict_path),
+        max_round=2,
+        sample_count=4,
+        round_count=2,
+        observation_size=16,
+    )
+
+
+def run_session_runner(
+    language_model: HuggingfaceLanguageModel, task_count: int
+) -> list[Session]:
+    output_dir = tempfile.mkdtemp()
+    session_log = SessionLog(
+        os.path.join(output_dir, "session_log.jsonl"),
+        os.path.join(output_dir, "session_log_index.jsonl"),
+    )
+    agent = LanguageModelAgent(
+        language_model, inference_config_dict={"do_sample": False, "max_new_tokens": 32}
+    )
+    session_runner = SessionRunner(
+        task_list=[create_synthetic_task() for _ in range(task_count)],
+        agent=agent,
+        callback_handler=CallbackHandler({}),
+        session_log=session_log,
+    )
+    session_runner.run(list(range(4)))
+    session_list = list(session_log.iterate_session())
+    session_log.close()
+    return session_list
+
+
+def run_session(
+    language_model: HuggingfaceLanguageModel, first_observation: str, round_count: int
+) -> list[str]:
+    chat_history = ChatHistory()
+    output_list: list[str] = []
+    for round_index in range(round_count):
+        chat_history.inject(
+            ChatHistoryItem(
+                role=Role.USER, content=f"{first_observation} round {round_index}"
+            )
+        )
+        chat_history_item = language_model.inference(
+            [chat_history], INFERENCE_CONFIG_DICT
+        )[0]
+        chat_history.inject(chat_history_item)
+        output_list.append(chat_history_item.content)
+    return output_list
+
+
+class TestClass:
+    def test_kv_cache_reuse(self):
+        language_model = create_language_model()
+        cached_language_model = create_language_model(max_kv_cache_size_mb=16)
+        kv_cache_pool = cached_language_model.kv_cache_pool
+        assert kv_cache_pool is not None
+        for first_observation in ["List the files.", "ls -a"]:
+            assert run_session(
+                cached_language_model, first_observation, 4
+            ) == run_session(language_model, first_observation, 4)
+        # The later rounds only prefill the new tokens, the other sessions reuse the system prompt.
+        assert kv_cache_pool.reused_token_count > kv_cache_pool.computed_token_count
+        # The entry of a session is replaced in every round.
+        assert len(kv_cache_pool) == 2
+
+    def test_shared_prefix(self):
+        language_model = create_language_model()
+        cached_language_model = create_language_model(max_kv_cache_size_mb=16)
+        kv_cache_pool = cached_language_model.kv_cache_pool
+        assert kv_cache_pool is not None
+        batch_chat_history = [
+            create_chat_history(TASK_REQUIREMENT + observation)
+            for observation in ["List the files.", "ls -a", "ls -l", "pwd"]
+        ]
+        output_list = cached_language_model.inference(
+            batch_chat_history[:3], INFERENCE_CONFIG_DICT
+        )
+        for chat_history, output in zip(batch_chat_history, output_list):
+            assert (
+                output.content
+                == language_model.inference([chat_history], INFERENCE_CONFIG_DICT)[
+                    0
+                ].content
+            )
+        # The prefix is computed once for the batch, and then copied into each chat history.
+        requirement_token_count = len(
+            cached_language_model.tokenizer.encode(TASK_REQUIREMENT)
+        )
+        assert kv_cache_pool.reused_token_count >= 3 * requirement_token_count
+        # A new session reuses the prefix as well.
+        reused_token_count = kv_cache_pool.reused_token_count
+        _ = cached_language_model.inference(
+            batch_chat_history[3:], INFERENCE_CONFIG_DICT
+        )
+        assert (
+            kv_cache_pool.reused_token_count - reused_token_count
+            >= requirement_token_count
+        )
+
+    def test_kv_cache_eviction(self):
+        cached_language_model = create_language_model(max_kv_cache_size_mb=0.05)
+        kv_cache_pool = cached_language_model.kv_cache_pool
+        assert kv_cache_pool is not None
+        for first_observation in ["List the files.", "ls -a", "ls -l"]:
+            _ = run_session(cached_language_model, first_observation, 2)
+            assert kv_cache_pool.size <= kv_cache_pool.max_size
+        assert len(kv_cache_pool) < 3
+
+    def test_kv_cache_release(self):
+        language_model = create_language_model()
+        cached_language_model = create_language_model(max_kv_cache_size_mb=16)
+        kv_cache_pool = cached_language_model.kv_cache_pool
+        assert kv_cache_pool is not None
+        for serial_session, cached_session in zip(
+            run_session_runner(language_model, 1),
+            run_session_runner(cached_language_model, 1),
+        ):
+            assert (
+                cached_session.chat_history.model_dump()
+                == serial_session.chat_history.model_dump()
+            )
+        # The entries of the finished sessions are released, only the task requirement is kept for the next session.
+        assert len(kv_cache_pool) == 1
+        requirement_token_count = len(
+            cached_language_model.tokenizer.encode(TASK_REQUIREMENT)
+        )
+        assert kv_cache_pool.reused_token_count >= 3 * requirement_token_count
+
+    def test_kv_cache_prefix_index(self):
+        kv_cache_pool = HuggingfaceKVCachePool(16)
+        generator = torch.Generator().manual_seed(0)
+        prefix_token_ids = torch.randint(0, 64, (40,), generator=generator)
+        token_ids_list = [
+            torch.cat(
+                [
+                    prefix_token_ids[: 8 * index],
+                    torch.randint(0, 64, (index * 5 + 3,), generator=generator),
+                ]
+            )
+            for index in range(6)
+        ]
+        for token_ids in token_ids_list:
+            kv_cache_pool.put(
+                token_ids,
+                token_ids.shape[0],
+                DynamicCache.from_legacy_cache(
+                    ((torch.zeros(1, 1, token_ids.shape[0], 1),) * 2,)
+                ),
+            )
+        for token_ids in token_ids_list + [prefix_token_ids]:
+            # The same as comparing with every entry, unless the common prefix is shorter than a block.
+            expected_prefix_length = max(
+                HuggingfaceKVCachePool.get_common_prefix_length(
+                    token_ids, other_token_ids
+                )
+                for other_token_ids in token_ids_list
+            )
+            if expected_prefix_length < HuggingfaceKVCachePool.PREFIX_BLOCK_SIZE:
+                expected_prefix_length = 0
+            assert (
+                kv_cache_pool.get_cached_prefix_length(token_ids)
+                == expected_prefix_length
+            )
+        # The entry of a finished session is removed, and its shared prefix is kept.
+        kv_cache_pool.release(token_ids_list[-1], 24)
+        assert len(kv_cache_pool) == len(token_ids_list)
+        assert kv_cache_pool.get_cached_prefix_length(token_ids_list[-1]) == 32
+        kv_cache_pool.release(token_ids_list[-2], 24)
+        assert len(kv_cache_pool) == len(token_ids_list) - 1
+
+    def test_continuous_batching(self):
+        for model_type in ["llama", "gpt2"]:
+            language_model = create_language_model(model_type=model_type)
+            batching_language_model = create_language_model(
+                continuous_batching_max_batch_size=3, model_type=model_type
+            )
+            engine = batching_language_model.continuous_batching_engine
+            assert engine is not None
+            # The prompts have different lengths, so the rows are padded differently.
+            batch_chat_history = [
+                create_chat_history(content)
+                for content in [
+                    "ls",
+                    "List the files.",
+                    TASK_REQUIREMENT,
+                    "pwd",
+                    "ls -a",
+                ]
+            ]
+            output_list = batching_language_model.inference(
+                batch_chat_history, INFERENCE_CONFIG_DICT
+            )
+            for chat_history, output in zip(batch_chat_history, output_list):
+                assert (
+                    output.content
+                    == language_model.inference([chat_history], INFERENCE_CONFIG_DICT)[
+                        0
+                    ].content
+                )
+            # The sequences are decoded together, and the waiting ones take the free slots.
+            assert engine.decode_step_count < engine.generated_token_count
+            # The requests of concurrent calls join the running batch, with their own configs.
+            thread_output_dict: dict[int, str] = {}
+
+            def run_inference(max_new_tokens: int) -> None:
+                thread_output_dict[max_new_tokens] = batching_language_model.inference(
+                    [batch_chat_history[0]], {"max_new_tokens": max_new_tokens}
+                )[0].content
+
+            thread_list = [
+                threading.Thread(target=run_inference, args=(max_new_tokens,))
+                for max_new_tokens in [2, 16]
+            ]
+            for thread in thread_list:
+                thread.start()
+            for thread in thread_list:
+                thread.join()
+            for max_new_tokens, content in thread_output_dict.items():
+                assert (
+                    content
+                    == language_model.inference(
+                        [batch_chat_history[0]], {"max_new_tokens": max_new_tokens}
+                    )[0].content
+                )
+
+    def test_continuous_batching_session_runner(self):
+        language_model = create_language_model()
+        batching_language_model = create_language_model(
+            continuous_batching_max_batch_size=2
+        )
+        engine = batching_language_model.continuous_batching_engine
+        assert engine is not None
+        assert LanguageModelAgent(
+            batching_language_model
+        ).supports_concurrent_inference()
+        assert not LanguageModelAgent(language_model).supports_concurrent_inference()
+        serial_session_list = run_session_runner(language_model, 1)
+        concurrent_session_list = run_session_runner(batching_language_model, 2)
+        for serial_session, concurrent_session in zip(
+            serial_session_list, concurrent_session_list
+        ):
+            assert concurrent_session.sample_status == SampleStatus.COMPLETED
+            assert (
+                concurrent_session.chat_history.model_dump()
+                == serial_session.chat_history.model_dump()
+            )
+        # The inference of the two sessions reaches the engine at the same time, so they are decoded together.
+        assert engine.decode_step_count < engine.generated_token_count
+
+    def test_continuous_batching_fallback(self):
+        language_model = create_language_model()
+        batching_language_model = create_language_model(
+            continuous_batching_max_batch_size=2
+        )
+        engine = batching_language_model.continuous_batching_engine
+        assert engine is not None
+        assert engine.is_supported(INFERENCE_CONFIG_DICT)
+        assert engine.is_supported({"do_sample": True, "temperature": 0.7})
+        for inference_config_dict in [
+            {"num_beams": 2},
+            {"repetition_penalty": 1.2},
+            {"no_repeat_ngram_size": 2},
+            {"min_new_tokens": 4},
+            {"bad_words_ids": [[5]]},
+            {"logits_processor": None},
+        ]:
+            assert not engine.is_supported(inference_config_dict)
+        # The generation config of the model is merged with the inference config.
+        for model in [language_model.model, batching_language_model.model]:
+            model.generation_config.repetition_penalty = 1.5
+        assert not engine.is_supported(INFERENCE_CONFIG_DICT)
+        chat_history = create_chat_history("List the files.")
+        assert (
+            batching_language_model.inference([chat_history], INFERENCE_CONFIG_DICT)[
+                0
+            ].content
+            == language_model.inference([chat_history], INFERENCE_CONFIG_DICT)[
+                0
+            ].content
+        )
+        assert engine.generated_token_count == 0
+
+    def test_kv_cache_with_continuous_batching(self):
+        language_model = create_language_model()
+        cached_language_model = create_language_model(max_kv_cache_size_mb=16)
+        combined_language_model = create_language_model(
+            max_kv_cache_size_mb=16, continuous_batching_max_batch_size=2
+        )
+        # The pool generates a batch one by one, so the batches are not worth waiting for.
+        assert language_model.supports_batch_inference()
+        assert not cached_language_model.supports_batch_inference()
+        assert combined_language_model.supports_batch_inference()
+        engine = combined_language_model.continuous_batching_engine
+        kv_cache_pool = combined_language_model.kv_cache_pool
+        assert engine is not None and kv_cache_pool is not None
+        chat_history = create_chat_history("List the files.")
+        expected_content = language_model.inference(
+            [chat_history], INFERENCE_CONFIG_DICT
+        )[0].content
+        # The calls that the engine supports do not use the pool.
+        assert (
+            combined_language_model.inference([chat_history], INFERENCE_CONFIG_DICT)[
+                0
+            ].content
+            == expected_content
+        )
+        assert engine.generated_token_count > 0
+        assert kv_cache_pool.computed_token_count == 0
+        # The calls that fall back to generate() use the pool.
+        generated_token_count = engine.generated_token_count
+        for model in [language_model.model, combined_language_model.model]:
+            model.generation_config.repetition_penalty = 1.5
+        assert (
+            combined_language_model.inference([chat_history], INFERENCE_CONFIG_DICT)[
+                0
+            ].content
+            == language_model.inference([chat_history], INFERENCE_CONFIG_DICT)[
+                0
+            ].content
+        )
+        assert engine.generated_token_count == generated_token_count
+        assert kv_cache_pool.computed_token_count > 0
+
+    def test_kv_cache_generation_lock(self):
+        combined_language_model = create_language_model(
+            max_kv_cache_size_mb=16, continuous_batching_max_batch_size=2
+        )
+        # The engine makes the calls concurrent, so the calls that fall back to the pool hold the generation lock.
+        assert combined_language_model.supports_concurrent_inference()
+        combined_language_model.model.generation_config.repetition_penalty = 1.5
+        locked_flag_list: list[bool] = []
+        inference_with_kv_cache = combined_language_model._inference_with_kv_cache
+
+        def recording_inference_with_kv_cache(*args: Any, **kwargs: Any) -> str:
+            locked_flag_list.append(combined_language_model._generation_lock.locked())
+            return inference_with_kv_cache(*args, **kwargs)
+
+        combined_language_model._inference_with_kv_cache = recording_inference_with_kv_cache  # type: ignore[method-assign]
+        chat_history_list = [
+            create_chat_history(observation) for observation in ["ls -a", "pwd"]
+        ]
+        thread_list = [
+            threading.Thread(
+                target=combined_language_model.inference,
+                args=([chat_history], INFERENCE_CONFIG_DICT),
+            )
+            for chat_history in chat_history_list
+        ]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        assert locked_flag_list == [True, True]
@@ -0,0 +1,161 @@
+import json
+import os
+import socket
+import tempfile
+import time
+from multiprocessing import Process
+
+from benchmarks.synthetic_task import SyntheticTask
+from src.factories.chat_history_item import ChatHistoryItemFactory
+from src.tasks.load_balanced_client import LoadBalancedTaskClient
+from src.tasks.server import TaskServer
+from src.typings import Role, SampleStatus, Session, TaskName
+from src.utils import ReadinessProbe
+
+ROUND_COUNT = 2
+
+
+def create_task() -> SyntheticTask:
+    chat_history_item_dict_path = os.path.join(
+        tempfile.mkdtemp(), "chat_history_item.json"
+    )
+    with open(chat_history_item_dict_path, "w") as f:
+        json.dump(
+            {
+                "value": {
+                    "0": {"role": "user", "content": "You are in a synthetic task."},
+                    "1": {"role": "agent", "content": "OK."},
+                }
+            },
+            f,
+        )
+    return SyntheticTask(
+        task_name=TaskName.DB_BENCH,
+        chat_history_item_factory=ChatHistoryItemFactory(chat_history_item_dict_path),
+        max_round=ROUND_COUNT,
+        sample_count=8,
+        round_count=ROUND_COUNT,
+        observation_size=16,
+    )
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("localhost", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+def start_task_server() -> tuple[Process, str]:
+    port = get_free_port()
+    process = Process(
+        target=TaskServer.start_server,
+        args=([create_task() for _ in range(2)], port, "/api"),
+        daemon=True,
+    )
+    process.start()
+    server_address = f"http://localhost:{port}/api"
+    ReadinessProbe.wait_until_ready(server_address, 30, process.is_alive)
+    return process, server_address
+
+
+def get_outstanding_session_count(server_address: str) -> int:
+    return LoadBalancedTaskClient._get_backend_state(
+        server_address
+    ).outstanding_session_count
+
+
+def run_session(task_client: LoadBalancedTaskClient, sample_index: int) -> Session:
+    session = Session(task_name=TaskName.DB_BENCH, sample_index=sample_index)
+    task_client.reset(session)
+    while session.sample_status == SampleStatus.RUNNING:
+        session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+        task_client.interact(session)
+    task_client.complete(session)
+    return session
+
+
+server_information_list = [start_task_server() for _ in range(2)]
+server_address_list = [server_address for _, server_address in server_information_list]
+
+
+class TestClass:
+    def test_routing(self):
+        client_1 = LoadBalancedTaskClient(server_address_list, 10)
+        client_2 = LoadBalancedTaskClient(server_address_list, 10)
+        session_1 = Session(task_name=TaskName.DB_BENCH, sample_index=0)
+        session_2 = Session(task_name=TaskName.DB_BENCH, sample_index=1)
+        client_1.reset(session_1)
+        client_2.reset(session_2)
+        # The second session is placed on the backend with fewer outstanding sessions.
+        assert {
+            client_1._session_server_address,
+            client_2._session_server_address,
+        } == set(server_address_list)
+        assert [
+            get_outstanding_session_count(server_address)
+            for server_address in server_address_list
+        ] == [1, 1]
+        # The session stays on its backend until it is completed.
+        session_server_address = client_1._session_server_address
+        while session_1.sample_status == SampleStatus.RUNNING:
+            session_1.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+            client_1.interact(session_1)
+            assert client_1._session_server_address == session_server_address
+        client_1.complete(session_1)
+        assert session_1.sample_status == SampleStatus.COMPLETED
+        assert client_1._session_server_address is None
+        assert get_outstanding_session_count(session_server_address) == 0
+        # An abandoned session is released when the next session is placed.
+        client_2.reset(Session(task_name=TaskName.DB_BENCH, sample_index=2))
+        assert (
+            sum(
+                get_outstanding_session_count(server_address)
+                for server_address in server_address_list
+            )
+            == 1
+        )
+        client_2.release()
+        assert client_2._session_server_address is None
+        assert [
+            get_outstanding_session_count(server_address)
+            for server_address in server_address_list
+        ] == [0, 0]
+
+    def test_failover(self):
+        unreachable_server_address = f"http://localhost:{get_free_port()}/api"
+        task_client = LoadBalancedTaskClient(
+            [unreachable_server_address, server_address_list[0]],
+            10,
+            health_check_timeout=1,
+        )
+        # The unreachable backend is ejected, and the session is placed on the other one.
+        session = run_session(task_client, 0)
+        assert session.sample_status == SampleStatus.COMPLETED
+        assert (
+            LoadBalancedTaskClient._get_backend_state(
+                unreachable_server_address
+            ).ejection_deadline
+            > time.monotonic()
+        )
+        assert get_outstanding_session_count(unreachable_server_address) == 0
+        # The ejected backend is skipped by the following sessions.
+        assert task_client.get_sample_index_list() == list(range(8))
+        assert unreachable_server_address not in task_client._task_client_dict
+
+    def test_attribute_proxy(self):
+        task_client = LoadBalancedTaskClient(server_address_list, 10)
+        task_client.max_round = ROUND_COUNT + 1
+        for server_address in server_address_list:
+            assert (
+                task_client._get_task_client(server_address).max_round
+                == ROUND_COUNT + 1
+            )
+        assert task_client.max_round == ROUND_COUNT + 1
+        task_client.max_round = ROUND_COUNT
+        assert task_client.max_round == ROUND_COUNT
+
+    def test_finish(self):
+        for process, _ in server_information_list:
+            process.terminate()
+            process.join()
@@ -0,0 +1,77 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.typings import HttpServerException, HttpTimeoutException
+from src.utils import ReadinessProbe
+
+
+class PingHandler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200 if self.path == "/api/ping" else 404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("localhost", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+class TestClass:
+    def test_ready_after_delay(self):
+        port = get_free_port()
+        http_server_list: list[ThreadingHTTPServer] = []
+
+        def start_http_server() -> None:
+            # Imitate the construction of the principal before the server starts listening.
+            time.sleep(0.5)
+            http_server = ThreadingHTTPServer(("localhost", port), PingHandler)
+            http_server_list.append(http_server)
+            http_server.serve_forever()
+
+        thread = threading.Thread(target=start_http_server, daemon=True)
+        thread.start()
+        try:
+            start_time = time.monotonic()
+            ReadinessProbe.wait_until_ready(
+                f"http://localhost:{port}/api", 10, thread.is_alive
+            )
+            assert 0.5 <= time.monotonic() - start_time < 5
+        finally:
+            for http_server in http_server_list:
+                http_server.shutdown()
+                http_server.server_close()
+
+    def test_timeout(self):
+        start_time = time.monotonic()
+        try:
+            ReadinessProbe.wait_until_ready(
+                f"http://localhost:{get_free_port()}/api", 0.5
+            )
+        except HttpTimeoutException:
+            pass
+        else:
+            raise AssertionError("The probe should time out.")
+        # The probe does not sleep past the deadline.
+        assert time.monotonic() - start_time < 2.5
+
+    def test_exited_server(self):
+        start_time = time.monotonic()
+        try:
+            ReadinessProbe.wait_until_ready(
+                f"http://localhost:{get_free_port()}/api", 30, lambda: False
+            )
+        except HttpServerException:
+            pass
+        else:
+            raise AssertionError("The exited server should be reported.")
+        # The failure is reported without waiting for the deadline.
+        assert time.monotonic() - start_time < 5
@@ -0,0 +1,157 @@
+import threading
+import time
+import uuid
+from typing import Optional
+
+from src.typings import HttpCircuitOpenException
+from src.utils import CircuitBreaker, RetryBudget, RetryHandler
+from src.utils.retry import (
+    CircuitBreakerState,
+    ExponentialBackoffStrategy,
+    FullJitterBackoffStrategy,
+)
+
+FAILURE_THRESHOLD = 3
+RECOVERY_TIMEOUT = 0.2
+
+
+class FailingCallable:
+    # Raise the exception on every call, and count the calls that reach it.
+    def __init__(self, exception_cls: type[Exception]) -> None:
+        self.exception_cls = exception_cls
+        self.call_count = 0
+
+    def __call__(self, endpoint: str) -> None:
+        self.call_count += 1
+        raise self.exception_cls(f"Call {self.call_count} to {endpoint} failed.")
+
+
+def assert_circuit_open(circuit_breaker: CircuitBreaker) -> None:
+    try:
+        circuit_breaker.before_call()
+    except HttpCircuitOpenException:
+        pass
+    else:
+        raise AssertionError("The call should be rejected by the circuit breaker.")
+
+
+class TestClass:
+    def setup_method(self) -> None:
+        # The config is shared by the whole process, it is restored after the test.
+        self.circuit_breaker_config = (
+            CircuitBreaker.failure_threshold,
+            CircuitBreaker.recovery_timeout,
+        )
+        CircuitBreaker.set_config(FAILURE_THRESHOLD, RECOVERY_TIMEOUT)
+
+    def teardown_method(self) -> None:
+        CircuitBreaker.set_config(*self.circuit_breaker_config)
+
+    def test_circuit_breaker_transition(self):
+        circuit_breaker = CircuitBreaker("endpoint")
+        # A success resets the consecutive failure count.
+        for _ in range(FAILURE_THRESHOLD - 1):
+            circuit_breaker.record_failure()
+        circuit_breaker.record_success()
+        for _ in range(FAILURE_THRESHOLD - 1):
+            circuit_breaker.record_failure()
+        assert circuit_breaker.get_state() == CircuitBreakerState.CLOSED
+        circuit_breaker.record_failure()
+        assert circuit_breaker.get_state() == CircuitBreakerState.OPEN
+        assert_circuit_open(circuit_breaker)
+        # After the recovery timeout, only one trial call is allowed at a time.
+        time.sleep(RECOVERY_TIMEOUT)
+        circuit_breaker.before_call()
+        assert circuit_breaker.get_state() == CircuitBreakerState.HALF_OPEN
+        assert_circuit_open(circuit_breaker)
+        # A failed trial call opens the breaker again.
+        circuit_breaker.record_failure()
+        assert circuit_breaker.get_state() == CircuitBreakerState.OPEN
+        assert_circuit_open(circuit_breaker)
+        # A successful trial call closes the breaker.
+        time.sleep(RECOVERY_TIMEOUT)
+        circuit_breaker.before_call()
+        circuit_breaker.record_success()
+        assert circuit_breaker.get_state() == CircuitBreakerState.CLOSED
+        circuit_breaker.before_call()
+        circuit_breaker.before_call()
+
+    def test_retry_handler_circuit_breaker(self):
+        endpoint = f"endpoint_{uuid.uuid4().hex}"
+        failing_callable = FailingCallable(ConnectionError)
+        decorated_callable = RetryHandler.handle(
+            max_retries=10,
+            waiting_strategy=ExponentialBackoffStrategy(multiplier=0),
+            retry_on=(ConnectionError,),
+            circuit_breaker_endpoint_getter=lambda endpoint_: endpoint_,
+        )(failing_callable)
+        try:
+            decorated_callable(endpoint)
+        except HttpCircuitOpenException:
+            pass
+        else:
+            raise AssertionError("The retries should be stopped by the breaker.")
+        # The endpoint is not reached once the breaker is opened.
+        assert failing_callable.call_count == FAILURE_THRESHOLD
+        assert (
+            CircuitBreaker.get_instance(endpoint).get_state()
+            == CircuitBreakerState.OPEN
+        )
+
+    def test_retry_handler_give_up(self):
+        failing_callable = FailingCallable(PermissionError)
+        decorated_callable = RetryHandler.handle(
+            max_retries=10,
+            waiting_strategy=ExponentialBackoffStrategy(multiplier=0),
+            retry_on=(OSError,),
+            give_up_on=(PermissionError,),
+        )(failing_callable)
+        try:
+            decorated_callable("endpoint")
+        except PermissionError:
+            pass
+        else:
+            raise AssertionError("The exception should be raised.")
+        assert failing_callable.call_count == 1
+
+    def test_retry_budget(self):
+        retry_budget = RetryBudget(0.3125)
+        failing_callable = FailingCallable(ConnectionError)
+        decorated_callable = RetryHandler.handle(
+            max_retries=10,
+            waiting_strategy=ExponentialBackoffStrategy(
+                exponent_base=1, multiplier=0.125
+            ),
+            retry_on=(ConnectionError,),
+        )(failing_callable)
+        budget_in_thread_list: list[Optional[RetryBudget]] = []
+
+        def run() -> None:
+            # The budget is not shared with the other threads.
+            thread = threading.Thread(
+                target=lambda: budget_in_thread_list.append(RetryBudget.get_current())
+            )
+            thread.start()
+            thread.join()
+            assert RetryBudget.get_current() is retry_budget
+            decorated_callable("endpoint")
+
+        try:
+            retry_budget.run(run)
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("The exception should be raised.")
+        # The third waiting time (0.125) exceeds the remaining budget (0.0625), so the retries stop after two waits.
+        assert failing_callable.call_count == 3
+        assert retry_budget.remaining_waiting_time == 0.0625
+        assert budget_in_thread_list == [None]
+        assert RetryBudget.get_current() is None
+        assert not retry_budget.consume(0.125)
+        assert retry_budget.consume(0.0625)
+
+    def test_full_jitter(self):
+        strategy = FullJitterBackoffStrategy(interval=(None, 4))
+        for retry_index in range(6):
+            for _ in range(20):
+                assert 0 <= strategy.calculate(retry_index) <= min(2**retry_index, 4)
@@ -0,0 +1,115 @@
+import json
+import os
+import tempfile
+
+from benchmarks.synthetic_task import SyntheticTask
+from src.factories.chat_history_item import ChatHistoryItemFactory
+from src.run_experiment import ConfigUtility
+from src.runners import SampleOrderScheduler
+from src.typings import AssignmentConfig, PathConfig, TaskName
+
+SAMPLE_COUNT = 4
+
+
+def create_task() -> SyntheticTask:
+    chat_history_item_dict_path = os.path.join(
+        tempfile.mkdtemp(), "chat_history_item.json"
+    )
+    with open(chat_history_item_dict_path, "w") as f:
+        json.dump(
+            {
+                "value": {
+                    "0": {"role": "user", "content": "You are in a synthetic task."},
+                    "1": {"role": "agent", "content": "OK."},
+                }
+            },
+            f,
+        )
+    return SyntheticTask(
+        task_name=TaskName.DB_BENCH,
+        chat_history_item_factory=ChatHistoryItemFactory(chat_history_item_dict_path),
+        max_round=2,
+        sample_count=SAMPLE_COUNT,
+        round_count=2,
+        observation_size=16,
+    )
+
+
+def create_session_dict(sample_index: int, round_count: int) -> dict[str, object]:
+    chat_history_item_list = [{"role": "user", "content": "Instruction."}]
+    for _ in range(round_count):
+        chat_history_item_list.append({"role": "agent", "content": "Act."})
+        chat_history_item_list.append({"role": "user", "content": "Observation."})
+    return {
+        "sample_index": sample_index,
+        "chat_history": {"value": chat_history_item_list},
+    }
+
+
+class TestClass:
+    def test_estimated_cost_order(self):
+        sample_order = SampleOrderScheduler.get_cost_aware_sample_order(
+            [0, 1, 2, 3], {0: 1.0, 1: 3.0, 2: 1.0, 3: 2.0}, {}
+        )
+        # The samples with the same cost keep their order.
+        assert sample_order == [1, 3, 0, 2]
+
+    def test_reference_scaling(self):
+        # The estimated cost is scaled by the samples in the reference assignment: (4 + 2) / (10 + 20) = 0.2.
+        # So the costs are {0: 4, 1: 2, 2: 30 * 0.2, 3: 40 * 0.2}.
+        sample_order = SampleOrderScheduler.get_cost_aware_sample_order(
+            [0, 1, 2, 3], {0: 10.0, 1: 20.0, 2: 30.0, 3: 40.0}, {0: 4, 1: 2}
+        )
+        assert sample_order == [3, 2, 0, 1]
+        # Without any shared sample, the estimated cost is used as is.
+        sample_order = SampleOrderScheduler.get_cost_aware_sample_order(
+            [0, 1], {0: 10.0, 1: 1.0}, {2: 5}
+        )
+        assert sample_order == [0, 1]
+
+    def test_reference_round_count(self):
+        reference_output_dir = tempfile.mkdtemp()
+        with open(os.path.join(reference_output_dir, "runs.jsonl"), "w") as f:
+            f.write(json.dumps(create_session_dict(0, 3)) + "\n")
+            f.write(json.dumps(create_session_dict(1, 1)) + "\n")
+            # The incomplete tail of the session log is ignored.
+            f.write(json.dumps(create_session_dict(2, 5))[:-8])
+        assert SampleOrderScheduler.get_reference_round_count_dict(
+            reference_output_dir
+        ) == {0: 3, 1: 1}
+        # The reference assignment written by the version without the session log.
+        legacy_output_dir = tempfile.mkdtemp()
+        json.dump(
+            [create_session_dict(0, 2), create_session_dict(3, 4)],
+            open(os.path.join(legacy_output_dir, "runs.json"), "w"),
+        )
+        assert SampleOrderScheduler.get_reference_round_count_dict(
+            legacy_output_dir
+        ) == {0: 2, 3: 4}
+
+    def test_sample_order_restore(self):
+        sample_order_output_path = os.path.join(tempfile.mkdtemp(), "sample_order.json")
+
+        def get_sample_order() -> list[int]:
+            config_utility = ConfigUtility(
+                AssignmentConfig.model_construct(
+                    sample_order="cost_aware",
+                    sample_cost_reference_dir=None,
+                    shard_count=1,
+                    shard_index=None,
+                ),
+                None,  # type: ignore[arg-type]
+                PathConfig.model_construct(
+                    sample_order_output_path=sample_order_output_path
+                ),
+            )
+            config_utility.postprocess(create_task(), None)  # type: ignore[arg-type]
+            sample_order = config_utility.assignment_config.sample_order
+            assert isinstance(sample_order, list)
+            return sample_order
+
+        assert get_sample_order() == list(range(SAMPLE_COUNT))
+        assert json.load(open(sample_order_output_path)) == list(range(SAMPLE_COUNT))
+        # The recorded order is reused when the assignment is restored.
+        json.dump([3, 1, 2, 0], open(sample_order_output_path, "w"))
+        assert get_sample_order() == [3, 1, 2, 0]
@@ -0,0 +1,120 @@
+import os
+import tempfile
+
+from src.typings import SampleStatus, Session, TaskName
+from src.utils import SessionLog
+
+SESSION_COUNT = 4
+
+
+def create_session(sample_index: int) -> Session:
+    session = Session(task_name=TaskName.DB_BENCH, sample_index=sample_index)
+    session.sample_status = SampleStatus.COMPLETED
+    session.chat_history.inject({"role": "user", "content": f"Question {sample_index}"})
+    return session
+
+
+def create_session_log() -> SessionLog:
+    output_dir = tempfile.mkdtemp()
+    session_log = SessionLog(
+        os.path.join(output_dir, "session_log.jsonl"),
+        os.path.join(output_dir, "session_log_index.jsonl"),
+    )
+    for sample_index in range(SESSION_COUNT):
+        session_log.append(create_session(sample_index))
+    session_log.close()
+    return session_log
+
+
+def reopen(session_log: SessionLog) -> SessionLog:
+    return SessionLog(session_log.log_path, session_log.index_path)
+
+
+def get_line_end_list(path: str) -> list[int]:
+    # The size of the file after every line.
+    line_end_list: list[int] = []
+    with open(path, "rb") as f:
+        for line in f:
+            line_end_list.append(
+                len(line) + (line_end_list[-1] if len(line_end_list) > 0 else 0)
+            )
+    return line_end_list
+
+
+def truncate(path: str, size: int) -> None:
+    with open(path, "r+b") as f:
+        f.truncate(size)
+
+
+def append_bytes(path: str, content: bytes) -> None:
+    with open(path, "ab") as f:
+        f.write(content)
+
+
+def check_repaired(session_log: SessionLog, session_count: int) -> None:
+    repaired_session_log = reopen(session_log)
+    assert [
+        session.sample_index for session in repaired_session_log.iterate_session()
+    ] == list(range(session_count))
+    assert len(repaired_session_log.get_session_metric_aggregator()) == session_count
+    # Both files are truncated to the last valid entry, so the log can be appended again.
+    assert os.path.getsize(session_log.log_path) == (
+        get_line_end_list(session_log.log_path)[-1] if session_count > 0 else 0
+    )
+    assert len(get_line_end_list(session_log.index_path)) == session_count
+    repaired_session_log.append(create_session(session_count))
+    repaired_session_log.close()
+    assert [
+        session.sample_index for session in reopen(session_log).iterate_session()
+    ] == list(range(session_count + 1))
+
+
+class TestClass:
+    def test_torn_log_line(self):
+        # The process crashes while the session is appended to the log, its index entry is not written.
+        session_log = create_session_log()
+        append_bytes(session_log.log_path, b'{"task_name": "db_bench", "sample_')
+        check_repaired(session_log, SESSION_COUNT)
+
+    def test_torn_index_line(self):
+        session_log = create_session_log()
+        index_line_end_list = get_line_end_list(session_log.index_path)
+        truncate(session_log.index_path, index_line_end_list[-1] - 5)
+        check_repaired(session_log, SESSION_COUNT - 1)
+
+    def test_index_longer_than_log(self):
+        # The index is written to the disk, but the log is not.
+        session_log = create_session_log()
+        log_line_end_list = get_line_end_list(session_log.log_path)
+        truncate(session_log.log_path, log_line_end_list[1] + 10)
+        check_repaired(session_log, 2)
+        session_log = create_session_log()
+        truncate(session_log.log_path, 0)
+        check_repaired(session_log, 0)
+
+    def test_zero_filled_tail(self):
+        # The blocks that are not fsynced before the machine crashes are read as zeros.
+        session_log = create_session_log()
+        log_line_end_list = get_line_end_list(session_log.log_path)
+        log_size = os.path.getsize(session_log.log_path)
+        truncate(session_log.log_path, log_line_end_list[2])
+        append_bytes(session_log.log_path, b"\0" * (log_size - log_line_end_list[2]))
+        check_repaired(session_log, 3)
+        session_log = create_session_log()
+        append_bytes(session_log.index_path, b"\0" * 100)
+        append_bytes(session_log.log_path, b"\0" * 100)
+        check_repaired(session_log, SESSION_COUNT)
+
+    def test_mismatched_entry(self):
+        # The index entry must point to the line of the same sample.
+        session_log = create_session_log()
+        index_line_end_list = get_line_end_list(session_log.index_path)
+        with open(session_log.index_path, "rb") as f:
+            last_line = f.read()[index_line_end_list[-2] :]
+        assert b'"sample_index":3' in last_line
+        truncate(session_log.index_path, index_line_end_list[-2])
+        append_bytes(
+            session_log.index_path,
+            last_line.replace(b'"sample_index":3', b'"sample_index":2'),
+        )
+        check_repaired(session_log, SESSION_COUNT - 1)
@@ -0,0 +1,324 @@
+import json
+import os
+import tempfile
+import time
+from typing import Optional, Sequence
+
+from benchmarks.mock_language_model import MockLanguageModel
+from benchmarks.synthetic_task import SyntheticTask
+from src.agents.instance.language_model_agent import LanguageModelAgent
+from src.callbacks import Callback, CallbackArguments, CallbackHandler
+from src.callbacks.instance.previous_sample_utilization_callback import (
+    PreviousSampleUtilizationCallback,
+)
+from src.factories.chat_history_item import ChatHistoryItemFactory
+from src.run_experiment import ConfigUtility
+from src.runners import SessionRunner
+from src.typings import (
+    AssignmentConfig,
+    Role,
+    SampleIndex,
+    SampleStatus,
+    Session,
+    TaskName,
+)
+from src.utils import SessionLog
+
+ROUND_COUNT = 3
+SAMPLE_COUNT = 8
+
+
+class SlowSyntheticTask(SyntheticTask):
+    # The interaction of sample 0 is much slower than the others, so it is completed after the sessions admitted
+    # after it.
+    def _interact(self, session: Session) -> None:
+        if session.sample_index == 0:
+            time.sleep(0.2)
+        super()._interact(session)
+
+
+class CheckpointRecordingCallback(Callback):
+    # Record whether the round checkpoint of the session exists when the agent is called.
+    def __init__(self, session_checkpoint_dir: str):
+        super().__init__()
+        self.session_checkpoint_dir = session_checkpoint_dir
+        self.checkpoint_length_list: list[Optional[int]] = []
+
+    @classmethod
+    def is_unique(cls) -> bool:
+        return False
+
+    def on_agent_inference(self, callback_args: CallbackArguments) -> None:
+        checkpoint_path = os.path.join(
+            self.session_checkpoint_dir,
+            f"{callback_args.current_session.sample_index}.json",
+        )
+        if not os.path.exists(checkpoint_path):
+            self.checkpoint_length_list.append(None)
+            return
+        with open(checkpoint_path, "r") as f:
+            checkpoint_session = Session.model_validate_json(f.read())
+        self.checkpoint_length_list.append(
+            checkpoint_session.chat_history.get_value_length()
+        )
+
+
+class EventRecordingCallback(Callback):
+    def __init__(self, aborted_sample_index_list: Sequence[SampleIndex] = ()):
+        super().__init__()
+        self.aborted_sample_index_list = aborted_sample_index_list
+        self.event_list: list[tuple[str, SampleIndex]] = []
+
+    @classmethod
+    def is_unique(cls) -> bool:
+        return False
+
+    def _record(self, event: str, callback_args: CallbackArguments) -> None:
+        self.event_list.append((event, callback_args.current_session.sample_index))
+
+    def on_session_create(self, callback_args: CallbackArguments) -> None:
+        self._record("on_session_create", callback_args)
+        if callback_args.current_session.sample_index in self.aborted_sample_index_list:
+            callback_args.current_session.sample_status = (
+                SampleStatus.AGENT_UNKNOWN_ERROR
+            )
+            callback_args.session_controller.should_task_reset = False
+            callback_args.session_controller.should_task_complete = False
+
+    def on_task_reset(self, callback_args: CallbackArguments) -> None:
+        self._record("on_task_reset", callback_args)
+
+    def on_agent_inference(self, callback_args: CallbackArguments) -> None:
+        self._record("on_agent_inference", callback_args)
+
+    def on_task_interact(self, callback_args: CallbackArguments) -> None:
+        self._record("on_task_interact", callback_args)
+
+    def on_task_complete(self, callback_args: CallbackArguments) -> None:
+        self._record("on_task_complete", callback_args)
+
+    def on_state_save(self, callback_args: CallbackArguments) -> None:
+        self._record("on_state_save", callback_args)
+
+    def get_sample_event_list(self, sample_index: SampleIndex) -> list[str]:
+        return [event for event, index in self.event_list if index == sample_index]
+
+
+def create_task() -> SyntheticTask:
+    chat_history_item_dict_path = os.path.join(
+        tempfile.mkdtemp(), "chat_history_item.json"
+    )
+    with open(chat_history_item_dict_path, "w") as f:
+        json.dump(
+            {
+                "value": {
+                    "0": {"role": "user", "content": "You are in a synthetic task."},
+                    "1": {"role": "agent", "content": "OK."},
+                }
+            },
+            f,
+        )
+    return SlowSyntheticTask(
+        task_name=TaskName.DB_BENCH,
+        chat_history_item_factory=ChatHistoryItemFactory(chat_history_item_dict_path),
+        max_round=ROUND_COUNT,
+        sample_count=SAMPLE_COUNT,
+        round_count=ROUND_COUNT,
+        observation_size=16,
+    )
+
+
+def run_session_runner(
+    task_count: int,
+    callback: EventRecordingCallback,
+    session_checkpoint_dir: Optional[str] = None,
+    sample_order: Sequence[SampleIndex] = tuple(range(SAMPLE_COUNT)),
+) -> list[Session]:
+    output_dir = tempfile.mkdtemp()
+    session_log = SessionLog(
+        os.path.join(output_dir, "session_log.jsonl"),
+        os.path.join(output_dir, "session_log_index.jsonl"),
+    )
+    agent = LanguageModelAgent(
+        MockLanguageModel({"user": "user", "agent": "assistant"}, 8)
+    )
+    session_runner = SessionRunner(
+        task_list=[create_task() for _ in range(task_count)],
+        agent=agent,
+        callback_handler=CallbackHandler({"recorder": callback}),
+        session_log=session_log,
+        session_checkpoint_dir=session_checkpoint_dir,
+    )
+    session_runner.run(list(sample_order))
+    session_list = list(session_log.iterate_session())
+    session_log.close()
+    return session_list
+
+
+class TestClass:
+    def test_in_order_commit(self):
+        callback = EventRecordingCallback()
+        session_list = run_session_runner(3, callback)
+        # Sample 1 is completed before sample 0, since there is no barrier between the sessions.
+        complete_order = [
+            index for event, index in callback.event_list if event == "on_task_complete"
+        ]
+        assert complete_order.index(1) < complete_order.index(0)
+        # But the sessions are committed in the order of admission.
+        assert [session.sample_index for session in session_list] == list(
+            range(SAMPLE_COUNT)
+        )
+        assert all(
+            session.sample_status == SampleStatus.COMPLETED for session in session_list
+        )
+        assert [
+            index for event, index in callback.event_list if event == "on_state_save"
+        ] == list(range(SAMPLE_COUNT))
+
+    def test_callback_ordering(self):
+        serial_callback = EventRecordingCallback()
+        serial_session_list = run_session_runner(1, serial_callback)
+        concurrent_callback = EventRecordingCallback()
+        concurrent_session_list = run_session_runner(3, concurrent_callback)
+        expected_event_list = (
+            ["on_session_create", "on_task_reset"]
+            + ["on_agent_inference", "on_task_interact"] * ROUND_COUNT
+            + ["on_task_complete", "on_state_save"]
+        )
+        for sample_index in range(SAMPLE_COUNT):
+            # For each session, the callback events follow the order of the serial loop.
+            assert (
+                concurrent_callback.get_sample_event_list(sample_index)
+                == serial_callback.get_sample_event_list(sample_index)
+                == expected_event_list
+            )
+        assert [session.model_dump() for session in concurrent_session_list] == [
+            session.model_dump() for session in serial_session_list
+        ]
+
+    def test_abort_at_create(self):
+        callback = EventRecordingCallback(aborted_sample_index_list=[0, 4])
+        session_list = run_session_runner(3, callback)
+        assert [session.sample_index for session in session_list] == list(
+            range(SAMPLE_COUNT)
+        )
+        for session in session_list:
+            if session.sample_index in [0, 4]:
+                assert session.sample_status == SampleStatus.AGENT_UNKNOWN_ERROR
+                assert session.chat_history.get_value_length() == 0
+                assert callback.get_sample_event_list(session.sample_index) == [
+                    "on_session_create",
+                    "on_state_save",
+                ]
+            else:
+                assert session.sample_status == SampleStatus.COMPLETED
+
+    def test_previous_session_dependent_callback_rejection(self):
+        config_utility = ConfigUtility(
+            AssignmentConfig.model_construct(
+                sample_order=[0],
+                concurrent_session_count=2,
+                shard_count=1,
+                shard_index=None,
+            ),
+            None,  # type: ignore[arg-type]
+            None,  # type: ignore[arg-type]
+        )
+        callback = PreviousSampleUtilizationCallback(
+            "{previous_sample_utilization_target_position}", 1
+        )
+        try:
+            config_utility.validate(
+                create_task(), None, {"previous_sample_utilization": callback}  # type: ignore[arg-type]
+            )
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError("The callback should be rejected.")
+        config_utility.assignment_config.concurrent_session_count = 1
+        config_utility.validate(
+            create_task(), None, {"previous_sample_utilization": callback}  # type: ignore[arg-type]
+        )
+
+    def test_round_checkpoint(self):
+        session_checkpoint_dir = tempfile.mkdtemp()
+        callback = EventRecordingCallback()
+        checkpoint_callback = CheckpointRecordingCallback(session_checkpoint_dir)
+        output_dir = tempfile.mkdtemp()
+        session_log = SessionLog(
+            os.path.join(output_dir, "session_log.jsonl"),
+            os.path.join(output_dir, "session_log_index.jsonl"),
+        )
+        session_runner = SessionRunner(
+            task_list=[create_task()],
+            agent=LanguageModelAgent(
+                MockLanguageModel({"user": "user", "agent": "assistant"}, 8)
+            ),
+            callback_handler=CallbackHandler(
+                {"recorder": callback, "checkpoint_recorder": checkpoint_callback}
+            ),
+            session_log=session_log,
+            session_checkpoint_dir=session_checkpoint_dir,
+        )
+        session_runner.run([0])
+        session_log.close()
+        # The checkpoint is saved after every round, and each round appends an agent response and an observation.
+        assert checkpoint_callback.checkpoint_length_list == [None, 5, 7]
+        # The checkpoint is removed once the session is committed.
+        assert os.listdir(session_checkpoint_dir) == []
+
+    def test_replay(self):
+        session_checkpoint_dir = tempfile.mkdtemp()
+        # Run the first round of sample 1, and save it as the checkpoint.
+        task = create_task()
+        checkpoint_session = Session(task_name=TaskName.DB_BENCH, sample_index=1)
+        task.reset(checkpoint_session)
+        checkpoint_session.chat_history.inject(
+            {"role": Role.AGENT, "content": "Recorded response."}
+        )
+        task.interact(checkpoint_session)
+        with open(os.path.join(session_checkpoint_dir, "1.json"), "w") as f:
+            f.write(checkpoint_session.model_dump_json())
+        callback = EventRecordingCallback()
+        session_list = run_session_runner(
+            1, callback, session_checkpoint_dir, sample_order=[1]
+        )
+        # The session continues from the second round. For the callbacks, the replay is the same as the reset.
+        assert callback.get_sample_event_list(1) == (
+            ["on_session_create", "on_task_reset"]
+            + ["on_agent_inference", "on_task_interact"] * (ROUND_COUNT - 1)
+            + ["on_task_complete", "on_state_save"]
+        )
+        session = session_list[0]
+        assert session.sample_status == SampleStatus.COMPLETED
+        checkpoint_length = checkpoint_session.chat_history.get_value_length()
+        assert [
+            session.chat_history.get_item(item_index)
+            for item_index in range(checkpoint_length)
+        ] == [
+            checkpoint_session.chat_history.get_item(item_index)
+            for item_index in range(checkpoint_length)
+        ]
+        assert os.listdir(session_checkpoint_dir) == []
+
+    def test_replay_failure(self):
+        task = create_task()
+        session = Session(task_name=TaskName.DB_BENCH, sample_index=1)
+        task.reset(session)
+        for _ in range(ROUND_COUNT - 1):
+            session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+            task.interact(session)
+        assert session.sample_status == SampleStatus.RUNNING
+        # The sample of the replaying task is completed one round earlier, so the recorded round cannot be reached.
+        short_task = SyntheticTask(
+            task_name=TaskName.DB_BENCH,
+            chat_history_item_factory=task.chat_history_item_factory,
+            max_round=ROUND_COUNT,
+            sample_count=SAMPLE_COUNT,
+            round_count=ROUND_COUNT - 1,
+            observation_size=16,
+        )
+        short_task.replay(session)
+        assert session.sample_status == SampleStatus.TASK_UNKNOWN_ERROR
+        assert session.finish_reason is not None
+        assert session.finish_reason.startswith("Replay failed")
@@ -0,0 +1,171 @@
+import json
+import os
+import tempfile
+
+from benchmarks.synthetic_task import SyntheticTask
+from src.callbacks.instance.consecutive_abnormal_agent_inference_process_handling_callback import (
+    ConsecutiveAbnormalAgentInferenceProcessHandlingCallback,
+)
+from src.factories.chat_history_item import ChatHistoryItemFactory
+from src.run_experiment import ConfigUtility
+from src.typings import (
+    AssignmentConfig,
+    EnvironmentConfig,
+    GeneralInstanceFactory,
+    SampleStatus,
+    SessionEvaluationOutcome,
+    SessionEvaluationRecord,
+    SessionMetricAggregator,
+    SessionMetricCalculationPartial,
+    TaskName,
+)
+
+ROUND_COUNT = 2
+SAMPLE_COUNT = 8
+SHARD_COUNT = 3
+
+
+def create_task() -> SyntheticTask:
+    chat_history_item_dict_path = os.path.join(
+        tempfile.mkdtemp(), "chat_history_item.json"
+    )
+    with open(chat_history_item_dict_path, "w") as f:
+        json.dump(
+            {
+                "value": {
+                    "0": {"role": "user", "content": "You are in a synthetic task."},
+                    "1": {"role": "agent", "content": "OK."},
+                }
+            },
+            f,
+        )
+    return SyntheticTask(
+        task_name=TaskName.DB_BENCH,
+        chat_history_item_factory=ChatHistoryItemFactory(chat_history_item_dict_path),
+        max_round=ROUND_COUNT,
+        sample_count=SAMPLE_COUNT,
+        round_count=ROUND_COUNT,
+        observation_size=16,
+    )
+
+
+def create_config_utility(
+    shard_index: int | None, task_client_flag: bool = False
+) -> ConfigUtility:
+    return ConfigUtility(
+        AssignmentConfig.model_construct(
+            sample_order="default",
+            concurrent_session_count=1,
+            shard_count=SHARD_COUNT,
+            shard_index=shard_index,
+        ),
+        EnvironmentConfig.model_construct(
+            task_client=(
+                GeneralInstanceFactory.model_construct(
+                    module="src.tasks.TaskClient", parameters={}
+                )
+                if task_client_flag
+                else None
+            )
+        ),
+        None,  # type: ignore[arg-type]
+    )
+
+
+def create_session_partial(sample_index: int) -> SessionMetricCalculationPartial:
+    return SessionMetricCalculationPartial(
+        sample_index=sample_index,
+        sample_status=SampleStatus.COMPLETED,
+        evaluation_record=SessionEvaluationRecord(
+            outcome=SessionEvaluationOutcome.from_bool(sample_index % 3 == 0)
+        ),
+    )
+
+
+class TestClass:
+    def test_sample_order_split(self):
+        shard_sample_order_list = []
+        for shard_index in range(SHARD_COUNT):
+            config_utility = create_config_utility(shard_index)
+            config_utility.postprocess(create_task(), None)  # type: ignore[arg-type]
+            shard_sample_order_list.append(
+                config_utility.assignment_config.sample_order
+            )
+        # The samples are assigned to the shards in a round-robin manner.
+        assert shard_sample_order_list == [[0, 3, 6], [1, 4, 7], [2, 5]]
+
+    def test_task_client_rejection(self):
+        create_config_utility(None).validate_sharding()
+        try:
+            create_config_utility(None, task_client_flag=True).validate_sharding()
+        except AssertionError:
+            pass
+        else:
+            raise AssertionError("The task client should be rejected.")
+
+    def test_metric_merge(self):
+        task = create_task()
+        # Each shard synchronizes the counters of its own sessions.
+        merged_aggregator = SessionMetricAggregator()
+        shard_dataset_counter_dict_list = []
+        for shard_index in range(SHARD_COUNT):
+            shard_aggregator = SessionMetricAggregator(
+                create_session_partial(sample_index)
+                for sample_index in range(shard_index, SAMPLE_COUNT, SHARD_COUNT)
+            )
+            task.calculate_metric(shard_aggregator)
+            shard_dataset_counter_dict_list.append(
+                # The counters are saved to a JSON file by the shard.
+                json.loads(json.dumps(shard_aggregator.get_dataset_counter_dict()))
+            )
+            for session_partial in shard_aggregator:
+                merged_aggregator.append(session_partial)
+        for shard_dataset_counter_dict in shard_dataset_counter_dict_list:
+            merged_aggregator.merge_dataset_counter_dict(shard_dataset_counter_dict)
+        assert merged_aggregator.dataset_synced_count == SAMPLE_COUNT
+        # The metric calculated without the dataset is the same as the one calculated by the full task.
+        metric = SyntheticTask.create_metric_calculator().calculate_metric(
+            merged_aggregator
+        )
+        expected_metric = create_task().calculate_metric(
+            [
+                create_session_partial(sample_index)
+                for sample_index in range(SAMPLE_COUNT)
+            ]
+        )
+        assert metric == expected_metric
+
+    def test_aborted_sample_index_list_merge(self):
+        root_dir = tempfile.mkdtemp()
+        shard_state_dir_list = []
+        for shard_index, aborted_sample_index_list in enumerate(
+            [[0, 3, 6], [1], [2, 5]]
+        ):
+            shard_state_dir = os.path.join(root_dir, f"shard_{shard_index}")
+            os.makedirs(shard_state_dir)
+            json.dump(
+                aborted_sample_index_list,
+                open(
+                    os.path.join(shard_state_dir, "aborted_sample_index_list.json"),
+                    "w",
+                ),
+            )
+            json.dump(
+                {"consecutive_abnormality_count": shard_index},
+                open(
+                    os.path.join(shard_state_dir, "consecutive_abnormality_count.json"),
+                    "w",
+                ),
+            )
+            shard_state_dir_list.append(shard_state_dir)
+        state_dir = os.path.join(root_dir, "merged")
+        ConsecutiveAbnormalAgentInferenceProcessHandlingCallback.merge_state(
+            shard_state_dir_list, state_dir
+        )
+        # The lists are interleaved in the same way as the session logs of the shards.
+        assert json.load(
+            open(os.path.join(state_dir, "aborted_sample_index_list.json"))
+        ) == [0, 1, 2, 3, 5, 6]
+        assert json.load(
+            open(os.path.join(state_dir, "consecutive_abnormality_count.json"))
+        ) == {"consecutive_abnormality_count": SHARD_COUNT - 1}
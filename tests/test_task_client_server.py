@@ -0,0 +1,310 @@
+import json
+import os
+import socket
+import tempfile
+import uuid
+from multiprocessing import Process
+from typing import Optional, Type, TypeVar
+
+import requests
+from pydantic import BaseModel
+
+from benchmarks.synthetic_task import SyntheticTask
+from src.factories.chat_history_item import ChatHistoryItemFactory
+from src.tasks.client import TaskClient
+from src.tasks.server import TaskServer
+from src.tasks.task import TaskInterface
+from src.typings import (
+    ChatHistoryItem,
+    HttpClientException,
+    HttpUnknownException,
+    Role,
+    SampleStatus,
+    Session,
+    SessionDelta,
+    SessionMetricAggregator,
+    SessionMetricCalculationPartial,
+    TaskName,
+    TaskRequest,
+)
+from src.utils import ReadinessProbe
+
+ROUND_COUNT = 3
+T = TypeVar("T", bound=BaseModel)
+
+
+def create_task() -> SyntheticTask:
+    chat_history_item_dict_path = os.path.join(
+        tempfile.mkdtemp(), "chat_history_item.json"
+    )
+    with open(chat_history_item_dict_path, "w") as f:
+        json.dump(
+            {
+                "value": {
+                    "0": {"role": "user", "content": "You are in a synthetic task."},
+                    "1": {"role": "agent", "content": "OK."},
+                }
+            },
+            f,
+        )
+    return SyntheticTask(
+        task_name=TaskName.DB_BENCH,
+        chat_history_item_factory=ChatHistoryItemFactory(chat_history_item_dict_path),
+        max_round=ROUND_COUNT,
+        sample_count=8,
+        round_count=ROUND_COUNT,
+        observation_size=16,
+    )
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("localhost", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+def start_task_server(
+    task_count: int, task_acquisition_timeout: float = 60
+) -> tuple[Process, str]:
+    port = get_free_port()
+    process = Process(
+        target=TaskServer.start_server,
+        args=(
+            [create_task() for _ in range(task_count)],
+            port,
+            "/api",
+            task_acquisition_timeout,
+        ),
+        # The server is terminated by test_finish(), or with pytest if a test fails under -x.
+        daemon=True,
+    )
+    process.start()
+    server_address = f"http://localhost:{port}/api"
+    ReadinessProbe.wait_until_ready(server_address, 30, process.is_alive)
+    return process, server_address
+
+
+class RecordingTaskClient(TaskClient):
+    def __init__(
+        self,
+        server_address: str,
+        request_timeout: int,
+        session_delta_flag: bool = True,
+    ):
+        super().__init__(server_address, request_timeout, session_delta_flag)
+        self.__dict__["api_list"] = []
+
+    def _call_server(  # type: ignore[override]
+        self, api: str, data: Optional[BaseModel], response_cls: Optional[Type[T]]
+    ) -> Optional[T]:
+        # Client.__init__() pings the server before the list is created.
+        if "api_list" in self.__dict__:
+            self.__dict__["api_list"].append(api)
+        return super()._call_server(api, data, response_cls)  # type: ignore[call-overload,no-any-return]
+
+
+def run_session(task_client: TaskInterface, sample_index: int) -> Session:
+    session = Session(task_name=TaskName.DB_BENCH, sample_index=sample_index)
+    task_client.reset(session)
+    while session.sample_status == SampleStatus.RUNNING:
+        session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+        task_client.interact(session)
+    task_client.complete(session)
+    return session
+
+
+server_process, server_address = start_task_server(2)
+
+
+class TestClass:
+    def test_calculate_metric(self):
+        task_client = TaskClient(server_address, 10)
+        aggregator = SessionMetricAggregator()
+        for sample_index in range(4):
+            session = run_session(task_client, sample_index)
+            assert session.sample_status == SampleStatus.COMPLETED
+            aggregator.append(
+                SessionMetricCalculationPartial(
+                    sample_index=session.sample_index,
+                    sample_status=session.sample_status,
+                    evaluation_record=session.evaluation_record,
+                )
+            )
+        # The aggregator is sent as a list, the metric is the same as the one calculated locally.
+        assert task_client.calculate_metric(
+            aggregator
+        ) == create_task().calculate_metric(list(aggregator))
+
+    def test_session_delta(self):
+        session = Session(task_name=TaskName.DB_BENCH, sample_index=0)
+        session.chat_history.inject({"role": Role.USER, "content": "Question."})
+        session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+        receiver_session = session.model_copy(deep=True)
+        base_item_tuple = tuple(session.chat_history.get_value_view())
+        session.chat_history.inject({"role": Role.USER, "content": "Observation."})
+        session.sample_status = SampleStatus.COMPLETED
+        session_delta = SessionDelta.create("0", session, base_item_tuple)
+        # Only the new item is sent.
+        assert session_delta.chat_history_start_index == 2
+        assert len(session_delta.chat_history_item_list) == 1
+        assert session_delta.apply(receiver_session)
+        assert receiver_session.model_dump() == session.model_dump()
+
+    def test_session_delta_checksum_mismatch(self):
+        session = Session(task_name=TaskName.DB_BENCH, sample_index=0)
+        session.chat_history.inject({"role": Role.USER, "content": "Question."})
+        receiver_session = session.model_copy(deep=True)
+        base_item_tuple = tuple(session.chat_history.get_value_view())
+        # The item known by the receiver is modified by the sender.
+        session.chat_history.set(
+            0, ChatHistoryItem(role=Role.USER, content="Modified question.")
+        )
+        session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+        session_delta = SessionDelta.create("0", session, base_item_tuple)
+        session_delta.chat_history_start_index = 1
+        session_delta.chat_history_item_list = session_delta.chat_history_item_list[1:]
+        original_receiver_session_dict = receiver_session.model_dump()
+        assert not session_delta.apply(receiver_session)
+        assert receiver_session.model_dump() == original_receiver_session_dict
+        # The full session can always be applied.
+        assert SessionDelta.create("0", session, ()).apply(receiver_session)
+        assert receiver_session.model_dump() == session.model_dump()
+
+    def test_session_delta_fallback(self):
+        task_client = RecordingTaskClient(server_address, 10)
+        session = Session(task_name=TaskName.DB_BENCH, sample_index=0)
+        task_client.reset(session)
+        # The client believes that the server holds a modified item, so the checksum of the delta does not match on
+        # the server, and the client sends the full session.
+        last_item = session.chat_history.get_item(-1)
+        modified_item = ChatHistoryItem(
+            role=last_item.role, content=f"{last_item.content} Modified."
+        )
+        session.chat_history.set(-1, modified_item)
+        task_client.__dict__["_synced_chat_history_item_tuple"] = tuple(
+            session.chat_history.get_value_view()
+        )
+        session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+        task_client.__dict__["api_list"].clear()
+        task_client.interact(session)
+        assert task_client.__dict__["api_list"] == [
+            "/interact_delta",
+            "/interact_delta",
+        ]
+        assert modified_item in session.chat_history.get_value_view()
+        while session.sample_status == SampleStatus.RUNNING:
+            session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+            task_client.interact(session)
+        task_client.complete(session)
+        assert session.sample_status == SampleStatus.COMPLETED
+
+    def test_unknown_session(self):
+        task_client = RecordingTaskClient(server_address, 10)
+        session = Session(task_name=TaskName.DB_BENCH, sample_index=0)
+        task_client.reset(session)
+        session_id = task_client.__dict__["_session_id"]
+        session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+        # The server does not hold the session (e.g., it is restarted). It returns no delta instead of an error, so the
+        # client falls back to the full session, and then gives up without retrying.
+        task_client.__dict__["_session_id"] = uuid.uuid4().hex
+        for api, func in [
+            ("/interact_delta", task_client.interact),
+            ("/complete_delta", task_client.complete),
+        ]:
+            task_client.__dict__["api_list"].clear()
+            try:
+                func(session)
+            except HttpUnknownException:
+                pass
+            else:
+                raise AssertionError("The unknown session should not be accepted.")
+            assert task_client.__dict__["api_list"] == [api, api]
+        # Return the task of the session to the pool.
+        session.sample_status = SampleStatus.AGENT_UNKNOWN_ERROR
+        task_client.__dict__["_session_id"] = session_id
+        task_client.__dict__["_synced_chat_history_item_tuple"] = ()
+        task_client.complete(session)
+
+    def test_unknown_session_without_delta(self):
+        task_client = RecordingTaskClient(server_address, 10, session_delta_flag=False)
+        session = Session(task_name=TaskName.DB_BENCH, sample_index=0)
+        task_client.reset(session)
+        session_id = task_client.__dict__["_session_id"]
+        session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+        # The server rejects the unknown session with 409, which is not retried.
+        task_client.__dict__["_session_id"] = uuid.uuid4().hex
+        task_client.__dict__["api_list"].clear()
+        try:
+            task_client.interact(session)
+        except HttpClientException:
+            pass
+        else:
+            raise AssertionError("The unknown session should not be accepted.")
+        assert task_client.__dict__["api_list"] == ["/interact"]
+        task_client.__dict__["_session_id"] = session_id
+        task_client.interact(session)
+        while session.sample_status == SampleStatus.RUNNING:
+            session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+            task_client.interact(session)
+        task_client.complete(session)
+        assert session.sample_status == SampleStatus.COMPLETED
+
+    def test_task_acquisition_timeout(self):
+        process, address = start_task_server(1, task_acquisition_timeout=0.5)
+        try:
+            task_client = TaskClient(address, 10)
+            # The session holds the only task, e.g., its client dies before complete().
+            task_client.reset(Session(task_name=TaskName.DB_BENCH, sample_index=0))
+            response = requests.post(
+                f"{address}/reset",
+                json=TaskRequest.Reset(
+                    session=Session(task_name=TaskName.DB_BENCH, sample_index=1),
+                    session_id=uuid.uuid4().hex,
+                ).model_dump(mode="json"),
+                timeout=10,
+            )
+            assert response.status_code == 503
+            # The sessions that are not completed are dropped by release(), so the task can be used again.
+            task_client.release()
+            session = run_session(task_client, 1)
+            assert session.sample_status == SampleStatus.COMPLETED
+        finally:
+            process.terminate()
+            process.join()
+
+    def test_concurrent_sessions(self):
+        def get_running_session_count() -> float:
+            response = requests.get(f"{server_address}/metrics", timeout=10)
+            for line in response.text.splitlines():
+                if line.startswith("task_server_running_session_count "):
+                    return float(line.split()[1])
+            raise AssertionError("The gauge is not exported.")
+
+        # Each session is bound to its own task of the pool, so the sessions can be interleaved.
+        task_client_list = [TaskClient(server_address, 10) for _ in range(2)]
+        session_list = [
+            Session(task_name=TaskName.DB_BENCH, sample_index=sample_index)
+            for sample_index in [1, 2]
+        ]
+        for task_client, session in zip(task_client_list, session_list):
+            task_client.reset(session)
+        assert get_running_session_count() == 2
+        while any(
+            session.sample_status == SampleStatus.RUNNING for session in session_list
+        ):
+            for task_client, session in zip(task_client_list, session_list):
+                session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+                task_client.interact(session)
+        for task_client, session in zip(task_client_list, session_list):
+            task_client.complete(session)
+        assert get_running_session_count() == 0
+        # The sessions are the same as the ones run by a single local task.
+        task = create_task()
+        for session in session_list:
+            expected_session = run_session(task, session.sample_index)
+            assert session.model_dump() == expected_session.model_dump()
+
+    def test_finish(self):
+        server_process.terminate()
+        server_process.join()
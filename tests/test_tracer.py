@@ -0,0 +1,134 @@
+import json
+import os
+import tempfile
+import threading
+
+from benchmarks.synthetic_task import SyntheticTask
+from src.factories.chat_history_item import ChatHistoryItemFactory
+from src.typings import Role, SampleStatus, Session, TaskName
+from src.utils import Tracer
+
+ROUND_COUNT = 2
+
+
+def create_task() -> SyntheticTask:
+    chat_history_item_dict_path = os.path.join(
+        tempfile.mkdtemp(), "chat_history_item.json"
+    )
+    with open(chat_history_item_dict_path, "w") as f:
+        json.dump(
+            {
+                "value": {
+                    "0": {"role": "user", "content": "You are in a synthetic task."},
+                    "1": {"role": "agent", "content": "OK."},
+                }
+            },
+            f,
+        )
+    return SyntheticTask(
+        task_name=TaskName.DB_BENCH,
+        chat_history_item_factory=ChatHistoryItemFactory(chat_history_item_dict_path),
+        max_round=ROUND_COUNT,
+        sample_count=4,
+        round_count=ROUND_COUNT,
+        observation_size=16,
+    )
+
+
+def reset_tracer(enabled_flag: bool) -> None:
+    # The tracer is a process-wide singleton, do not leak its state to the other tests.
+    Tracer._enabled_flag = enabled_flag
+    Tracer._event_list = []
+    Tracer._thread_name_dict = {}
+
+
+class TestClass:
+    def test_disabled(self):
+        reset_tracer(False)
+        with Tracer.span("outer", "test", 0) as span_arg_dict:
+            span_arg_dict["round"] = 1
+        assert Tracer._event_list == []
+
+    def test_sample_index_inheritance(self):
+        reset_tracer(True)
+        try:
+            with Tracer.span("outer", "test", 3) as span_arg_dict:
+                span_arg_dict["round"] = 1
+                with Tracer.span("inner", "test"):
+                    pass
+            with Tracer.span("unrelated", "test"):
+                pass
+            event_dict = {event["name"]: event for event in Tracer._event_list}
+            assert event_dict["outer"]["args"] == {"round": 1, "sample_index": 3}
+            assert event_dict["inner"]["args"] == {"sample_index": 3}
+            # The sample index is restored when the enclosing span exits.
+            assert event_dict["unrelated"]["args"] == {}
+            assert event_dict["outer"]["ts"] <= event_dict["inner"]["ts"]
+            assert event_dict["outer"]["dur"] >= event_dict["inner"]["dur"]
+        finally:
+            reset_tracer(False)
+
+    def test_task_span(self):
+        reset_tracer(True)
+        try:
+            task = create_task()
+            session = Session(task_name=TaskName.DB_BENCH, sample_index=1)
+            task.reset(session)
+            while session.sample_status == SampleStatus.RUNNING:
+                session.chat_history.inject({"role": Role.AGENT, "content": "Act."})
+                task.interact(session)
+            task.complete(session)
+            assert [
+                (event["name"], event["args"].get("round"))
+                for event in Tracer._event_list
+            ] == [
+                ("task.reset", None),
+                ("task.interact", 1),
+                ("task.interact", 2),
+                ("task.complete", None),
+            ]
+            for event in Tracer._event_list:
+                assert event["cat"] == "task"
+                assert event["args"]["sample_index"] == 1
+        finally:
+            reset_tracer(False)
+
+    def test_save_and_merge(self):
+        reset_tracer(True)
+        try:
+            output_dir = tempfile.mkdtemp()
+
+            def work() -> None:
+                with Tracer.span("worker", "test", 0):
+                    pass
+
+            thread = threading.Thread(target=work, name="tracer_test_worker")
+            with Tracer.span("main", "test", 0):
+                pass
+            thread.start()
+            thread.join()
+            trace_path_list = [
+                os.path.join(output_dir, f"trace_{index}.json") for index in range(2)
+            ]
+            for trace_path in trace_path_list:
+                Tracer.save(trace_path)
+            trace = json.load(open(trace_path_list[0]))
+            thread_name_set = {
+                event["args"]["name"]
+                for event in trace["traceEvents"]
+                if event["ph"] == "M"
+            }
+            # The threads are named by the metadata events.
+            assert thread_name_set == {
+                threading.current_thread().name,
+                "tracer_test_worker",
+            }
+            merged_trace_path = os.path.join(output_dir, "trace.json")
+            Tracer.merge(
+                trace_path_list + [os.path.join(output_dir, "missing.json")],
+                merged_trace_path,
+            )
+            merged_trace = json.load(open(merged_trace_path))
+            assert merged_trace["traceEvents"] == trace["traceEvents"] * 2
+        finally:
+            reset_tracer(False)